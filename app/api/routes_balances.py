@@ -3,20 +3,24 @@ from app.services.checks_excel_loader import load_checks_excel  # ایمپورت
 from app.services.customer_balances import CHECKS_DB_PATH, normalize_name
 import os
 from fastapi import APIRouter, Request, Form
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-import pandas as pd
 
 # ایمپورت سرویس‌ها
 from app.services.customer_balances import (
     load_balances_from_excel,
-    save_balances_to_db,
     load_balances_from_db,
     update_balances,
+    update_balance_entry,
+    delete_balance_entries,
+    clear_all_balances,
+    balances_export_frame,
     normalize_name as normalize_balance_name,
     save_raw_checks_file  # تابع جدید ایمپورت شد
 )
 from app.services.helpers import canonicalize_code
+from app.services.result_export import EXPORT_FORMATS, iter_export
+from app.services.workers import iterate_blocking, run_blocking
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
@@ -61,6 +65,10 @@ async def customer_balances_page(request: Request):
 @router.post("/upload-balances", response_class=HTMLResponse)
 async def upload_balances(request: Request):
     form = await request.form()
+    return await run_blocking("excel", _upload_balances, request, form)
+
+
+def _upload_balances(request: Request, form):
 
     # دریافت فایل مانده حساب
     balances_file = form.get("balances_file")
@@ -113,30 +121,13 @@ async def edit_balance(request: Request):
     new_name = form.get("name")
     new_balance_str = form.get("balance")
 
-    current_data = load_balances_from_db()
-
-    updated_data = []
-    found = False
-    for item in current_data:
-        if item.get("CustomerName") == old_name:
-            found = True
-            norm_name = normalize_balance_name(new_name)
-            try:
-                bal = float(new_balance_str)
-            except ValueError:
-                bal = 0
-
-            updated_data.append({
-                "CustomerCode": str(new_code).strip(),
-                "CustomerName": norm_name,
-                "OriginalName": str(new_name).strip(),
-                "Balance": bal
-            })
-        else:
-            updated_data.append(item)
+    try:
+        bal = float(new_balance_str)
+    except ValueError:
+        bal = 0
 
-    if found:
-        save_balances_to_db(updated_data)
+    # یک UPDATE روی همان ردیف (بدون بازنویسی کل لیست)
+    update_balance_entry(old_name, new_code, new_name, bal)
 
     return JSONResponse(content={"status": "ok"})
 
@@ -174,29 +165,7 @@ async def delete_balance(request: Request):
     if not code and not name:
         return JSONResponse(content={"status": "error", "message": "کد یا نام ارسال نشده است"}, status_code=400)
 
-    current_data = load_balances_from_db()
-    new_data = []
-    found = False
-
-    for item in current_data:
-        item_code = str(item.get("CustomerCode", ""))
-        item_name = item.get("CustomerName", "")
-
-        should_delete = False
-        if code:
-            if item_code == str(code):
-                should_delete = True
-        elif name:
-            if item_name == name:
-                should_delete = True
-
-        if should_delete:
-            found = True
-        else:
-            new_data.append(item)
-
-    if found:
-        save_balances_to_db(new_data)
+    if delete_balance_entries(code=code, name=name):
         return JSONResponse(content={"status": "ok"})
     else:
         return JSONResponse(content={"status": "error", "message": "موردی یافت نشد"}, status_code=404)
@@ -207,16 +176,29 @@ async def clear_balances():
     """
     مسیر مربوط به دکمه «حذف تمام مانده‌ها».
     """
-    empty_df = pd.DataFrame(
-        columns=["CustomerCode", "CustomerName", "OriginalName", "Balance"])
-    save_balances_to_db(empty_df)
+    clear_all_balances()
     return JSONResponse(content={"status": "ok"})
 
+
+@router.get("/export-balances")
+async def export_balances():
+    """دانلود مانده‌ها به صورت فایل اکسل (همان قالب فایل قدیمی)."""
+    df = await run_blocking("export", balances_export_frame)
+    return StreamingResponse(
+        iterate_blocking("export", iter_export(df, "xlsx")),
+        media_type=EXPORT_FORMATS["xlsx"],
+        headers={"Content-Disposition": 'attachment; filename="customer_balances.xlsx"'},
+    )
+
 # در ابتدای فایل این‌ها را اگر ندارید اضافه کنید:
 
 
 @router.get("/debug-checks", response_class=HTMLResponse)
 async def debug_checks_page():
+    return await run_blocking("excel", _debug_checks_page)
+
+
+def _debug_checks_page():
     if not os.path.exists(CHECKS_DB_PATH):
         return "<h1>هیچ فایل چکی در سیستم ذخیره نشده است. ابتدا فایل آپلود کنید.</h1>"
 
@@ -1,7 +1,7 @@
 # app/api/routes_commission.py
-from fastapi import APIRouter, Request, UploadFile, File, Form
+from fastapi import APIRouter, Request, UploadFile, File, Form, Query
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response, StreamingResponse
 import pandas as pd
 from fastapi.templating import Jinja2Templates
 import json
@@ -10,6 +10,7 @@ import json
 from app.services.sales_excel_loader import load_sales_excel
 from app.services.payments_excel_loader import load_payments_excel
 from app.services.checks_excel_loader import load_checks_excel
+from app.services.excel_reader import read_table, read_timings
 from app.services.commission_service import (
     load_default_group_config,
     load_product_group_map,
@@ -20,15 +21,24 @@ from app.services.commission_service import (
     build_name_code_mapping,
     build_name_code_map_from_balances,
     load_name_code_map_from_excel,
-    extract_customer_for_payment
+    extract_customer_for_payment,
+    build_reference_data,
+    commission_cache_stats
 )
 from app.services.helpers import (
     canonicalize_code,
-    to_jalali_str,
     format_number
 )
-from app.services.customer_balances import load_balances_from_db
-from app.state import LAST_UPLOAD, SESSION_SETTINGS
+from app.services.customer_stats import CustomerStatsStore
+from app.services.invoice_table import (
+    DEFAULT_PAGE_SIZE,
+    invoice_columns,
+    query_invoices,
+    salesperson_options,
+)
+from app.services.result_export import EXPORT_FORMATS, iter_export
+from app.services.workers import iterate_blocking, run_blocking, worker_stats
+from app.state import JOBS, SESSIONS, SESSION_SETTINGS, get_upload
 
 # تعریف روتر
 router = APIRouter()
@@ -36,21 +46,16 @@ router = APIRouter()
 # تنظیمات تمپلیت (می‌توانید این را از main.py پاس دهید، اما فعلاً اینجا تعریف می‌کنیم)
 templates = Jinja2Templates(directory="templates")
 
-# متغیر سراسری برای نگهداری وضعیت آپلود
-LAST_UPLOAD = {
-    "sales": None,
-    "payments": None,
-    "checks": None,
-    "group_col": None,
-    "group_config": None,
-    "sales_result": None,
-    "payments_result": None,
-    "history": None,
-}
-# بعد از تعریف LAST_UPLOAD این را اضافه کنید:
-SESSION_SETTINGS = {
-    "reactivation_days": 95  # مقدار پیش‌فرض
+# مراحل کار پس‌زمینه محاسبه پورسانت (برای گزارش پیشرفت)
+COMMISSION_JOB_STAGES = ["prepare_sales", "prepare_payments", "settlement", "rendering"]
+
+# جدول‌های نتیجه قابل دانلود: {نام: (کلید در نشست، نام فایل)}
+RESULT_TABLES = {
+    "invoices": ("sales_result", "commission_invoices"),
+    "salespersons": ("salesperson_result", "commission_salespersons"),
+    "payments": ("payments_result", "commission_payments"),
 }
+
 # ------------------ صفحه اصلی ------------------ #
 
 
@@ -76,8 +81,16 @@ async def upload_all(
     checks_file: UploadFile | None = File(None),
     history_file: UploadFile | None = File(None)
 ):
-    # 1. دریافت تنظیمات روزهای فعال‌سازی
     form = await request.form()
+    # خواندن فایل‌ها و ذخیره در نشست بیرون از event loop
+    return await run_blocking(
+        "excel", _upload_all, request, form,
+        sales_file, payments_file, checks_file, history_file)
+
+
+def _upload_all(request: Request, form, sales_file: UploadFile, payments_file: UploadFile,
+                checks_file: UploadFile | None, history_file: UploadFile | None):
+    # 1. دریافت تنظیمات روزهای فعال‌سازی
     reactivation_days_str = form.get("reactivation_days")
     if reactivation_days_str:
         try:
@@ -100,7 +113,7 @@ async def upload_all(
     history_found = False
     if history_file is not None and history_file.filename:
         try:
-            df_history = pd.read_excel(history_file.file)
+            df_history = read_table(history_file.file, "history")
             # نرمال‌سازی نام ستون‌ها (حذف ی و ک عربی)
             df_history.columns = df_history.columns.str.replace(
                 'ي', 'ی', regex=True)
@@ -135,12 +148,13 @@ async def upload_all(
 
     groups = sorted(df_sales[group_col].dropna().unique())
 
-    # 5. ذخیره در متغیر سراسری (State)
-    LAST_UPLOAD["sales"] = df_sales
-    LAST_UPLOAD["payments"] = df_pay
-    LAST_UPLOAD["checks"] = df_chk
-    LAST_UPLOAD["history"] = df_history
-    LAST_UPLOAD["group_col"] = group_col
+    # 5. ذخیره در وضعیت نشست همین کاربر
+    upload = get_upload(request)
+    upload["sales"] = df_sales
+    upload["payments"] = df_pay
+    upload["checks"] = df_chk
+    upload["history"] = df_history
+    upload["group_col"] = group_col
 
     # 6. خواندن پیکربندی‌ها برای نگاشت کالاها
     default_group_cfg = load_default_group_config()
@@ -263,22 +277,34 @@ async def upload_all(
 async def calculate_commission(request: Request):
     """
     محاسبه پورسانت بر اساس تنظیمات گروه‌های وارد شده.
+    محاسبه به صورت کار پس‌زمینه ثبت می‌شود و فوراً شناسه کار برمی‌گردد:
+    درخواست JSON شناسه و آدرس‌های وضعیت/نتیجه را می‌گیرد و مرورگر صفحه
+    پیشرفت را که وضعیت را poll می‌کند و بعد از اتمام به نتیجه می‌رود.
     """
+    form = await request.form()
+    job = JOBS.submit(
+        "commission", _calculate_commission, request, form,
+        session_id=get_upload(request).session_id, stages=COMMISSION_JOB_STAGES)
+    if "application/json" in request.headers.get("accept", ""):
+        return JSONResponse(_job_payload(job), status_code=202)
+    return _job_progress_page(request, job)
+
+
+def _calculate_commission(request: Request, form, job=None):
+    """
+    بدنه همگام محاسبه (در نخ کارگر اجرا می‌شود؛ مراحل با job گزارش می‌شوند).
+    جدول‌های نتیجه در نشست ذخیره می‌شوند (با همان سقف حافظه و کش Parquet)
+    و خروجی فقط ارجاع به آن‌هاست: {"tables": {نام جدول: کلید در نشست}}،
+    یا {"error_template": ...} اگر محاسبه‌ای انجام نشد.
+    """
+    progress = job.set_stage if job is not None else (lambda stage: None)
 
     # =========== بررسی آپلود فایل‌ها ===========
-    if LAST_UPLOAD["sales"] is None or LAST_UPLOAD["payments"] is None:
-        return templates.TemplateResponse(
-            "error_no_upload.html",
-            {
-                "request": request,
-                "active_tab": "main",
-                "title": "خطا"
-            }
-        )
+    upload = get_upload(request)
+    if upload["sales"] is None or upload["payments"] is None:
+        return {"error_template": "error_no_upload.html"}
 
     # =========== دریافت داده‌های فرم ===========
-    form = await request.form()
-
     group_names = form.getlist("group_name")
     categories = form.getlist("group_category")
     percents = form.getlist("group_percent")
@@ -287,12 +313,15 @@ async def calculate_commission(request: Request):
     use_chart = form.get("use_chart") == "1"
     apply_balances = form.get("apply_balances") == "1"
 
-    # =========== خواندن مانده‌ها ===========
-    balances_dict = {}
+    # =========== داده‌های مرجع (مانده‌ها، مپ‌ها، لیست‌های سیاه) ===========
+    # یک بار برای کل محاسبه خوانده می‌شود
+    reference = build_reference_data(upload["checks"])
+    if job is not None:
+        job.details["reference_build_seconds"] = round(reference.build_seconds, 4)
+        job.details["reference_balances"] = len(reference.balances_map)
     if apply_balances:
-        balances_dict = load_balances_from_db()
         print(
-            f"DEBUG: Apply Balances is ON. Loaded {len(balances_dict)} customer balances.")
+            f"DEBUG: Apply Balances is ON. Loaded {len(reference.balances)} customer balances.")
 
     # =========== پردازش تنظیمات گروه‌ها ===========
     group_config: dict = {}
@@ -329,21 +358,14 @@ async def calculate_commission(request: Request):
 
     # =========== بررسی خالی نبودن تنظیمات ===========
     if not group_config:
-        return templates.TemplateResponse(
-            "error_no_config.html",
-            {
-                "request": request,
-                "active_tab": "main",
-                "title": "خطا"
-            }
-        )
+        return {"error_template": "error_no_config.html"}
 
     # =========== دریافت دیتافریم‌های اصلی ===========
-    df_sales = LAST_UPLOAD["sales"]
-    df_pay = LAST_UPLOAD["payments"]
-    df_chk = LAST_UPLOAD["checks"]
-    group_col = LAST_UPLOAD["group_col"]
-    LAST_UPLOAD["group_config"] = group_config
+    df_sales = upload["sales"]
+    df_pay = upload["payments"]
+    df_chk = upload["checks"]
+    group_col = upload["group_col"]
+    upload["group_config"] = group_config
 
     # =========== خواندن reactivation_days ===========
     reactivation_days_str = form.get("reactivation_days")
@@ -362,11 +384,34 @@ async def calculate_commission(request: Request):
         df_chk,
         group_config,
         group_col,
-        reactivation_days=reactivation_days
+        reactivation_days=reactivation_days,
+        settlement_workers=SESSION_SETTINGS.get("settlement_workers", 1),
+        reference=reference,
+        progress=progress
     )
 
-    LAST_UPLOAD["sales_result"] = sales_result
-    LAST_UPLOAD["payments_result"] = payments_result
+    upload["sales_result"] = sales_result
+    upload["payments_result"] = payments_result
+    upload["salesperson_result"] = salesperson_result
+    upload["result_use_chart"] = use_chart
+    # نتیجه فعلی نشست متعلق به این کار است (کار قبلی دیگر نتیجه‌ای ندارد)
+    upload["result_job_id"] = job.id if job is not None else None
+    progress("rendering")
+
+    return {"tables": {name: keys[0] for name, keys in RESULT_TABLES.items()}}
+
+
+def _render_commission_results(request: Request, job=None):
+    """
+    صفحه نتیجه پورسانت از روی نتیجه ذخیره شده در نشست
+    (جدول‌ها ممکن است از کش دیسکی Parquet خوانده شوند).
+    """
+    upload = get_upload(request)
+    sales_result = upload.get("sales_result")
+    payments_result = upload.get("payments_result")
+    salesperson_result = upload.get("salesperson_result")
+    df_chk = upload.get("checks")
+    group_col = upload.get("group_col")
 
     # =========== داده‌های خلاصه ===========
     sales_rows = len(sales_result)
@@ -386,78 +431,19 @@ async def calculate_commission(request: Request):
         total_commission = float(
             salesperson_result["TotalCommission"].sum() or 0)
 
-    # =========== ساخت جدول فاکتورها ===========
-    invoices_view = sales_result.copy()
-
-    for dt_col in ["InvoiceDate", "DueDate"]:
-        if dt_col in invoices_view.columns:
-            invoices_view[dt_col] = invoices_view[dt_col].map(to_jalali_str)
-
-    if "CommissionPercent" in invoices_view.columns:
-        invoices_view["CommissionPercent"] = (
-            invoices_view["CommissionPercent"] * 100).round(2)
-
-    for col in ["InvoiceID", "CustomerCode", group_col]:
-        if col in invoices_view.columns:
-            invoices_view[col] = invoices_view[col].map(
-                lambda v: canonicalize_code(v) if pd.notna(v) else ""
-            )
-
-    if "CustomerName" in invoices_view.columns and "CustomerCode" in invoices_view.columns:
-        def make_customer_link(row):
-            name = row.get("CustomerName", "")
-            code = row.get("CustomerCode", "")
-            if pd.isna(name) or str(name).strip() == "":
-                return ""
-            if not use_chart:
-                return str(name)
-            return (
-                f'<a href="#" class="customer-link" '
-                f'data-customer-code="{code}" '
-                f'data-customer-name="{name}">{name}</a>'
-            )
-        invoices_view["CustomerName"] = invoices_view.apply(
-            make_customer_link, axis=1)
-
-    if "Priority" in invoices_view.columns:
-        def pri_badge(v):
-            if v == "cash":
-                return '<span class="badge badge-priority-cash">نقدی</span>'
-            elif v == "normal":
-                return '<span class="badge badge-priority-normal">عادی</span>'
-            return ""
-        invoices_view["Priority"] = invoices_view["Priority"].map(pri_badge)
-
-    if "CommissionPercent" in invoices_view.columns:
-        invoices_view["CommissionPercent"] = invoices_view["CommissionPercent"].map(
-            lambda x: f"{x:.2f}٪"
-        )
-
-    for col in ["Amount", "PaidAmount", "Remaining", "CommissionAmount"]:
-        if col in invoices_view.columns:
-            invoices_view[col] = invoices_view[col].round(0).astype("int64")
-
-    cols = []
-    for c in [
-        "InvoiceID", "CustomerCode", "CustomerName", group_col, "Priority",
-        "InvoiceDate", "DueDate", "Amount", "PaidAmount", "Remaining",
-        "CommissionPercent", "CommissionAmount",
-    ]:
-        if c in invoices_view.columns:
-            cols.append(c)
-
-    invoices_table_html = ""
-    if cols:
-        invoices_table_html = invoices_view[cols].to_html(
-            index=False, border=0, escape=False, classes="data-table"
-        )
+    # =========== جدول فاکتورها ===========
+    # خود جدول صفحه به صفحه از /commission-results/invoices خوانده می‌شود
+    invoice_cols = invoice_columns(sales_result, group_col)
+    salespersons = salesperson_options(sales_result)
 
     # =========== ساخت جدول فروشندگان ===========
-    if "TotalCommission" in salesperson_result.columns:
-        salesperson_result["TotalCommission"] = salesperson_result["TotalCommission"].round(
+    # نسخه نشست (و دانلودی) گرد نمی‌شود؛ فقط جدول نمایشی
+    salesperson_view = salesperson_result.copy()
+    if "TotalCommission" in salesperson_view.columns:
+        salesperson_view["TotalCommission"] = salesperson_view["TotalCommission"].round(
             0).astype("int64")
 
-    salesperson_table_html = salesperson_result.to_html(
+    salesperson_table_html = salesperson_view.to_html(
         index=False, border=0, classes="data-table")
 
     # # =========== بخش‌های Debug ===========
@@ -471,7 +457,7 @@ async def calculate_commission(request: Request):
             "request": request,
             "active_tab": "main",
             "title": "نتیجه محاسبه پورسانت",
-            "use_chart": use_chart,
+            "use_chart": bool(upload.get("result_use_chart")),
             "sales_rows": sales_rows,
             "sales_sum": sales_sum,
             "pay_rows": pay_rows,
@@ -479,24 +465,205 @@ async def calculate_commission(request: Request):
             "chk_rows": chk_rows,
             "chk_sum": chk_sum,
             "total_commission": total_commission,
-            "invoices_table_html": invoices_table_html,
+            "invoice_columns": invoice_cols,
+            "salesperson_options": salespersons,
             "salesperson_table_html": salesperson_table_html,
             # "debug_names_html": debug_names_html,
             # "debug_checks_html": debug_checks_html,
+            "job_id": job.id if job is not None else None,
         }
     )
 
+# ------------------ کارهای پس‌زمینه محاسبه ------------------ #
+
+
+def _job_payload(job) -> dict:
+    return {
+        **job.to_dict(),
+        "status_url": f"/jobs/{job.id}",
+        "result_url": f"/jobs/{job.id}/result",
+    }
+
+
+def _job_progress_page(request: Request, job):
+    return templates.TemplateResponse(
+        "job_progress.html",
+        {
+            "request": request,
+            "active_tab": "main",
+            "title": "در حال محاسبه پورسانت",
+            "job": _job_payload(job),
+        }
+    )
+
+
+def _session_job(request: Request, job_id: str):
+    """کار با این شناسه، فقط اگر متعلق به نشست همین کاربر باشد."""
+    return JOBS.get(job_id, session_id=get_upload(request).session_id)
+
+
+def _job_has_result(request: Request, job) -> bool:
+    """
+    کار تمام شده‌ای که نتیجه‌اش هنوز همان نتیجه فعلی نشست است
+    (محاسبه بعدی همین نشست جدول‌های نشست را جایگزین می‌کند).
+    """
+    return (
+        job is not None and job.status == "done"
+        and "tables" in (job.result or {})
+        and get_upload(request).get("result_job_id") == job.id
+    )
+
+
+def _result_frame(request: Request, table: str, job=None):
+    """جدول نتیجه از نشست (با job همان جدولی که آن کار ذخیره کرده است)."""
+    session_key = job.result["tables"][table] if job is not None else RESULT_TABLES[table][0]
+    return get_upload(request).get(session_key)
+
+
+@router.get("/jobs/{job_id}")
+async def job_status(request: Request, job_id: str):
+    """وضعیت و مرحله فعلی یک کار (برای polling)."""
+    job = _session_job(request, job_id)
+    if job is None:
+        return JSONResponse({"error": "کار پیدا نشد."}, status_code=404)
+    return JSONResponse(_job_payload(job))
+
+
+@router.get("/jobs/{job_id}/result", response_class=HTMLResponse)
+async def job_result(request: Request, job_id: str):
+    """صفحه نتیجه کار تمام شده (تا وقتی کار تمام نشده، صفحه پیشرفت)."""
+    job = _session_job(request, job_id)
+    if job is None:
+        return templates.TemplateResponse("error.html", {
+            "request": request,
+            "error_message": "نتیجه این محاسبه پیدا نشد (ممکن است منقضی شده باشد).",
+            "back_link": "/"
+        }, status_code=404)
+    if job.status == "failed":
+        return templates.TemplateResponse("error.html", {
+            "request": request,
+            "error_message": f"خطا در محاسبه پورسانت: {job.error}",
+            "back_link": "/"
+        }, status_code=500)
+    if job.status != "done":
+        return _job_progress_page(request, job)
+    error_template = (job.result or {}).get("error_template")
+    if error_template:
+        return templates.TemplateResponse(
+            error_template,
+            {
+                "request": request,
+                "active_tab": "main",
+                "title": "خطا"
+            }
+        )
+    if not _job_has_result(request, job):
+        return templates.TemplateResponse("error.html", {
+            "request": request,
+            "error_message": "نتیجه این محاسبه با محاسبه جدیدتری جایگزین شده است.",
+            "back_link": "/"
+        }, status_code=404)
+    # نتیجه نشست ممکن است از کش دیسکی (Parquet) خوانده شود
+    return await run_blocking("session", _render_commission_results, request, job)
+
+
+@router.get("/commission-results/export")
+async def export_commission_results(
+    request: Request,
+    table: str = "invoices",
+    fmt: str = Query("xlsx", alias="format"),
+    job_id: str = None,
+):
+    """
+    دانلود جریانی یکی از جدول‌های نتیجه (invoices، salespersons، payments)
+    به صورت csv یا xlsx. با job_id از نتیجه همان کار و بدون آن از آخرین
+    نتیجه نشست؛ فایل تکه تکه ساخته و فرستاده می‌شود.
+    """
+    if table not in RESULT_TABLES:
+        return JSONResponse({"error": f"جدول نامعتبر: {table}"}, status_code=400)
+    if fmt not in EXPORT_FORMATS:
+        return JSONResponse({"error": f"قالب خروجی نامعتبر: {fmt}"}, status_code=400)
+
+    filename = RESULT_TABLES[table][1]
+    job = _session_job(request, job_id) if job_id else None
+    if job_id and not _job_has_result(request, job):
+        return JSONResponse({"error": "نتیجه‌ای برای دانلود وجود ندارد."}, status_code=404)
+
+    # نتیجه نشست ممکن است از کش دیسکی (Parquet) خوانده شود
+    df = await run_blocking("session", _result_frame, request, table, job)
+    if df is None:
+        return JSONResponse({"error": "نتیجه‌ای برای دانلود وجود ندارد."}, status_code=404)
+
+    return StreamingResponse(
+        iterate_blocking("export", iter_export(df, fmt, sheet_name=table)),
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
+
+# ------------------ جدول فاکتورها (صفحه‌بندی سمت سرور) ------------------ #
+
+
+@router.get("/commission-results/invoices")
+async def commission_invoices(
+    request: Request,
+    job_id: str = None,
+    page: int = 1,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    sort: str = None,
+    order: str = "asc",
+    salesperson: str = None,
+    customer: str = None,
+    priority: str = None,
+    date_from: str = None,
+    date_to: str = None,
+    chart: bool = False,
+):
+    """
+    یک صفحه از فاکتورهای نتیجه پورسانت با فیلتر و مرتب‌سازی.
+    با job_id از نتیجه همان کار و بدون آن از آخرین نتیجه نشست خوانده می‌شود.
+    """
+    job = _session_job(request, job_id) if job_id else None
+    if job_id and not _job_has_result(request, job):
+        return JSONResponse({"error": "نتیجه این محاسبه پیدا نشد."}, status_code=404)
+
+    def build():
+        upload = get_upload(request)
+        sales_result = _result_frame(request, "invoices", job)
+        if sales_result is None:
+            return JSONResponse(
+                {"error": "ابتدا باید محاسبه پورسانت انجام شود."},
+                status_code=400,
+            )
+        try:
+            data = query_invoices(
+                sales_result, upload.get("group_col"),
+                page=page, page_size=page_size, sort=sort, order=order,
+                use_chart=chart, salesperson=salesperson, customer=customer,
+                priority=priority, date_from=date_from, date_to=date_to)
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        return JSONResponse(data)
+
+    # نتیجه نشست ممکن است از کش دیسکی (Parquet) خوانده شود
+    return await run_blocking("session", build)
+
 # ------------------ آمار مشتری (نمودار) ------------------ #
 
 
 @router.get("/customer-stats")
-async def customer_stats(customer_code: str):
+async def customer_stats(request: Request, customer_code: str):
     """
     برگرداندن آمار خرید/تسویه/مانده برای یک مشتری مشخص،
     برای استفاده در نمودار.
     """
-    sales_result = LAST_UPLOAD.get("sales_result")
-    payments_result = LAST_UPLOAD.get("payments_result")
+    # نتایج نشست ممکن است از کش دیسکی (Parquet) خوانده شوند
+    return await run_blocking("session", _customer_stats, request, customer_code)
+
+
+def _customer_stats(request: Request, customer_code: str):
+    upload = get_upload(request)
+    sales_result = upload.get("sales_result")
+    payments_result = upload.get("payments_result")
 
     if sales_result is None or payments_result is None:
         return JSONResponse(
@@ -504,62 +671,53 @@ async def customer_stats(customer_code: str):
             status_code=400,
         )
 
-    code_key = canonicalize_code(customer_code)
+    # پاسخ هر مشتری بعد از محاسبه یک بار ساخته و سریال شده است
+    stats = CustomerStatsStore.of(sales_result)
+    return Response(
+        stats.payload(canonicalize_code(customer_code)),
+        media_type="application/json",
+    )
 
-    # فاکتورهای مرتبط با این مشتری
-    if "CustomerKey" in sales_result.columns:
-        sales_rows = sales_result[sales_result["CustomerKey"]
-                                  == code_key].copy()
-    else:
-        sales_rows = pd.DataFrame()
+# ------------------ زمان خواندن فایل‌های اکسل ------------------ #
 
-    # پرداخت‌های مرتبط با این مشتری
-    if "ResolvedCustomerKey" in payments_result.columns:
-        pay_rows = payments_result[payments_result["ResolvedCustomerKey"] == code_key].copy(
-        )
-    else:
-        pay_rows = pd.DataFrame()
-
-    # نقاط نمودار: بر اساس فاکتورها
-    points = []
-    if not sales_rows.empty:
-        sales_rows = sales_rows.sort_values("InvoiceDate")
-        for _, row in sales_rows.iterrows():
-            inv_date = row.get("InvoiceDate")
-            date_label = to_jalali_str(inv_date)
-
-            amount = float(row.get("Amount") or 0)
-            paid = float(row.get("PaidAmount") or 0)
-            remaining = float(row.get("Remaining") or 0)
-
-            points.append(
-                {
-                    "date": date_label,
-                    "amount": amount,
-                    "paid": paid,
-                    "remaining": remaining,
-                    "invoice_id": row.get("InvoiceID"),
-                }
-            )
 
-    total_amount = sum(p["amount"] for p in points)
-    total_paid = sum(p["paid"] for p in points)
-    total_remaining = sum(p["remaining"] for p in points)
+@router.get("/excel-read-timings")
+async def excel_read_timings():
+    """زمان خواندن آخرین فایل‌های اکسل و موتوری که برای هر کدام استفاده شد."""
+    return JSONResponse({"timings": read_timings()})
+
+# ------------------ کش محاسبه افزایشی ------------------ #
+
 
-    # سعی می‌کنیم اسم مشتری را از روی اولین فاکتور پیدا کنیم
-    customer_name = ""
-    if not sales_rows.empty and "CustomerName" in sales_rows.columns:
-        customer_name = str(sales_rows.iloc[0].get("CustomerName") or "")
+@router.get("/commission-cache")
+async def commission_cache():
+    """آمار کش فروش آماده شده و تعداد مشتریان تسویه شده / استفاده مجدد شده."""
+    return JSONResponse(commission_cache_stats())
 
+# ------------------ صف کارهای سنگین ------------------ #
+
+
+@router.get("/worker-stats")
+async def worker_stats_view():
+    """تعداد کارهای سنگین در حال اجرا و منتظر در استخر نخ‌ها."""
+    return JSONResponse(worker_stats())
+
+# ------------------ حافظه نشست‌ها ------------------ #
+
+
+@router.get("/session-memory")
+async def session_memory(request: Request):
+    """
+    حجم دیتافریم‌های نگه داشته شده در حافظه برای نشست فعلی و کل نشست‌ها
+    (فقط همین پروسه؛ نسخه دیسکی فریم‌ها حساب نمی‌شود).
+    """
+    upload = get_upload(request)
+    usage = SESSIONS.memory_by_session()
     return JSONResponse(
         {
-            "customerCode": code_key,
-            "customerName": customer_name,
-            "points": points,
-            "totals": {
-                "amount": total_amount,
-                "paid": total_paid,
-                "remaining": total_remaining,
-            },
+            "session_bytes": usage.get(upload.session_id, 0),
+            "total_bytes": sum(usage.values()),
+            "sessions": len(usage),
+            "budget_bytes": SESSIONS.memory_budget,
         }
     )
@@ -19,15 +19,19 @@ from app.services.commission_service import (
     prepare_payments,
     build_name_code_map_from_balances,
     load_name_code_map_from_excel,
-    extract_customer_for_payment
+    extract_customer_for_payment,
+    invalidate_config_cache
 )
 from app.services.helpers import (
     canonicalize_code,
-    normalize_persian_name
+    canonicalize_code_series,
+    normalize_persian_name,
+    normalize_name_series
 )
 from app.services.payments_excel_loader import load_payments_excel
 from app.services.checks_excel_loader import load_checks_excel
-from app.state import LAST_UPLOAD
+from app.services.workers import run_blocking
+from app.state import get_upload
 
 # تعریف روتر
 router = APIRouter()
@@ -58,9 +62,8 @@ async def blacklist_page(request: Request):
 
             # --- بخش منطق (Logic) ---
             if "CustomerCode" in df.columns:
-                df["CustomerCode"] = df["CustomerCode"].apply(
-                    lambda x: canonicalize_code(x) if pd.notna(x) else ""
-                )
+                df["CustomerCode"] = canonicalize_code_series(
+                    df["CustomerCode"], missing="")
                 df["CustomerCode"] = df["CustomerCode"].fillna(
                     "").astype(str).replace("nan", "")
 
@@ -189,6 +192,7 @@ async def delete_marketer(request: Request):
             if col:
                 df = df[df[col] != name_to_delete]
                 df.to_excel(MARKETERS_PATH, index=False)
+                invalidate_config_cache(MARKETERS_PATH)
         except:
             pass
 
@@ -222,8 +226,8 @@ async def view_product_blacklist(request: Request):
     try:
         df_map = load_product_group_map()
         if not df_map.empty:
-            df_map["ProductCode"] = df_map["ProductCode"].apply(
-                canonicalize_code)
+            df_map["ProductCode"] = canonicalize_code_series(
+                df_map["ProductCode"])
     except Exception:
         df_map = pd.DataFrame(columns=["ProductCode", "ProductName"])
 
@@ -240,8 +244,8 @@ async def view_product_blacklist(request: Request):
         try:
             df_bl = pd.read_excel(PRODUCT_BLACKLIST_PATH)
             if not df_bl.empty:
-                df_bl["ProductCode"] = df_bl["ProductCode"].apply(
-                    canonicalize_code)
+                df_bl["ProductCode"] = canonicalize_code_series(
+                    df_bl["ProductCode"])
                 blacklist_data = df_bl
         except Exception as e:
             print(f"Error loading blacklist: {e}")
@@ -322,11 +326,9 @@ async def upload_product_blacklist(file: UploadFile = File(...)):
                 break
 
         if target_col:
-            new_codes = set()
-            for val in df_new[target_col]:
-                c = canonicalize_code(val)
-                if c:
-                    new_codes.add(c)
+            new_codes = set(
+                canonicalize_code_series(df_new[target_col]).dropna())
+            new_codes.discard("")
             save_product_blacklist(list(new_codes))
 
     except Exception as e:
@@ -419,6 +421,7 @@ async def group_config_save(request: Request):
         try:
             df_out = pd.DataFrame(rows_data)
             df_out.to_excel(DEFAULT_GROUP_CONFIG_PATH, index=False)
+            invalidate_config_cache(DEFAULT_GROUP_CONFIG_PATH)
             success = True
         except Exception as e:
             success = False
@@ -458,6 +461,10 @@ async def group_config_save(request: Request):
 
 @router.get("/group-items")
 async def group_items_page(request: Request):
+    return await run_blocking("session", _group_items_page, request)
+
+
+def _group_items_page(request: Request):
     # 1. بارگذاری تنظیمات و مپ فعلی
     default_group_cfg = load_default_group_config()
     pg_map = load_product_group_map()
@@ -488,7 +495,7 @@ async def group_items_page(request: Request):
         })
 
     # 4. بررسی وجود فایل فروش
-    df_sales = LAST_UPLOAD["sales"]
+    df_sales = get_upload(request)["sales"]
     product_rows = []
     info_message = None
     info_type = None
@@ -528,9 +535,8 @@ async def group_items_page(request: Request):
 
             # 7. استخراج لیست کالاها از فایل فروش
             df_items = df_sales.copy()
-            df_items["__CodeKey__"] = df_items[code_col].map(
-                lambda v: canonicalize_code(v) if pd.notna(v) else None
-            )
+            df_items["__CodeKey__"] = canonicalize_code_series(
+                df_items[code_col])
             df_items = df_items[df_items["__CodeKey__"].notna()].copy()
 
             if name_col:
@@ -659,6 +665,11 @@ async def process_bind_codes(
     payments_file: UploadFile = File(...),
     checks_file: UploadFile | None = File(None)
 ):
+    return await run_blocking(
+        "excel", _process_bind_codes, request, payments_file, checks_file)
+
+
+def _process_bind_codes(request: Request, payments_file: UploadFile, checks_file: UploadFile | None):
     try:
         # 1. بارگذاری فایل‌ها
         df_pay = load_payments_excel(payments_file.file)
@@ -674,7 +685,7 @@ async def process_bind_codes(
                 df_black = pd.read_excel(blacklist_path)
                 if "CustomerName" in df_black.columns:
                     blacklist_set = set(
-                        df_black["CustomerName"].apply(normalize_persian_name))
+                        normalize_name_series(df_black["CustomerName"]))
             except Exception as e:
                 print(f"Error loading blacklist: {e}")
 
@@ -694,15 +705,15 @@ async def process_bind_codes(
 
         if not resolved_df.empty:
             resolved_df = resolved_df[
-                ~resolved_df["CustomerName"].apply(
-                    lambda x: normalize_persian_name(x) in blacklist_set)
+                ~normalize_name_series(resolved_df["CustomerName"]).isin(
+                    blacklist_set)
             ]
 
         if unresolved_items:
             unresolved_df = pd.DataFrame(unresolved_items)
             unresolved_df = unresolved_df[
-                ~unresolved_df["Name"].apply(
-                    lambda x: normalize_persian_name(x) in blacklist_set)
+                ~normalize_name_series(unresolved_df["Name"]).isin(
+                    blacklist_set)
             ]
         else:
             unresolved_df = pd.DataFrame()
@@ -778,6 +789,7 @@ async def process_bind_codes(
                                         == name, "Status"] = "کد تغییر یافت"
 
         df_existing.to_excel(output_filename, index=False)
+        invalidate_config_cache(output_filename)
 
         return templates.TemplateResponse(
             "bind_codes_result.html",
@@ -817,6 +829,11 @@ async def process_direct_download(
     payments_file: UploadFile = File(...),
     checks_file: UploadFile | None = File(None)
 ):
+    return await run_blocking(
+        "excel", _process_direct_download, request, payments_file, checks_file)
+
+
+def _process_direct_download(request: Request, payments_file: UploadFile, checks_file: UploadFile | None):
     try:
         # 1. بارگذاری
         df_pay = load_payments_excel(payments_file.file)
@@ -941,7 +958,7 @@ async def fix_unresolved_page(request: Request):
                 df_black = pd.read_excel(blacklist_path)
                 if "CustomerName" in df_black.columns:
                     blacklist_set = set(
-                        df_black["CustomerName"].apply(normalize_persian_name)
+                        normalize_name_series(df_black["CustomerName"])
                     )
             except Exception as e:
                 print(f"Error loading blacklist for UI: {e}")
@@ -1022,6 +1039,7 @@ async def manual_map_save(request: Request):
 
         # ذخیره در فایل اکسل
         df_final.to_excel(file_path, index=False)
+        invalidate_config_cache(file_path)
 
         return JSONResponse(content={"status": "ok", "message": "فایل با موفقیت بروزرسانی شد."})
 
@@ -1062,6 +1080,7 @@ async def edit_resolved_item(request: Request):
             df.loc[mask, "Status"] = "کد یافت شد (ویرایش شده)"
 
             df.to_excel(file_path, index=False)
+            invalidate_config_cache(file_path)
             return JSONResponse(content={"status": "ok"})
         else:
             return JSONResponse(content={"status": "error", "message": "فایل اکسل یافت نشد"}, status_code=404)
@@ -1096,6 +1115,7 @@ async def delete_resolved_item(request: Request):
                 return JSONResponse(content={"status": "error", "message": "مشتری یافت نشد"}, status_code=404)
 
             df.to_excel(file_path, index=False)
+            invalidate_config_cache(file_path)
             return JSONResponse(content={"status": "ok"})
         else:
             return JSONResponse(content={"status": "error", "message": "فایل اکسل یافت نشد"}, status_code=404)
@@ -1130,6 +1150,7 @@ async def blacklist_item(request: Request):
 
             if len(df_bind) < initial_len:
                 df_bind.to_excel(bind_file_path, index=False)
+                invalidate_config_cache(bind_file_path)
             else:
                 return JSONResponse(content={"status": "error", "message": "مشتری در لیست اصلی یافت نشد"}, status_code=404)
         else:
@@ -1151,6 +1172,7 @@ async def blacklist_item(request: Request):
         }])
         df_black = pd.concat([df_black, new_row], ignore_index=True)
         df_black.to_excel(blacklist_file_path, index=False)
+        invalidate_config_cache(blacklist_file_path)
 
         return JSONResponse(content={"status": "ok", "message": "با موفقیت به لیست سیاه منتقل شد."})
 
@@ -1175,13 +1197,14 @@ async def unblacklist_item(request: Request):
             norm_target = normalize_persian_name(customer_name)
 
             if "CustomerName" in df_black.columns:
-                df_black["Normalized"] = df_black["CustomerName"].apply(
-                    normalize_persian_name)
+                df_black["Normalized"] = normalize_name_series(
+                    df_black["CustomerName"])
                 df_black = df_black[df_black["Normalized"] != norm_target]
                 df_black = df_black.drop(columns=["Normalized"])
 
             if len(df_black) < initial_len:
                 df_black.to_excel(blacklist_file_path, index=False)
+                invalidate_config_cache(blacklist_file_path)
                 return JSONResponse(content={"status": "ok", "message": "با موفقیت از لیست سیاه حذف شد."})
             else:
                 return JSONResponse(content={"status": "error", "message": "مشتری در لیست سیاه یافت نشد"}, status_code=404)
@@ -1218,6 +1241,11 @@ async def process_payments_checks(
     payments_file: UploadFile = File(...),
     checks_file: UploadFile | None = File(None)
 ):
+    return await run_blocking(
+        "excel", _process_payments_checks, request, payments_file, checks_file)
+
+
+def _process_payments_checks(request: Request, payments_file: UploadFile, checks_file: UploadFile | None):
     try:
 
         df_pay = load_payments_excel(payments_file.file)
@@ -7,6 +7,8 @@ from pathlib import Path
 # ایمپورت کردن روترها
 from app.api import routes_commission, routes_balances, routes_utils
 from app.services.helpers import format_number
+from app.services.session_cache import is_valid_session_id, new_session_id
+from app.state import SESSION_COOKIE
 
 # ------------------ تنظیمات اولیه برنامه ------------------
 app = FastAPI()
@@ -32,6 +34,23 @@ routes_commission.templates = templates
 routes_balances.templates = templates
 routes_utils.templates = templates
 
+# ------------------ کوکی نشست ------------------
+
+
+@app.middleware("http")
+async def session_cookie(request: Request, call_next):
+    """هر مرورگر یک شناسه نشست می‌گیرد تا داده‌های آپلود کاربران از هم جدا باشند."""
+    session_id = request.cookies.get(SESSION_COOKIE)
+    is_new = not is_valid_session_id(session_id)
+    if is_new:
+        session_id = new_session_id()
+    request.state.session_id = session_id
+    response = await call_next(request)
+    if is_new:
+        response.set_cookie(SESSION_COOKIE, session_id,
+                            httponly=True, samesite="lax")
+    return response
+
 # ------------------ ثبت روترها ------------------
 app.include_router(routes_commission.router)
 app.include_router(routes_balances.router)
@@ -55,3 +55,30 @@ class Check(Base):
 
     customer_id = Column(Integer, ForeignKey('customers.id'))
     customer = relationship('Customer')
+
+class CustomerBalance(Base):
+    """مانده خام هر مشتری (جایگزین فایل اکسلی customer_balances_db.xlsx)."""
+    __tablename__ = 'customer_balances'
+
+    id = Column(Integer, primary_key=True)
+    customer_code = Column(String, nullable=True)
+    # کد استاندارد شده (canonicalize_code) برای جستجو
+    code_key = Column(String, nullable=True, index=True)
+    # نام نرمال شده (normalize_name)؛ کلید یکتای هر مشتری
+    customer_name = Column(String, nullable=False, unique=True, index=True)
+    original_name = Column(String, nullable=True)
+    raw_balance = Column(Float, nullable=False, default=0.0)
+
+class PendingCheckTotal(Base):
+    """جمع چک‌های «در جریان» هر مشتری (محاسبه شده از فایل چک‌ها)."""
+    __tablename__ = 'pending_check_totals'
+
+    customer_name = Column(String, primary_key=True)
+    amount = Column(Float, nullable=False, default=0.0)
+
+class StoreMeta(Base):
+    """تنظیمات/وضعیت کلید-مقدار (مثلاً اثر انگشت فایل چک‌ها)."""
+    __tablename__ = 'store_meta'
+
+    key = Column(String, primary_key=True)
+    value = Column(String, nullable=True)
@@ -0,0 +1,212 @@
+# app/services/balances_store.py
+import os
+import threading
+
+import pandas as pd
+from sqlalchemy import delete, inspect, select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from app.models.database import SessionLocal, engine
+from app.models.models import CustomerBalance, PendingCheckTotal, StoreMeta
+from app.services.excel_reader import read_table
+from app.services.helpers import canonicalize_code
+
+# فایل اکسلی که قبلاً نقش دیتابیس مانده‌ها را داشت؛
+# در اولین ساخت جدول، محتوای آن یک بار به SQLite منتقل می‌شود.
+LEGACY_BALANCES_XLSX = "customer_balances_db.xlsx"
+
+_TABLE_READY = False
+_TABLE_LOCK = threading.Lock()
+
+
+def _clean_code(code):
+    if code is None or pd.isna(code):
+        return None
+    code = str(code).strip()
+    return code or None
+
+
+def _row_values(item: dict) -> dict:
+    code = _clean_code(item.get("CustomerCode"))
+    # ردیف بدون مانده (None یا NaN) → صفر
+    raw = item.get("RawBalance")
+    if raw is None or pd.isna(raw):
+        raw = 0.0
+    return {
+        "customer_code": code,
+        "code_key": canonicalize_code(code) if code else None,
+        "customer_name": str(item.get("CustomerName") or ""),
+        "original_name": item.get("OriginalName"),
+        "raw_balance": float(raw),
+    }
+
+
+def _import_legacy_excel(path: str) -> None:
+    """انتقال یک‌باره ردیف‌های فایل اکسل قدیمی (بدون ردیف جمع) به جدول."""
+    try:
+        df = read_table(path)
+    except Exception as e:
+        print(f"Error importing legacy balances excel: {e}")
+        return
+    items = []
+    for item in df.to_dict(orient="records"):
+        name = item.get("CustomerName")
+        if name is None or pd.isna(name) or str(name) == "جمع":
+            continue
+        # ستون RawBalance خالی → مانده خام همان Balance است
+        raw = item.get("RawBalance")
+        if raw is None or pd.isna(raw):
+            raw = item.get("Balance")
+        if raw is None or pd.isna(raw):
+            raw = 0.0
+        items.append({**item, "RawBalance": raw})
+    upsert_balances(items)
+
+
+def ensure_balances_table() -> None:
+    """ساخت جدول‌ها (فقط بار اول) و انتقال داده‌های اکسل قدیمی مانده‌ها."""
+    global _TABLE_READY
+    if _TABLE_READY:
+        return
+    with _TABLE_LOCK:
+        if _TABLE_READY:
+            return
+        existed = inspect(engine).has_table(CustomerBalance.__tablename__)
+        for model in (CustomerBalance, PendingCheckTotal, StoreMeta):
+            model.__table__.create(engine, checkfirst=True)
+        _TABLE_READY = True
+        if not existed and os.path.exists(LEGACY_BALANCES_XLSX):
+            _import_legacy_excel(LEGACY_BALANCES_XLSX)
+
+
+def fetch_balances() -> list[dict]:
+    """همه ردیف‌ها به ترتیب ثبت، با یک کوئری."""
+    ensure_balances_table()
+    stmt = select(
+        CustomerBalance.customer_code,
+        CustomerBalance.customer_name,
+        CustomerBalance.original_name,
+        CustomerBalance.raw_balance,
+    ).order_by(CustomerBalance.id)
+    with SessionLocal() as db:
+        rows = db.execute(stmt).all()
+    return [
+        {
+            "CustomerCode": code,
+            "CustomerName": name,
+            "OriginalName": original,
+            "RawBalance": raw,
+        }
+        for code, name, original, raw in rows
+    ]
+
+
+def upsert_balances(items: list[dict]) -> None:
+    """
+    درج یا جایگزینی ردیف‌ها بر اساس نام نرمال شده.
+    آیتم‌ها باید CustomerName نرمال شده و RawBalance داشته باشند.
+    """
+    ensure_balances_table()
+    if not items:
+        return
+    # اگر یک نام چند بار آمده باشد آخرین مقدار ملاک است (مثل قبل)
+    values = list({v["customer_name"]: v for v in map(_row_values, items)}.values())
+    stmt = insert(CustomerBalance)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CustomerBalance.customer_name],
+        set_={
+            "customer_code": stmt.excluded.customer_code,
+            "code_key": stmt.excluded.code_key,
+            "original_name": stmt.excluded.original_name,
+            "raw_balance": stmt.excluded.raw_balance,
+        },
+    )
+    with SessionLocal() as db:
+        db.execute(stmt, values)
+        db.commit()
+
+
+def replace_balances(items: list[dict]) -> None:
+    """جایگزینی کامل محتوای جدول (برای ورود کامل یک لیست)."""
+    ensure_balances_table()
+    with SessionLocal() as db:
+        db.execute(delete(CustomerBalance))
+        db.commit()
+    upsert_balances(items)
+
+
+def update_balance_by_name(old_name: str, item: dict) -> bool:
+    """ویرایش ردیفِ با نام نرمال شده old_name؛ اگر پیدا نشد False."""
+    ensure_balances_table()
+    values = _row_values(item)
+    with SessionLocal() as db:
+        row_id = db.execute(
+            select(CustomerBalance.id).where(
+                CustomerBalance.customer_name == old_name)
+        ).scalar()
+        if row_id is None:
+            return False
+        # اگر نام جدید متعلق به ردیف دیگری است، آن ردیف جایگزین می‌شود
+        db.execute(delete(CustomerBalance).where(
+            CustomerBalance.customer_name == values["customer_name"],
+            CustomerBalance.id != row_id))
+        db.execute(update(CustomerBalance).where(
+            CustomerBalance.id == row_id).values(**values))
+        db.commit()
+    return True
+
+
+def delete_balances(code: str = None, name: str = None) -> int:
+    """حذف بر اساس کد (اولویت) یا نام نرمال شده؛ خروجی تعداد حذف شده."""
+    ensure_balances_table()
+    if code:
+        cond = CustomerBalance.code_key == canonicalize_code(code)
+    elif name:
+        cond = CustomerBalance.customer_name == name
+    else:
+        return 0
+    with SessionLocal() as db:
+        result = db.execute(delete(CustomerBalance).where(cond))
+        db.commit()
+    return result.rowcount
+
+
+def clear_balances() -> None:
+    ensure_balances_table()
+    with SessionLocal() as db:
+        db.execute(delete(CustomerBalance))
+        db.commit()
+
+
+# ------------------ جمع چک‌های در جریان ------------------
+PENDING_CHECKS_FINGERPRINT_KEY = "pending_checks_fingerprint"
+
+
+def load_pending_checks(fingerprint: str) -> dict[str, float] | None:
+    """
+    جمع ذخیره شده چک‌های در جریان؛ فقط اگر برای همین نسخه فایل چک‌ها
+    (fingerprint) محاسبه شده باشد، وگرنه None.
+    """
+    ensure_balances_table()
+    with SessionLocal() as db:
+        stored = db.get(StoreMeta, PENDING_CHECKS_FINGERPRINT_KEY)
+        if stored is None or stored.value != fingerprint:
+            return None
+        rows = db.execute(select(
+            PendingCheckTotal.customer_name, PendingCheckTotal.amount)).all()
+    return {name: amount for name, amount in rows}
+
+
+def save_pending_checks(fingerprint: str, totals: dict[str, float]) -> None:
+    """جایگزینی جمع چک‌ها به همراه اثر انگشت فایلی که از آن محاسبه شده‌اند."""
+    ensure_balances_table()
+    with SessionLocal() as db:
+        db.execute(delete(PendingCheckTotal))
+        if totals:
+            db.execute(insert(PendingCheckTotal), [
+                {"customer_name": name, "amount": float(amount)}
+                for name, amount in totals.items()
+            ])
+        db.merge(StoreMeta(key=PENDING_CHECKS_FINGERPRINT_KEY,
+                           value=fingerprint))
+        db.commit()
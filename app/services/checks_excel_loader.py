@@ -1,38 +1,46 @@
 # app/services/checks_excel_loader.py
 from __future__ import annotations
 from typing import IO, Any
+import numpy as np
 import pandas as pd
 
+from app.services.excel_reader import find_row, match_sheet_dtypes, peek_rows, read_region
+
+# کلمه‌ای که ردیف هدر فایل چک‌ها را مشخص می‌کند
+CHECKS_HEADER_KEYWORDS = ["رديف چك", "ردیف چک"]
+
 
 def load_checks_excel(file_obj: IO[Any]) -> pd.DataFrame:
     print("--- DEBUG: Starting load_checks_excel ---")
 
-    file_obj.seek(0)
+    # پیدا کردن ردیف هدر (فقط ردیف‌های ابتدای فایل به صورت استریم خوانده می‌شوند)
     try:
-        raw = pd.read_excel(file_obj, header=None)
-        print(f"DEBUG: Excel file loaded. Shape: {raw.shape}")
+        head_rows = peek_rows(file_obj)
     except Exception as e:
         print(f"ERROR: Failed to read excel file: {e}")
         return pd.DataFrame()
 
-    # پیدا کردن ردیف هدر
-    header_idx = None
-    for i in range(min(40, len(raw))):
-        row = raw.iloc[i].astype(str)
-        # چاپ ردیف‌ها برای بررسی چشمی در کنسول
-        # print(f"Checking row {i}: {row.tolist()}")
-        if row.str.contains("رديف چك", na=False).any() or row.str.contains("ردیف چک", na=False).any():
-            header_idx = i
-            print(f"DEBUG: Header found at row index: {header_idx}")
-            break
-
+    header_idx = find_row(head_rows, CHECKS_HEADER_KEYWORDS)
     if header_idx is None:
         print("ERROR: Header 'ردیف چک' not found in first 40 rows.")
         return pd.DataFrame()
+    print(f"DEBUG: Header found at row index: {header_idx}")
+
+    # ناحیه داده فقط یک بار خوانده می‌شود
+    try:
+        df = read_region(file_obj, skiprows=header_idx + 1, label="checks")
+        print(f"DEBUG: Excel data region loaded. Shape: {df.shape}")
+    except Exception as e:
+        print(f"ERROR: Failed to read excel file: {e}")
+        return pd.DataFrame()
 
-    header = raw.iloc[header_idx]
-    df = raw.iloc[header_idx + 1:].copy()
-    df.columns = header
+    # عرض و نوع ستون‌ها مثل خواندن کل شیت (ردیف‌های بالا هم حساب می‌شوند)
+    width = max(len(head_rows[0]), len(df.columns))
+    df = match_sheet_dtypes(
+        df.reindex(columns=range(width)), head_rows, header_idx + 1)
+    header = [np.nan if v is None else v for v in head_rows[header_idx]]
+    df.columns = pd.Index(
+        header + [np.nan] * (width - len(header)), name=header_idx)
     df = df.dropna(how="all")
 
     print(f"DEBUG: Original Columns found: {df.columns.tolist()}")
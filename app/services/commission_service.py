@@ -1,18 +1,32 @@
 import re
 import os
+import copy
+import json
+import time
+import hashlib
+import threading
 import pandas as pd
 import numpy as np
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from datetime import datetime
 
 # --- ایمپورت‌های اصلی پروژه شما ---
 from app.services.customer_balances import load_balances_from_db
+from app.services.excel_reader import read_table
 from app.services.helpers import (
     canonicalize_code,
+    canonicalize_code_series,
     normalize_persian_name,
+    normalize_name_series,
     name_key_for_matching,
-    parse_jalali_or_gregorian,
+    name_key_series,
+    parse_jalali_series,
     to_jalali_str
 )
+from app.services.customer_index import attach_customer_index
+from app.services.customer_stats import attach_customer_stats
+from app.services.settlement import SettlementCache, settle_all_customers
 
 # ------------------ تنظیمات فایل‌های پیکربندی ------------------
 DEFAULT_GROUP_CONFIG_PATH = "group_config.xlsx"
@@ -20,14 +34,75 @@ PRODUCT_GROUP_MAP_PATH = "product_group_map.xlsx"
 MARKETERS_PATH = "marketers.xlsx"
 PRODUCT_BLACKLIST_PATH = "product_blacklist.xlsx"
 BLACKLIST_FILE = "blacklist.xlsx"
+NAME_CODE_BIND_PATH = "customer_codes_bind.xlsx"
+
+# ------------------ کش فایل‌های پیکربندی ------------------
+# خروجی پارس شده هر فایل اکسل تنظیمات (set/dict/DataFrame) با کلید
+# (مسیر، mtime، اندازه) نگه داشته می‌شود؛ اگر فایل عوض شود کلید عوض می‌شود
+# و دوباره خوانده می‌شود. توابع save هم مستقیماً کش را باطل می‌کنند.
+_CONFIG_CACHE: dict[tuple, tuple] = {}
+_CONFIG_CACHE_LOCK = threading.Lock()
+CONFIG_CACHE_STATS = {"hits": 0, "misses": 0}
+
+
+def _file_stamp(path: str):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _cached_config(kind: str, path: str, loader):
+    """
+    اجرای loader فقط وقتی فایل از آخرین خواندن تغییر کرده باشد.
+    همیشه یک کپی برمی‌گردد تا تغییر خروجی توسط فراخوان، کش را خراب نکند.
+    """
+    stamp = _file_stamp(path)
+    if stamp is None:
+        # فایل وجود ندارد؛ loader خودش خروجی خالی را برمی‌گرداند
+        return loader()
+    key = (kind, os.path.abspath(path))
+    with _CONFIG_CACHE_LOCK:
+        entry = _CONFIG_CACHE.get(key)
+        if entry is not None and entry[0] == stamp:
+            CONFIG_CACHE_STATS["hits"] += 1
+            return copy.deepcopy(entry[1])
+        CONFIG_CACHE_STATS["misses"] += 1
+    value = loader()
+    with _CONFIG_CACHE_LOCK:
+        _CONFIG_CACHE[key] = (stamp, value)
+    return copy.deepcopy(value)
+
+
+def invalidate_config_cache(path: str = None) -> None:
+    """باطل کردن کش یک فایل (یا کل کش اگر مسیر داده نشود)."""
+    with _CONFIG_CACHE_LOCK:
+        if path is None:
+            _CONFIG_CACHE.clear()
+            return
+        target = os.path.abspath(path)
+        for key in [k for k in _CONFIG_CACHE if k[1] == target]:
+            del _CONFIG_CACHE[key]
+
+
+def config_cache_stats() -> dict:
+    """شمارنده‌های hit/miss کش تنظیمات به همراه تعداد فایل‌های کش شده."""
+    with _CONFIG_CACHE_LOCK:
+        return {**CONFIG_CACHE_STATS, "entries": len(_CONFIG_CACHE)}
 
 # ------------------ مدیریت تنظیمات گروه‌ها ------------------
 
 
 def load_default_group_config(path: str = DEFAULT_GROUP_CONFIG_PATH) -> dict:
+    return _cached_config("group_config", path,
+                          lambda: _read_default_group_config(path))
+
+
+def _read_default_group_config(path: str) -> dict:
     if not os.path.exists(path):
         return {}
-    df = pd.read_excel(path)
+    df = read_table(path)
     cfg: dict[str, dict] = {}
     for _, row in df.iterrows():
         key = str(row.get("Group", "")).strip()
@@ -57,15 +132,18 @@ def load_default_group_config(path: str = DEFAULT_GROUP_CONFIG_PATH) -> dict:
 
 
 def load_product_group_map(path: str = PRODUCT_GROUP_MAP_PATH) -> pd.DataFrame:
+    return _cached_config("product_group_map", path,
+                          lambda: _read_product_group_map(path))
+
+
+def _read_product_group_map(path: str) -> pd.DataFrame:
     if not os.path.exists(path):
         return pd.DataFrame(columns=["ProductCode", "ProductName", "Group"])
-    df = pd.read_excel(path)
+    df = read_table(path)
     for c in ["ProductCode", "ProductName", "Group"]:
         if c not in df.columns:
             df[c] = None
-    df["ProductCode"] = df["ProductCode"].map(
-        lambda v: canonicalize_code(v) if pd.notna(v) else None
-    )
+    df["ProductCode"] = canonicalize_code_series(df["ProductCode"])
     return df[["ProductCode", "ProductName", "Group"]]
 
 
@@ -76,6 +154,27 @@ def save_product_group_map(df: pd.DataFrame, path: str = PRODUCT_GROUP_MAP_PATH)
             df[c] = None
     df_out = df[cols].copy()
     df_out.to_excel(path, index=False)
+    invalidate_config_cache(path)
+
+
+def group_config_frame(group_config: dict) -> pd.DataFrame:
+    """
+    تبدیل دیکشنری تنظیمات گروه‌ها به جدول (Group → percent, due_days, is_cash)
+    برای map کردن برداری روی ردیف‌های فروش.
+    """
+    rows = {
+        key: {
+            "percent": float(cfg.get("percent", 0.0)),
+            "due_days": cfg.get("due_days"),
+            "is_cash": bool(cfg.get("is_cash")),
+        }
+        for key, cfg in (group_config or {}).items()
+    }
+    df = pd.DataFrame.from_dict(
+        rows, orient="index", columns=["percent", "due_days", "is_cash"])
+    df["due_days"] = pd.to_numeric(df["due_days"], errors="coerce")
+    df.index.name = "Group"
+    return df
 
 
 def get_priority(product_group: str) -> str:
@@ -88,43 +187,48 @@ def get_priority(product_group: str) -> str:
 
 
 def load_blacklist_sets():
+    return _cached_config("blacklist", BLACKLIST_FILE, _read_blacklist_sets)
+
+
+def _read_blacklist_sets():
     banned_codes = set()
     banned_names = set()
     if not os.path.exists(BLACKLIST_FILE):
         return banned_codes, banned_names
     try:
-        df = pd.read_excel(BLACKLIST_FILE)
+        df = read_table(BLACKLIST_FILE)
         if "CustomerCode" in df.columns:
-            for val in df["CustomerCode"]:
-                c = canonicalize_code(val)
-                if c:
-                    banned_codes.add(c)
+            banned_codes = set(
+                canonicalize_code_series(df["CustomerCode"]).dropna())
+            banned_codes.discard("")
         if "CustomerName" in df.columns:
-            for val in df["CustomerName"]:
-                n = normalize_persian_name(val)
-                if n:
-                    banned_names.add(n)
+            banned_names = set(normalize_name_series(df["CustomerName"]))
+            banned_names.discard("")
     except Exception as e:
         print(f"Error loading blacklist file: {e}")
     return banned_codes, banned_names
 
 
 def load_product_blacklist_set():
+    return _cached_config("product_blacklist", PRODUCT_BLACKLIST_PATH,
+                          _read_product_blacklist_set)
+
+
+def _read_product_blacklist_set():
     banned_products = set()
     if not os.path.exists(PRODUCT_BLACKLIST_PATH):
         return banned_products
     try:
-        df = pd.read_excel(PRODUCT_BLACKLIST_PATH)
+        df = read_table(PRODUCT_BLACKLIST_PATH)
         col_name = None
         for c in df.columns:
             if "code" in c.lower() or "کد" in c:
                 col_name = c
                 break
         if col_name:
-            for val in df[col_name]:
-                c = canonicalize_code(val)
-                if c:
-                    banned_products.add(c)
+            banned_products = set(
+                canonicalize_code_series(df[col_name]).dropna())
+            banned_products.discard("")
     except Exception as e:
         print(f"Error loading product blacklist: {e}")
     return banned_products
@@ -134,18 +238,23 @@ def save_product_blacklist(codes: list):
     df = pd.DataFrame({"ProductCode": codes, "DateAdded": [
                       datetime.now()] * len(codes)})
     df.to_excel(PRODUCT_BLACKLIST_PATH, index=False)
+    invalidate_config_cache(PRODUCT_BLACKLIST_PATH)
 
 
 def load_allowed_marketers() -> set:
+    return _cached_config("marketers", MARKETERS_PATH, _read_allowed_marketers)
+
+
+def _read_allowed_marketers() -> set:
     if not os.path.exists(MARKETERS_PATH):
         return set()
     try:
-        df = pd.read_excel(MARKETERS_PATH)
+        df = read_table(MARKETERS_PATH)
         col = next((c for c in df.columns if "marketer" in c.lower()
                    or "visitor" in c.lower() or "بازاریاب" in c), None)
         if not col:
             return set()
-        return set(df[col].dropna().apply(lambda x: normalize_persian_name(str(x))).unique())
+        return set(normalize_name_series(df[col].dropna()).unique())
     except Exception as e:
         print(f"Error loading marketers: {e}")
         return set()
@@ -154,32 +263,180 @@ def load_allowed_marketers() -> set:
 def save_marketers_list(names: list):
     df = pd.DataFrame({"MarketerName": names})
     df.to_excel(MARKETERS_PATH, index=False)
+    invalidate_config_cache(MARKETERS_PATH)
+
+# ------------------ داده‌های مرجع هر محاسبه ------------------
+
+
+@dataclass
+class ReferenceData:
+    """
+    تصویر (snapshot) داده‌های مرجع یک محاسبه پورسانت.
+    یک بار در ابتدای محاسبه ساخته می‌شود و به prepare_sales،
+    prepare_payments و extract_customer_for_payment پاس داده می‌شود
+    تا مانده‌ها و فایل‌های تنظیمات چند بار خوانده نشوند.
+    """
+    balances: list[dict] = field(default_factory=list)
+    # {کد_استاندارد: مانده}
+    balances_map: dict[str, float] = field(default_factory=dict)
+    # {کلید نام: کد} از روی مانده‌ها
+    name_code_map: dict[str, str] = field(default_factory=dict)
+    # {کلید نام: کد} از فایل بایند دستی
+    bind_map: dict[str, str] = field(default_factory=dict)
+    banned_codes: set = field(default_factory=set)
+    banned_names: set = field(default_factory=set)
+    banned_products: set = field(default_factory=set)
+    allowed_marketers: set = field(default_factory=set)
+    # فیلتر بازاریاب فقط وقتی فایل بازاریاب‌ها وجود دارد فعال است
+    filter_marketers: bool = False
+    check_index: dict = field(default_factory=dict)
+    build_seconds: float = 0.0
+
+
+def build_balances_map(balances_list: list[dict]) -> dict[str, float]:
+    """دیکشنری {کد_استاندارد: مبلغ_مانده} از لیست مانده‌ها."""
+    balances_map = {}
+    for item in balances_list:
+        c_code = canonicalize_code(item.get("CustomerCode"))
+        bal_val = item.get("Balance", 0)
+        try:
+            bal_val = float(bal_val)
+        except:
+            bal_val = 0
+        if c_code:
+            balances_map[c_code] = bal_val
+    return balances_map
+
+
+def build_reference_data(checks_df: pd.DataFrame = None) -> ReferenceData:
+    """ساخت snapshot داده‌های مرجع (هر منبع فقط یک بار خوانده می‌شود)."""
+    started = time.perf_counter()
+    balances = load_balances_from_db()
+    banned_codes, banned_names = load_blacklist_sets()
+    ref = ReferenceData(
+        balances=balances,
+        balances_map=build_balances_map(balances),
+        name_code_map=build_name_code_map_from_balances(
+            balances, (banned_codes, banned_names)),
+        bind_map=load_name_code_map_from_excel(),
+        banned_codes=banned_codes,
+        banned_names=banned_names,
+        banned_products=load_product_blacklist_set(),
+        allowed_marketers=load_allowed_marketers(),
+        filter_marketers=os.path.exists(MARKETERS_PATH),
+        check_index=build_check_index(checks_df),
+    )
+    ref.build_seconds = time.perf_counter() - started
+    return ref
+
+# ------------------ کش محاسبه افزایشی ------------------
+# فروش آماده شده (خروجی prepare_sales) و نتایج تسویه هر مشتری، با کلید
+# اثر انگشت ورودی‌های فروش. وقتی فقط فایل پرداخت‌ها عوض شود (آپلود روزانه)
+# آماده‌سازی فروش تکرار نمی‌شود و فقط مشتریانی دوباره تسویه می‌شوند که
+# پرداخت، مانده یا فاکتورهایشان تغییر کرده است.
+# هر ورودی یک کپی کامل فروش آماده شده است، پس تعداد آن‌ها کم نگه داشته می‌شود.
+COMMISSION_CACHE_SIZE = 2
+_COMMISSION_CACHE: OrderedDict = OrderedDict()
+_COMMISSION_CACHE_LOCK = threading.Lock()
+COMMISSION_CACHE_STATS = {
+    "hits": 0, "misses": 0, "reused_customers": 0, "settled_customers": 0}
+
+
+@dataclass
+class PreparedSales:
+    """فروش آماده شده یک مجموعه ورودی و کش تسویه مشتریان آن."""
+    sales_df: pd.DataFrame
+    settlement: SettlementCache = field(default_factory=SettlementCache)
+    prepare_seconds: float = 0.0
+
+
+def sales_fingerprint(sales_raw: pd.DataFrame, group_config: dict, group_col: str,
+                      reference: ReferenceData) -> str:
+    """
+    اثر انگشت همه ورودی‌های prepare_sales: محتوای فایل فروش، تنظیمات
+    گروه‌ها، ستون گروه و فیلترهای بازاریاب/کالا/مشتری.
+    """
+    settings = {
+        "columns": [str(c) for c in sales_raw.columns],
+        "dtypes": [str(t) for t in sales_raw.dtypes],
+        "group_col": group_col,
+        "group_config": group_config,
+        "marketers": (sorted(map(str, reference.allowed_marketers))
+                      if reference.filter_marketers else None),
+        "banned_products": sorted(map(str, reference.banned_products)),
+        "banned_codes": sorted(map(str, reference.banned_codes)),
+        "banned_names": sorted(map(str, reference.banned_names)),
+    }
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps(settings, sort_keys=True, default=str,
+                             ensure_ascii=False).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(
+        sales_raw, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def get_prepared_sales(sales_raw: pd.DataFrame, group_config: dict, group_col: str,
+                       reference: ReferenceData) -> PreparedSales:
+    """
+    فروش آماده شده از کش (اگر ورودی‌های فروش عوض نشده باشند)،
+    وگرنه prepare_sales و ذخیره نتیجه در کش.
+    sales_df داخل خروجی نباید تغییر کند؛ فراخوان باید از کپی آن استفاده کند.
+    """
+    key = sales_fingerprint(sales_raw, group_config, group_col, reference)
+    with _COMMISSION_CACHE_LOCK:
+        prepared = _COMMISSION_CACHE.get(key)
+        if prepared is not None:
+            _COMMISSION_CACHE.move_to_end(key)
+            COMMISSION_CACHE_STATS["hits"] += 1
+            return prepared
+        COMMISSION_CACHE_STATS["misses"] += 1
+
+    started = time.perf_counter()
+    sales_df = prepare_sales(sales_raw, group_config, group_col, reference)
+    prepared = PreparedSales(
+        sales_df=sales_df, prepare_seconds=time.perf_counter() - started)
+    with _COMMISSION_CACHE_LOCK:
+        _COMMISSION_CACHE[key] = prepared
+        while len(_COMMISSION_CACHE) > COMMISSION_CACHE_SIZE:
+            _COMMISSION_CACHE.popitem(last=False)
+    return prepared
+
+
+def commission_cache_stats() -> dict:
+    """شمارنده‌های کش محاسبه افزایشی به همراه تعداد ورودی‌های کش شده."""
+    with _COMMISSION_CACHE_LOCK:
+        return {**COMMISSION_CACHE_STATS, "entries": len(_COMMISSION_CACHE)}
 
 # ------------------ منطق اصلی پردازش فروش ------------------
 
 
-def prepare_sales(sales_df: pd.DataFrame, group_config: dict, group_col: str) -> pd.DataFrame:
+def prepare_sales(sales_df: pd.DataFrame, group_config: dict, group_col: str,
+                  reference: ReferenceData = None) -> pd.DataFrame:
     sales_df = sales_df.copy()
 
     # 1. فیلتر بازاریاب‌ها
-    allowed_marketers = load_allowed_marketers()
-    if os.path.exists(MARKETERS_PATH):
+    if reference is not None:
+        allowed_marketers = reference.allowed_marketers
+        filter_marketers = reference.filter_marketers
+    else:
+        allowed_marketers = load_allowed_marketers()
+        filter_marketers = os.path.exists(MARKETERS_PATH)
+    if filter_marketers:
         if "Salesperson" in sales_df.columns:
-            sales_df["_TempMarketerNorm"] = sales_df["Salesperson"].apply(
-                lambda x: normalize_persian_name(str(x)))
-            sales_df = sales_df[sales_df["_TempMarketerNorm"].isin(
-                allowed_marketers)]
-            sales_df.drop(columns=["_TempMarketerNorm"], inplace=True)
+            marketer_norm = normalize_name_series(sales_df["Salesperson"])
+            sales_df = sales_df[marketer_norm.isin(allowed_marketers)
+                                & sales_df["Salesperson"].notna()]
         else:
             sales_df = sales_df.iloc[0:0]
 
     # 2. فیلتر کالاهای ممنوعه
     product_col_name = "ProductCode"
     if product_col_name in sales_df.columns:
-        banned_products = load_product_blacklist_set()
+        banned_products = (reference.banned_products if reference is not None
+                           else load_product_blacklist_set())
         if banned_products:
-            sales_df["_TempProdKey"] = sales_df[product_col_name].map(
-                canonicalize_code)
+            sales_df["_TempProdKey"] = canonicalize_code_series(
+                sales_df[product_col_name])
             sales_df = sales_df[~sales_df["_TempProdKey"].isin(
                 banned_products)]
             sales_df.drop(columns=["_TempProdKey"], inplace=True)
@@ -200,82 +457,81 @@ def prepare_sales(sales_df: pd.DataFrame, group_config: dict, group_col: str) ->
                 sales_df[c] = pd.NA
         return sales_df
 
-    sales_df["InvoiceDate"] = sales_df["InvoiceDate"].apply(
-        parse_jalali_or_gregorian)
+    sales_df["InvoiceDate"] = parse_jalali_series(sales_df["InvoiceDate"])
     if "CustomerCode" not in sales_df.columns:
         sales_df["CustomerCode"] = pd.NA
 
     # 4. فیلتر مشتریان
-    banned_codes, banned_names = load_blacklist_sets()
-    sales_df["_TempKey"] = sales_df["CustomerCode"].map(canonicalize_code)
-    sales_df["_TempName"] = sales_df["CustomerName"].apply(
-        normalize_persian_name)
+    if reference is not None:
+        banned_codes, banned_names = reference.banned_codes, reference.banned_names
+    else:
+        banned_codes, banned_names = load_blacklist_sets()
+    sales_df["_TempKey"] = canonicalize_code_series(sales_df["CustomerCode"])
+    sales_df["_TempName"] = normalize_name_series(sales_df["CustomerName"])
     mask_banned_code = sales_df["_TempKey"].isin(banned_codes)
     mask_banned_name = sales_df["_TempName"].isin(banned_names)
     sales_df = sales_df[~(mask_banned_code | mask_banned_name)]
     sales_df.drop(columns=["_TempKey", "_TempName"], inplace=True)
 
-    sales_df["CustomerKey"] = sales_df["CustomerCode"].map(canonicalize_code)
+    sales_df["CustomerKey"] = canonicalize_code_series(
+        sales_df["CustomerCode"])
     sales_df = sales_df[sales_df["CustomerKey"].notna()]
 
     if "DueDate" in sales_df.columns:
-        sales_df["DueDate"] = sales_df["DueDate"].apply(
-            parse_jalali_or_gregorian)
+        sales_df["DueDate"] = parse_jalali_series(sales_df["DueDate"])
     else:
         sales_df["DueDate"] = pd.NaT
 
-    def compute_due_date(row):
-        invoice_date = row["InvoiceDate"]
-        if pd.isna(invoice_date):
-            return pd.NaT
-        if not pd.isna(row["DueDate"]):
-            return row["DueDate"]
-        key = str(row.get(group_col))
-        cfg = group_config.get(key) if group_config else None
-        due_days = None
-        if cfg is not None:
-            due_days = cfg.get("due_days")
-        if not due_days or due_days <= 0:
-            base_priority = get_priority(row.get(group_col, ""))
-            due_days = 7 if base_priority == "cash" else 90
-        return invoice_date + pd.to_timedelta(due_days, unit="D")
-
-    sales_df["DueDate"] = sales_df.apply(compute_due_date, axis=1)
-
-    def compute_priority(row):
-        key = str(row.get(group_col))
-        cfg = group_config.get(key) if group_config else None
-        if cfg is not None:
-            return "cash" if cfg.get("is_cash") else "normal"
-        try:
-            delta_days = (row["DueDate"] - row["InvoiceDate"]).days
-            if delta_days <= 7:
-                return "cash"
-        except:
-            pass
-        return get_priority(row.get(group_col, ""))
-
-    sales_df["Priority"] = sales_df.apply(compute_priority, axis=1)
-    sales_df["PriorityRank"] = (sales_df["Priority"].map(
-        {"cash": 0, "normal": 1}).fillna(1).astype(int))
-
-    def row_percent(row):
-        key = str(row.get(group_col))
-        cfg = group_config.get(key) if group_config else None
-        if cfg is None:
-            return 0.0
-        return float(cfg.get("percent", 0.0))
+    # جدول تنظیمات برای مقادیر یکتای ستون گروه (به جای سه بار apply ردیف به ردیف)
+    # آخرین ردیف جدول برای مقادیر خالی است (بدون تنظیمات)
+    if group_col in sales_df.columns:
+        group_codes, group_values = pd.factorize(sales_df[group_col])
+    else:
+        group_codes, group_values = np.full(len(sales_df), -1), []
+    group_keys = [str(v) for v in group_values]
+    lookup = group_config_frame(group_config).reindex(group_keys + [None])
+    has_cfg = lookup["is_cash"].notna().to_numpy()
+    cfg_due_days = lookup["due_days"].to_numpy(dtype=float)
+    text_is_cash = np.array(
+        [get_priority(k) == "cash" for k in group_keys] + [False])
+
+    # مهلت پیش‌فرض: ۷ روز برای گروه‌های «نقدی»، ۹۰ روز برای بقیه
+    due_days = np.where(cfg_due_days > 0, cfg_due_days,
+                        np.where(text_is_cash, 7, 90))
+    row_due_days = due_days[group_codes]
+    computed_due = sales_df["InvoiceDate"] + \
+        pd.to_timedelta(row_due_days, unit="D")
+    due_date = sales_df["DueDate"].where(
+        sales_df["DueDate"].notna(), computed_due)
+    sales_df["DueDate"] = due_date.where(sales_df["InvoiceDate"].notna()).astype(
+        sales_df["InvoiceDate"].dtype)
+
+    # اولویت: اگر تنظیمات گروه هست، طبق IsCash؛ وگرنه مهلت ≤ ۷ روز یا نام «نقدی»
+    cfg_is_cash = lookup["is_cash"].fillna(False).to_numpy(dtype=bool)
+    delta_days = (sales_df["DueDate"] - sales_df["InvoiceDate"]).dt.days
+    short_due = (delta_days <= 7).fillna(False).to_numpy(dtype=bool)
+    is_cash = np.where(
+        has_cfg[group_codes],
+        cfg_is_cash[group_codes],
+        short_due | text_is_cash[group_codes],
+    )
+    sales_df["Priority"] = np.where(is_cash, "cash", "normal")
+    sales_df["PriorityRank"] = np.where(is_cash, 0, 1).astype(int)
 
     if "Amount" not in sales_df.columns:
         if not sales_df.empty:
             raise ValueError("در فایل فروش ستونی به نام 'Amount' پیدا نشد.")
 
-    sales_df["CommissionPercent"] = sales_df.apply(row_percent, axis=1)
+    cfg_percent = lookup["percent"].fillna(0.0).to_numpy(dtype=float)
+    sales_df["CommissionPercent"] = cfg_percent[group_codes]
     sales_df["Amount"] = sales_df["Amount"].astype(float)
     sales_df["PaidAmount"] = 0.0
     sales_df["Remaining"] = sales_df["Amount"]
     sales_df["CommissionAmount"] = 0.0
 
+    # ایندکس مشتری → ردیف‌ها (یک بار ساخته می‌شود؛ در تسویه و آمار مشتری استفاده می‌شود)
+    attach_customer_index(sales_df)
+
     return sales_df
 
 
@@ -288,7 +544,11 @@ def compute_commissions(
     checks_raw: pd.DataFrame,
     group_config: dict,
     group_col: str,
-    reactivation_days: int = 90
+    reactivation_days: int = 90,
+    settlement_workers: int = 1,
+    reference: ReferenceData = None,
+    incremental: bool = True,
+    progress=None
 ):
     """
     هسته‌ی محاسبات:
@@ -296,15 +556,34 @@ def compute_commissions(
     - اعمال مانده حساب (مثبت یا منفی) روی پرداخت‌ها
     - تسویه فاکتورها طبق اولویت (نقدی → عادی، قدیمی → جدید)
     - محاسبه پورسانت
-    """
-    # 1. آماده‌سازی فروش
-    sales_df = prepare_sales(sales_raw, group_config, group_col)
 
+    settlement_workers: تعداد پروسه‌های تسویه موازی (۱ = سریالی).
+    reference: داده‌های مرجع از پیش ساخته شده؛ اگر نباشد همین‌جا ساخته می‌شود.
+    incremental: استفاده از کش فروش آماده شده و نتایج تسویه اجرای قبلی
+    (فقط مشتریانی که ورودی‌شان عوض شده دوباره تسویه می‌شوند).
+    progress: تابع اختیاری که با نام هر مرحله (prepare_sales، prepare_payments،
+    settlement) در شروع آن صدا زده می‌شود.
+    """
+    progress = progress or (lambda stage: None)
     checks_df = (checks_raw.copy(
     ) if checks_raw is not None and not checks_raw.empty else pd.DataFrame())
+    if reference is None:
+        reference = build_reference_data(checks_df)
+
+    # 1. آماده‌سازی فروش (از کش، اگر ورودی‌های فروش عوض نشده باشند)
+    progress("prepare_sales")
+    settlement_cache = None
+    if incremental:
+        prepared = get_prepared_sales(sales_raw, group_config, group_col, reference)
+        sales_df = prepared.sales_df.copy()
+        settlement_cache = prepared.settlement
+    else:
+        sales_df = prepare_sales(sales_raw, group_config, group_col, reference)
 
     # 2. آماده‌سازی پرداخت‌ها
-    payments_df, _ = prepare_payments(payments_raw, checks_df, sales_df)
+    progress("prepare_payments")
+    payments_df, _ = prepare_payments(
+        payments_raw, checks_df, sales_df, reference)
 
     # اگر پرداختی نداریم، خروجی خالی برمی‌گردانیم (مگر اینکه مانده مثبت داشته باشیم، اما فعلا منطق اصلی روال پرداخت است)
     if payments_df.empty:
@@ -315,136 +594,22 @@ def compute_commissions(
         )
         salesperson_df.rename(
             columns={"CommissionAmount": "TotalCommission"}, inplace=True)
+        attach_customer_stats(sales_df)
         return sales_df, salesperson_df, payments_df
 
-    # --- [NEW] لود کردن مانده حساب‌ها ---
-    balances_list = load_balances_from_db()
-    # دیکشنری: {کد_استاندارد: مبلغ_مانده}
-    balances_map = {}
-    for item in balances_list:
-        c_code = canonicalize_code(item.get("CustomerCode"))
-        bal_val = item.get("Balance", 0)
-        try:
-            bal_val = float(bal_val)
-        except:
-            bal_val = 0
-        if c_code:
-            balances_map[c_code] = bal_val
-
-    # تسویه بر اساس CustomerKey استاندارد
-    for cust_key, pay_group in payments_df.groupby("ResolvedCustomerKey"):
-        if cust_key is None or (isinstance(cust_key, float) and pd.isna(cust_key)):
-            continue
-        if str(cust_key).strip() == "":
-            continue
+    # --- مانده حساب‌ها از snapshot ---
+    balances_map = reference.balances_map
 
-        # پیدا کردن فاکتورهای این مشتری
-        cust_invoice_idx = sales_df.index[sales_df["CustomerKey"] == cust_key]
-        if len(cust_invoice_idx) == 0:
-            continue
-
-        # مرتب‌سازی فاکتورها (اول نقدی، بعد قدیمی‌ترها)
-        cust_invoice_idx = (
-            sales_df.loc[cust_invoice_idx]
-            .sort_values(["PriorityRank", "InvoiceDate"])
-            .index
-        )
-
-        # مرتب‌سازی پرداخت‌ها بر اساس تاریخ
-        if "PaymentDate" in pay_group.columns:
-            pay_group = pay_group.sort_values("PaymentDate")
-
-        # --- [NEW LOGIC START] اعمال مانده حساب مشتری ---
-        customer_balance = balances_map.get(cust_key, 0.0)
-
-        # لیست نهایی پرداخت‌ها برای این مشتری (که اصلاح شده است)
-        final_payments_list = []
-
-        if customer_balance > 0:
-            # === حالت اول: بستانکار (مانده مثبت) ===
-            # اضافه کردن یک پرداخت مجازی با تاریخ بسیار قدیمی
-            virtual_payment = {
-                "Amount": customer_balance,
-                # تاریخ ازلی (همیشه سررسید را پاس می‌کند)
-                "PaymentDate": pd.Timestamp.min,
-                "SourceType": "InitialCredit",
-                "Description": "مانده بستانکار ابتدای دوره"
-            }
-            # اول پرداخت مجازی اضافه می‌شود
-            final_payments_list.append(virtual_payment)
-
-            # سپس تمام پرداخت‌های جدید عیناً اضافه می‌شوند
-            for _, row in pay_group.iterrows():
-                final_payments_list.append(row.to_dict())
-
-        elif customer_balance < 0:
-            # === حالت دوم: بدهکار (مانده منفی) ===
-            debt_remaining = abs(customer_balance)
-
-            for _, row in pay_group.iterrows():
-                # کپی دیکشنری برای تغییر ندادن دیتافریم اصلی
-                p_data = row.to_dict()
-                amount = float(p_data.get("Amount", 0))
-
-                if debt_remaining > 0:
-                    if amount <= debt_remaining:
-                        # کل این پرداخت صرف بدهی قبلی شد
-                        debt_remaining -= amount
-                        amount = 0
-                        # پرداختی که مبلغش صفر شد عملاً در حلقه پایین تاثیری ندارد
-                    else:
-                        # بخشی صرف بدهی، بخشی باقی می‌ماند
-                        amount -= debt_remaining
-                        debt_remaining = 0
-
-                if amount > 0:
-                    p_data["Amount"] = amount
-                    final_payments_list.append(p_data)
-        else:
-            # === حالت سوم: مانده صفر ===
-            for _, row in pay_group.iterrows():
-                final_payments_list.append(row.to_dict())
-
-        # --- [NEW LOGIC END] ---
-
-        # حلقه تخصیص (Allocation Loop) روی لیست نهایی پرداخت‌ها
-        for p in final_payments_list:
-            remaining_payment = float(p.get("Amount", 0))
-            pay_date = p.get("PaymentDate", None)
-
-            # پیمایش روی فاکتورها برای تخصیص
-            for idx in cust_invoice_idx:
-                if remaining_payment <= 0.001:  # اگر پول تمام شد (با تلورانس)
-                    break
-
-                remaining_invoice = sales_df.at[idx, "Remaining"]
-                if remaining_invoice <= 0:
-                    continue
-
-                # چقدر از این فاکتور را می‌توانیم با این پرداخت پاس کنیم؟
-                allocate = min(remaining_payment, remaining_invoice)
-
-                # شرط تعلق پورسانت: تاریخ پرداخت <= تاریخ سررسید
-                # (اگر پرداخت مجازی باشد، pay_date مینیمم است و شرط True می‌شود)
-                in_due = True
-                if isinstance(pay_date, (pd.Timestamp, datetime)):
-                    due_date = sales_df.at[idx, "DueDate"]
-                    if pd.notna(due_date):
-                        in_due = bool(pay_date <= due_date)
-                    else:
-                        # اگر فاکتور تاریخ سررسید ندارد، سخت‌گیرانه عمل کنیم یا نه؟
-                        # پیش‌فرض فعلی شما: اگر due_date نباشد، چه کنیم؟
-                        # معمولا اگر due_date نباشد یعنی محدودیت زمانی نیست، پس True
-                        in_due = True
-
-                if in_due:
-                    percent = sales_df.at[idx, "CommissionPercent"]
-                    sales_df.at[idx, "CommissionAmount"] += allocate * percent
-
-                # آپدیت مقادیر فاکتور و مانده پرداخت
-                sales_df.at[idx, "PaidAmount"] += allocate
-                sales_df.at[idx, "Remaining"] -= allocate
-                remaining_payment -= allocate
+    # تسویه بر اساس CustomerKey استاندارد (روی آرایه‌های NumPy)
+    progress("settlement")
+    if not sales_df.empty:
+        settle_all_customers(sales_df, payments_df, balances_map,
+                             workers=settlement_workers, cache=settlement_cache)
+        if settlement_cache is not None:
+            stats = settlement_cache.last_stats
+            with _COMMISSION_CACHE_LOCK:
+                COMMISSION_CACHE_STATS["reused_customers"] += stats["reused"]
+                COMMISSION_CACHE_STATS["settled_customers"] += stats["settled"]
 
     # جمع‌بندی پورسانت‌ها
     salesperson_df = (
@@ -456,22 +621,82 @@ def compute_commissions(
         columns={"CommissionAmount": "TotalCommission"}, inplace=True
     )
 
+    # آمار نمودار هر مشتری (برای /customer-stats) یک بار همین‌جا ساخته می‌شود
+    attach_customer_stats(sales_df)
+
     return sales_df, salesperson_df, payments_df
 
 
 # ------------------ توابع کمکی پرداخت ------------------
 
 
+def _check_cell_code(value) -> str | None:
+    if pd.isna(value):
+        return None
+    code = str(value).strip()
+    if not code or code.lower() == 'nan':
+        return None
+    return code
+
+
+def _check_cell_name(value) -> str | None:
+    if pd.isna(value):
+        return None
+    return str(value).strip() or None
+
+
+def build_check_index(checks_df: pd.DataFrame) -> dict[str, tuple]:
+    """
+    ایندکس «شماره چک تمیز شده → (کد مشتری، نام مشتری)» از فایل چک‌ها.
+    یک بار برای هر prepare_payments ساخته می‌شود تا جستجوی هر کاندیدا
+    به جای اسکن کل ستون چک‌ها یک lookup در دیکشنری باشد.
+    مثل قبل فقط اولین ردیف هر شماره چک ملاک است.
+    """
+    if checks_df is None or checks_df.empty or "CheckNumber" not in checks_df.columns:
+        return {}
+    # حذف کاراکترهای غیر عددی و صفر اول (همان تمیزکاری قبلی)
+    try:
+        chk_series_clean = (
+            checks_df["CheckNumber"]
+            .astype(str)
+            .str.replace(r"\D", "", regex=True)
+            .str.lstrip("0")
+        )
+    except:
+        return {}
+
+    first_rows = np.flatnonzero(
+        (chk_series_clean.notna() & (chk_series_clean != "")
+         & ~chk_series_clean.duplicated()).to_numpy(dtype=bool))
+    keys = chk_series_clean.to_numpy(dtype=object)[first_rows]
+    codes = (checks_df["CustomerCode"].to_numpy(dtype=object)[first_rows]
+             if "CustomerCode" in checks_df.columns else [None] * len(keys))
+    names = (checks_df["CustomerName"].to_numpy(dtype=object)[first_rows]
+             if "CustomerName" in checks_df.columns else [None] * len(keys))
+    return {
+        key: (_check_cell_code(code), _check_cell_name(name))
+        for key, code, name in zip(keys, codes, names)
+    }
+
+
 def extract_customer_for_payment(
     row: pd.Series,
     checks_df: pd.DataFrame,
     db_map: dict = None,
-    bind_map: dict = None
+    bind_map: dict = None,
+    check_index: dict = None,
+    reference: ReferenceData = None
 ) -> str | None:
     """
     نسخه اصلاح شده و ایمن برای تشخیص کد مشتری.
     دقیقاً بر اساس منطق کدی که قبلاً درست کار می‌کرد.
+    check_index: خروجی build_check_index؛ اگر داده نشود از checks_df ساخته می‌شود.
+    reference: اگر داده شود، مپ‌ها و ایندکس چک‌ها از آن برداشته می‌شوند.
     """
+    if reference is not None:
+        db_map = reference.name_code_map if db_map is None else db_map
+        bind_map = reference.bind_map if bind_map is None else bind_map
+        check_index = reference.check_index if check_index is None else check_index
     stype = row.get("SourceType", "Payment")
     name = row.get("CustomerName")
     desc_str = str(row.get("Description") or "")
@@ -491,46 +716,28 @@ def extract_customer_for_payment(
         for fn in found_nums:
             candidates.append(fn)
 
-        # --- بخش حیاتی: جستجو در دیتافریم چک‌ها (ایمن‌سازی شده) ---
-        # فقط اگر ستون CheckNumber در فایل چک‌ها وجود داشته باشد جستجو می‌کنیم
-        if "CheckNumber" in checks_df.columns:
-            # یک کپی تمیز از شماره چک‌ها برای مقایسه می‌سازیم (حذف کاراکترهای غیر عددی و صفر اول)
-            # استفاده از try/except برای جلوگیری از خطای غیرمنتظره
-            try:
-                chk_series_clean = (
-                    checks_df["CheckNumber"]
-                    .astype(str)
-                    .str.replace(r"\D", "", regex=True)
-                    .str.lstrip("0")
-                )
-            except:
-                chk_series_clean = pd.Series(dtype=str)
-
-            for cand in candidates:
-                # تمیز کردن کاندیدا
-                cand_clean = re.sub(r"\D", "", str(cand)).lstrip("0")
-                if not cand_clean:
-                    continue
-
-                # پیدا کردن ردیف‌های مشابه
-                matches_mask = (chk_series_clean == cand_clean)
-                matches = checks_df.loc[matches_mask]
-
-                if not matches.empty:
-                    chk_row = matches.iloc[0]
-
-                    # الف) اگر کد مشتری در فایل چک هست
-                    if "CustomerCode" in chk_row and pd.notna(chk_row["CustomerCode"]):
-                        found_code = str(chk_row["CustomerCode"]).strip()
-                        if found_code and found_code.lower() != 'nan':
-                            return canonicalize_code(found_code)
-
-                    # ب) اگر نام مشتری در فایل چک هست -> نام را آپدیت می‌کنیم تا در مرحله بعد (مپینگ) استفاده شود
-                    if "CustomerName" in chk_row and pd.notna(chk_row["CustomerName"]):
-                        chk_name = str(chk_row["CustomerName"]).strip()
-                        if chk_name:
-                            name = chk_name  # نام پیدا شده از چک جایگزین نام پرداخت می‌شود
-                            break  # نام پیدا شد، می‌رویم سراغ مرحله مپینگ نام
+        # --- بخش حیاتی: جستجو در ایندکس شماره چک‌ها ---
+        if check_index is None:
+            check_index = build_check_index(checks_df)
+
+        for cand in candidates:
+            # تمیز کردن کاندیدا
+            cand_clean = re.sub(r"\D", "", str(cand)).lstrip("0")
+            if not cand_clean:
+                continue
+
+            match = check_index.get(cand_clean)
+            if match is not None:
+                found_code, chk_name = match
+
+                # الف) اگر کد مشتری در فایل چک هست
+                if found_code:
+                    return canonicalize_code(found_code)
+
+                # ب) اگر نام مشتری در فایل چک هست -> نام را آپدیت می‌کنیم تا در مرحله بعد (مپینگ) استفاده شود
+                if chk_name:
+                    name = chk_name  # نام پیدا شده از چک جایگزین نام پرداخت می‌شود
+                    break  # نام پیدا شد، می‌رویم سراغ مرحله مپینگ نام
 
     # --- استراتژی ۲ و ۳: مپینگ بر اساس نام (چه نام فایل اصلی، چه نام پیدا شده از چک) ---
     if pd.notna(name):
@@ -557,49 +764,174 @@ def extract_customer_for_payment(
     return None
 
 
-def prepare_payments(payments_df: pd.DataFrame, checks_df: pd.DataFrame, sales_df: pd.DataFrame) -> tuple[pd.DataFrame, list[dict]]:
+def _column_or(df: pd.DataFrame, col: str, default) -> pd.Series:
+    if col in df.columns:
+        return df[col]
+    return pd.Series(default, index=df.index, dtype=object)
+
+
+def _valid_code_mask(values: pd.Series) -> np.ndarray:
+    """همان شرط «کد معتبر» قبلی: خالی نباشد، فقط فاصله نباشد و 'nan' نباشد."""
+    codes, uniques = pd.factorize(values)
+    stripped = [str(u).strip() for u in uniques]
+    valid = np.array([bool(v) and v.lower() != "nan" for v in stripped]
+                     + [False], dtype=bool)
+    return valid[codes]
+
+
+def _match_check_candidates(payments_df: pd.DataFrame, check_index: dict) -> tuple[pd.Series, pd.Series]:
+    """
+    مرحله ۱ (فقط پرداخت‌های چک): استخراج کاندیداها به صورت ستونی و
+    اتصال به ایندکس چک‌ها.
+    خروجی: (کد پیدا شده از چک، نام پیدا شده از چک) برای هر ردیف.
+    """
+    n = len(payments_df)
+    chk_code = pd.Series([None] * n, index=payments_df.index, dtype=object)
+    chk_name = chk_code.copy()
+    if not check_index:
+        return chk_code, chk_name
+
+    is_check = (_column_or(payments_df, "SourceType", "Payment")
+                == "Check").to_numpy(dtype=bool)
+    rows = np.flatnonzero(is_check)
+    if len(rows) == 0:
+        return chk_code, chk_name
+    checks = payments_df.iloc[rows]
+
+    # کاندیداها به ترتیب قبلی: اول ستون CheckNumber، بعد اعداد ۳ تا ۱۰ رقمی توضیحات
+    parts = []
+    if "CheckNumber" in checks.columns:
+        valid = _valid_code_mask(checks["CheckNumber"])
+        parts.append(pd.DataFrame({
+            "row": rows[valid],
+            "order": -1,
+            "cand": checks["CheckNumber"].to_numpy(dtype=object)[valid],
+        }))
+    if "Description" in checks.columns:
+        desc = checks["Description"].astype(object)
+        # مثل str(x or "")؛ NaN به رشته 'nan' تبدیل می‌شود
+        desc = desc.where(desc.notna() & desc.astype(bool), "")
+        desc = pd.Series(desc.map(str).to_numpy(dtype=object), index=rows)
+        found = desc.str.extractall(r"(\d{3,10})")
+        if not found.empty:
+            parts.append(pd.DataFrame({
+                "row": found.index.get_level_values(0).to_numpy(),
+                "order": found.index.get_level_values(1).to_numpy(),
+                "cand": found[0].to_numpy(dtype=object),
+            }))
+    if not parts:
+        return chk_code, chk_name
+
+    cands = pd.concat(parts, ignore_index=True).sort_values(
+        ["row", "order"], kind="stable")
+    cleaned = (cands["cand"].map(str).astype(object)
+               .str.replace(r"\D", "", regex=True).str.lstrip("0"))
+    matched = cleaned.map(check_index)
+    # اولین کاندیدایی که در چک‌ها کد یا نام دارد، تکلیف ردیف را مشخص می‌کند
+    useful = matched.map(lambda m: isinstance(m, tuple) and any(m))
+    hits = matched[useful.to_numpy(dtype=bool)]
+    hits = hits[~cands.loc[hits.index, "row"].duplicated().to_numpy()]
+    hit_rows = cands.loc[hits.index, "row"].to_numpy()
+
+    codes = np.array([m[0] for m in hits], dtype=object)
+    names = np.array([m[1] for m in hits], dtype=object)
+    chk_code.iloc[hit_rows] = codes
+    # نام چک فقط وقتی جایگزین می‌شود که کد نداشته باشد
+    chk_name.iloc[hit_rows] = np.where(pd.isna(codes), names, None)
+    return chk_code, chk_name
+
+
+def resolve_payment_customers(
+    payments_df: pd.DataFrame,
+    check_index: dict,
+    db_map: dict = None,
+    bind_map: dict = None
+) -> pd.Series:
+    """
+    نسخه ستونی extract_customer_for_payment برای کل دیتافریم پرداخت‌ها.
+    مراحل (به همان ترتیب اولویت قبلی):
+      ۱. شماره چک (ستون CheckNumber و توضیحات) → ایندکس چک‌ها
+      ۲. کلید نام (نام پرداخت یا نام پیدا شده از چک) → bind_map
+      ۳. همان کلید → db_map
+      ۴. کد مشتری خود ردیف پرداخت
+    خروجی: کد استاندارد مشتری برای هر ردیف (None = پیدا نشد).
+    """
+    chk_code, chk_name = _match_check_candidates(payments_df, check_index)
+
+    names = _column_or(payments_df, "CustomerName", None).astype(object)
+    names = chk_name.where(chk_name.notna(), names)
+    keys = name_key_series(names)
+
+    result = canonicalize_code_series(chk_code).astype(object)
+    decided = chk_code.notna().to_numpy(copy=True)
+
+    # مرحله ۲ و ۳: اگر کلید در مپ باشد، مقدار آن نهایی است (حتی اگر خالی باشد)
+    for mapping in (bind_map, db_map):
+        if not mapping:
+            continue
+        in_map = (keys.isin(mapping.keys()) & (keys != "")).to_numpy() & ~decided
+        if in_map.any():
+            result[in_map] = canonicalize_code_series(
+                keys[in_map].map(mapping)).to_numpy(dtype=object)
+            decided |= in_map
+
+    # مرحله ۴
+    raw_codes = _column_or(payments_df, "CustomerCode", None)
+    use_raw = _valid_code_mask(raw_codes) & ~decided
+    if use_raw.any():
+        result[use_raw] = canonicalize_code_series(
+            raw_codes[use_raw]).to_numpy(dtype=object)
+    return result
+
+
+def prepare_payments(payments_df: pd.DataFrame, checks_df: pd.DataFrame, sales_df: pd.DataFrame,
+                     reference: ReferenceData = None) -> tuple[pd.DataFrame, list[dict]]:
     payments_df = payments_df.copy()
     if "PaymentDate" in payments_df.columns:
-        payments_df["PaymentDate"] = payments_df["PaymentDate"].apply(
-            parse_jalali_or_gregorian)
+        payments_df["PaymentDate"] = parse_jalali_series(
+            payments_df["PaymentDate"])
     if "Amount" not in payments_df.columns:
         raise ValueError("ستون Amount در فایل پرداخت‌ها یافت نشد.")
     payments_df["Amount"] = payments_df["Amount"].astype(float)
     if "CustomerName" not in payments_df.columns:
         payments_df["CustomerName"] = None
 
-    bind_map = load_name_code_map_from_excel()
-    db_map = build_name_code_map_from_balances()
-    unresolved_items = []
-
-    def resolve_logic(row):
-        code = extract_customer_for_payment(
-            row, checks_df, db_map=db_map, bind_map=bind_map)
-        if pd.isna(code):
-            unresolved_items.append({
-                "Name": row.get("CustomerName"),
-                "Amount": row.get("Amount"),
-                "Date": row.get("PaymentDate"),
-                "Source": row.get("SourceType", "Payment")
-            })
-            return "یافت نشد"
-        return code
-
-    payments_df["ResolvedCustomer"] = payments_df.apply(resolve_logic, axis=1)
-
-    def clean_key(val):
-        if val == "یافت نشد":
-            return None
-        return canonicalize_code(val)
-    payments_df["ResolvedCustomerKey"] = payments_df["ResolvedCustomer"].map(
-        clean_key)
+    if reference is not None:
+        bind_map = reference.bind_map
+        db_map = reference.name_code_map
+        check_index = reference.check_index
+    else:
+        bind_map = load_name_code_map_from_excel()
+        db_map = build_name_code_map_from_balances()
+        check_index = build_check_index(checks_df)
+
+    codes = resolve_payment_customers(
+        payments_df, check_index, db_map=db_map, bind_map=bind_map)
+    unresolved = codes.isna()
+    unresolved_items = pd.DataFrame({
+        "Name": payments_df["CustomerName"],
+        "Amount": payments_df["Amount"],
+        "Date": _column_or(payments_df, "PaymentDate", None),
+        "Source": _column_or(payments_df, "SourceType", "Payment"),
+    })[unresolved].to_dict(orient="records")
+
+    # نوع ستون مثل قبل از روی مقادیر تعیین می‌شود (رشته)
+    payments_df["ResolvedCustomer"] = pd.Series(
+        np.where(unresolved, "یافت نشد", codes.to_numpy(dtype=object)),
+        index=payments_df.index)
+
+    resolved = payments_df["ResolvedCustomer"]
+    payments_df["ResolvedCustomerKey"] = canonicalize_code_series(
+        resolved.mask(resolved == "یافت نشد"))
     return payments_df, unresolved_items
 
 
-def build_name_code_map_from_balances() -> dict[str, str]:
-    balances = load_balances_from_db()
+def build_name_code_map_from_balances(balances: list[dict] = None, blacklists: tuple = None) -> dict[str, str]:
+    if balances is None:
+        balances = load_balances_from_db()
     name_to_code = {}
-    banned_codes, banned_names = load_blacklist_sets()
+    banned_codes, banned_names = (blacklists if blacklists is not None
+                                  else load_blacklist_sets())
     for item in balances:
         name = item.get("CustomerName")
         code = item.get("CustomerCode")
@@ -617,12 +949,17 @@ def build_name_code_map_from_balances() -> dict[str, str]:
 
 
 def load_name_code_map_from_excel() -> dict[str, str]:
-    file_path = "customer_codes_bind.xlsx"
+    return _cached_config("name_code_bind", NAME_CODE_BIND_PATH,
+                          _read_name_code_map_from_excel)
+
+
+def _read_name_code_map_from_excel() -> dict[str, str]:
+    file_path = NAME_CODE_BIND_PATH
     name_to_code = {}
     if not os.path.exists(file_path):
         return name_to_code
     try:
-        df = pd.read_excel(file_path)
+        df = read_table(file_path)
         if "CustomerName" in df.columns and "CustomerCode" in df.columns:
             for _, row in df.iterrows():
                 name = str(row.get("CustomerName", "")).strip()
@@ -640,15 +977,12 @@ def build_name_code_mapping(sales_df: pd.DataFrame) -> dict[str, str]:
     if "CustomerName" not in sales_df.columns or "CustomerCode" not in sales_df.columns:
         return {}
     tmp = sales_df[["CustomerName", "CustomerCode"]].dropna()
-    name_to_codes: dict[str, set[str]] = {}
-    for _, row in tmp.iterrows():
-        key = name_key_for_matching(row["CustomerName"])
-        code = canonicalize_code(row["CustomerCode"])
-        if not key or not code:
-            continue
-        name_to_codes.setdefault(key, set()).add(code)
-    result: dict[str, str] = {}
-    for key, codes in name_to_codes.items():
-        if len(codes) == 1:
-            result[key] = next(iter(codes))
-    return result
+    pairs = pd.DataFrame({
+        "key": name_key_series(tmp["CustomerName"]),
+        "code": canonicalize_code_series(tmp["CustomerCode"]),
+    })
+    pairs = pairs[(pairs["key"] != "") & pairs["code"].notna()
+                  & (pairs["code"] != "")].drop_duplicates()
+    # فقط اسم‌هایی که دقیقاً به یک کد می‌خورند
+    pairs = pairs[~pairs["key"].duplicated(keep=False)]
+    return dict(zip(pairs["key"], pairs["code"]))
@@ -1,4 +1,5 @@
 # app/services/customer_balances.py
+import numpy as np
 import pandas as pd
 import os
 import re
@@ -7,9 +8,15 @@ from typing import List, Dict
 
 # لودر اختصاصی چک‌ها را ایمپورت می‌کنیم
 from app.services.checks_excel_loader import load_checks_excel
+from app.services.excel_reader import peek_rows, read_region
+from app.services import balances_store
+from app.services.helpers import map_unique
 
 # مسیر فایل‌های ذخیره شده
-BALANCES_DB_PATH = "customer_balances_db.xlsx"
+# مانده‌ها در SQLite (balances_store) نگه داشته می‌شوند؛
+# این فایل اکسل فقط منبع انتقال اولیه است (خروجی در آن نوشته نمی‌شود،
+# وگرنه با ساخت دوباره دیتابیس دوباره وارد می‌شد).
+BALANCES_DB_PATH = balances_store.LEGACY_BALANCES_XLSX
 CHECKS_DB_PATH = "customer_checks_db.xlsx"
 
 # ---------------------------------------------------------
@@ -51,21 +58,84 @@ def normalize_name(name: str) -> str:
     return n.strip()
 
 
+def normalize_names(values) -> pd.Series:
+    """
+    نسخه ستونی normalize_name (همان خروجی برای هر خانه)،
+    با عملیات رشته‌ای pandas به جای حلقه روی ردیف‌ها.
+    """
+    values = values if isinstance(values, pd.Series) else pd.Series(values, dtype=object)
+    text = map_unique(values, str).str.strip()
+    is_none = pd.Series([v is None for v in values], index=values.index, dtype=bool)
+    blank = is_none | (text == "") | (text.str.lower() == "nan")
+
+    n = (
+        text.str.replace("ي", "ی", regex=False)
+        .str.replace("ك", "ک", regex=False)
+        .str.replace("\u200c", " ", regex=False)
+        .str.replace("\xa0", " ", regex=False)
+        .str.replace("(", " ( ", regex=False)
+        .str.replace(")", " ) ", regex=False)
+        # معادل حلقه حذف فاصله‌های تکراری
+        .str.replace(r" {2,}", " ", regex=True)
+        .str.strip()
+    )
+    return n.where(~blank, "").astype(object)
+
+
+# انواعی که مستقیم عدد هستند (bool با وجود int بودن، عدد حساب نمی‌شود)
+_NUMBER_TYPES = (int, float, np.integer, np.floating)
+
+
+def _is_number_type(t: type) -> bool:
+    return issubclass(t, _NUMBER_TYPES) and not issubclass(t, (bool, np.bool_))
+
+
+def _to_float(text: str) -> float:
+    try:
+        return float(text)
+    except ValueError:
+        return 0.0
+
+
+def _parse_amounts(values: pd.Series) -> pd.Series:
+    """
+    معادل ستونی float(str(v).replace(",", "").replace("،", "")) برای هر خانه؛
+    خانه خالی یا غیرعددی صفر می‌شود.
+    خانه‌های عددی مستقیم با to_numeric تبدیل می‌شوند (to_numeric روی متن
+    همیشه دقیقاً همان float پایتون را نمی‌دهد)، متن‌ها بعد از حذف جداکننده
+    هزارگان فقط یک بار برای هر مقدار یکتا با float خوانده می‌شوند.
+    """
+    kinds = values.map(type)
+    is_number = map_unique(kinds, _is_number_type).astype(bool)
+    is_text = map_unique(kinds, lambda t: issubclass(t, str)).astype(bool)
+
+    amounts = pd.Series(0.0, index=values.index)
+    if is_number.any():
+        amounts[is_number] = pd.to_numeric(values[is_number]).astype(float).fillna(0.0)
+    if is_text.any():
+        text = (values[is_text].astype(object)
+                .str.replace(",", "", regex=False)
+                .str.replace("،", "", regex=False))
+        amounts[is_text] = map_unique(text, _to_float).astype(float)
+    return amounts
+
+
 def load_balances_from_excel(file_path_or_buffer) -> list[dict]:
     """
     خواندن فایل اکسل مانده حساب (فرمت پیچیده دو ردیفه).
     این تابع فقط زمان آپلود استفاده می‌شود.
     """
+    # ایندکس ردیف‌ها
+    row_main_header = 4
+    row_sub_header = 5
+
+    # اول فقط ردیف‌های هدر (استریم)، بعد فقط ستون‌های لازم از ناحیه داده
     try:
-        df_raw = pd.read_excel(file_path_or_buffer, header=None)
+        head_rows = peek_rows(file_path_or_buffer, row_sub_header + 1)
     except Exception as e:
         print(f"Error reading balances file: {e}")
         return []
 
-    # ایندکس ردیف‌ها
-    row_main_header = 4
-    row_sub_header = 5
-
     def fix_yek(text):
         if text is None:
             return ""
@@ -77,9 +147,9 @@ def load_balances_from_excel(file_path_or_buffer) -> list[dict]:
     col_debit = None
     col_credit = None
 
-    if len(df_raw) > row_sub_header:
-        for c_idx in range(len(df_raw.columns)):
-            val_sub = fix_yek(df_raw.iloc[row_sub_header, c_idx])
+    if len(head_rows) > row_sub_header:
+        for c_idx, cell in enumerate(head_rows[row_sub_header]):
+            val_sub = fix_yek(cell)
             if "شرح" in val_sub:
                 col_name = c_idx
             clean_val = val_sub.strip().lower()
@@ -96,112 +166,116 @@ def load_balances_from_excel(file_path_or_buffer) -> list[dict]:
     if col_name is None:
         return []
 
-    balances_list = []
     data_start_row = row_sub_header + 1
+    # col_code منفی (شرح در ستون اول) یعنی ستون آخر، مثل iloc
+    usecols = None if col_code is not None and col_code < 0 else sorted({
+        c for c in (col_name, col_code, col_debit, col_credit) if c is not None})
+    try:
+        df_raw = read_region(
+            file_path_or_buffer, skiprows=data_start_row, usecols=usecols,
+            label="balances")
+    except Exception as e:
+        print(f"Error reading balances file: {e}")
+        return []
+    if col_code is not None and col_code < 0:
+        width = max(len(head_rows[0]), len(df_raw.columns))
+        df_raw = df_raw.reindex(columns=range(width))
+        col_code = width + col_code
+
+    raw_names = df_raw[col_name]
+    original_names = map_unique(raw_names, lambda v: str(v).strip())
+    norm_names = normalize_names(raw_names)
+
+    # === اصلاح ۱: نادیده گرفتن ردیف جمع از فایل ورودی ===
+    keep = (norm_names != "") & ~norm_names.str.contains("جمع", regex=False)
+    # =================================================
+
+    if col_code is not None:
+        codes = df_raw[col_code]
+        code_text = map_unique(codes, lambda v: str(v).strip()).str.removesuffix(".0")
+        code_text = code_text.where(codes.notna(), "")
+    else:
+        code_text = pd.Series("", index=df_raw.index, dtype=object)
 
-    for r_idx in range(data_start_row, len(df_raw)):
-        raw_name = df_raw.iloc[r_idx, col_name]
-        norm_name = normalize_name(raw_name)
-
-        # === اصلاح ۱: نادیده گرفتن ردیف جمع از فایل ورودی ===
-        if not norm_name or "جمع" in norm_name:
-            continue
-        # =================================================
-
-        raw_code = ""
-        if col_code is not None:
-            val_code = df_raw.iloc[r_idx, col_code]
-            if pd.notna(val_code):
-                temp_str = str(val_code).strip()
-                if temp_str.endswith(".0"):
-                    raw_code = temp_str[:-2]
-                else:
-                    raw_code = temp_str
-
-        debit_val = 0.0
-        credit_val = 0.0
-
-        if col_debit is not None:
-            d_val = df_raw.iloc[r_idx, col_debit]
-            if pd.notna(d_val):
-                try:
-                    debit_val = float(str(d_val).replace(
-                        ",", "").replace("،", ""))
-                except:
-                    pass
-
-        if col_credit is not None:
-            c_val = df_raw.iloc[r_idx, col_credit]
-            if pd.notna(c_val):
-                try:
-                    credit_val = float(str(c_val).replace(
-                        ",", "").replace("،", ""))
-                except:
-                    pass
-
-        net_balance = credit_val - debit_val
-
-        balances_list.append({
-            "CustomerCode": raw_code,
-            "CustomerName": norm_name,
-            "OriginalName": str(raw_name).strip(),
-            "Balance": net_balance
-        })
-
-    return balances_list
+    zeros = pd.Series(0.0, index=df_raw.index)
+    debit = _parse_amounts(df_raw[col_debit]) if col_debit is not None else zeros
+    credit = _parse_amounts(df_raw[col_credit]) if col_credit is not None else zeros
 
+    balances = pd.DataFrame({
+        "CustomerCode": code_text,
+        "CustomerName": norm_names,
+        "OriginalName": original_names,
+        "Balance": credit - debit,
+    })[keep.to_numpy(dtype=bool)]
 
-def save_balances_to_db(data: list[dict]):
-    """ذخیره لیست استاندارد شده در فایل دیتابیس اکسلی."""
-    if not data:
-        return
-    df = pd.DataFrame(data)
+    return balances.to_dict(orient="records")
 
-    # ستون‌های مورد نیاز (RawBalance اضافه شد)
-    cols = ["CustomerCode", "CustomerName", "OriginalName",
-            "Balance", "RawBalance", "PendingChecks"]
 
-    # ایجاد ستون‌های خالی اگر وجود ندارند
-    for c in cols:
-        if c not in df.columns:
-            df[c] = None
+def _raw_balance_of(item: dict) -> float:
+    """مانده خام: RawBalance اگر باشد، وگرنه Balance."""
+    raw_balance = item.get("RawBalance")
+    if raw_balance is None or str(raw_balance) == "" or str(raw_balance) == "nan":
+        return float(item.get("Balance", 0) or 0)
+    return float(raw_balance)
 
-    # مرتب‌سازی ستون‌ها برای زیبایی فایل اکسل
-    df = df[cols]
 
+def save_balances_to_db(data: list[dict]):
+    """جایگزینی کامل لیست مانده‌ها در دیتابیس (ردیف جمع ذخیره نمی‌شود)."""
+    if isinstance(data, pd.DataFrame):
+        data = data.where(pd.notnull(data), None).to_dict(orient="records")
+    items = [
+        {**item, "RawBalance": _raw_balance_of(item)}
+        for item in (data or [])
+        if str(item.get("CustomerName", "")) != "جمع"
+    ]
     try:
-        df.to_excel(BALANCES_DB_PATH, index=False)
+        balances_store.replace_balances(items)
     except Exception as e:
-        print(f"Error saving DB excel: {e}")
+        print(f"Error saving balances DB: {e}")
 
 
 def update_balances(new_items: list[dict]):
-    """آپدیت دیتابیس مانده‌ها با داده‌های جدید."""
-
-    # خواندن دیتابیس فعلی
-    current_data = []
-    if os.path.exists(BALANCES_DB_PATH):
-        try:
-            current_data = pd.read_excel(
-                BALANCES_DB_PATH).to_dict(orient="records")
-        except:
-            pass
-
-    current_map = {str(item.get("CustomerName"))
-                       : item for item in current_data}
-
-    # جایگزینی یا افزودن
+    """آپدیت دیتابیس مانده‌ها با داده‌های جدید (درج یا جایگزینی بر اساس نام)."""
     for item in new_items:
-        key = item["CustomerName"]
-
         # نکته مهم: وقتی از فایل مانده جدید می‌خوانیم، مقدار Balance در واقع همان RawBalance است
         # پس آن را به عنوان RawBalance ست می‌کنیم
         item["RawBalance"] = item["Balance"]
 
-        current_map[key] = item
+    try:
+        balances_store.upsert_balances(new_items)
+    except Exception as e:
+        print(f"Error updating balances DB: {e}")
+
+
+def update_balance_entry(old_name: str, code, name: str, balance: float) -> bool:
+    """ویرایش یک ردیف (شناسایی با نام فعلی)؛ مانده وارد شده مانده خام است."""
+    return balances_store.update_balance_by_name(normalize_name(old_name), {
+        "CustomerCode": str(code).strip(),
+        "CustomerName": normalize_name(name),
+        "OriginalName": str(name).strip(),
+        "RawBalance": balance,
+    })
+
+
+def delete_balance_entries(code: str = None, name: str = None) -> bool:
+    """حذف ردیف‌ها بر اساس کد (در اولویت) یا نام."""
+    deleted = balances_store.delete_balances(
+        code=code, name=normalize_name(name) if name else None)
+    return deleted > 0
 
-    # به جای ذخیره مستقیم، از تابع محاسبه‌گر استفاده می‌کنیم
-    recalculate_and_save_db(list(current_map.values()))
+
+def clear_all_balances():
+    balances_store.clear_balances()
+
+
+def balances_export_frame() -> pd.DataFrame:
+    """
+    جدول خروجی مانده‌ها (همراه با ردیف جمع) با همان ستون‌های فایل قدیمی.
+    فایل اکسل آن به صورت جریانی ساخته می‌شود (result_export) و روی دیسک نوشته نمی‌شود.
+    """
+    cols = ["CustomerCode", "CustomerName", "OriginalName",
+            "Balance", "RawBalance", "PendingChecks"]
+    return pd.DataFrame(load_balances_from_db(), columns=cols)
 
 
 # ---------------------------------------------------------
@@ -220,57 +294,104 @@ def save_raw_checks_file(file_content_stream):
         print(f"Error saving checks file: {e}")
         return False
 
-# این تابع را جایگزین تابع قبلی get_pending_checks_deductions کنید
+# جمع چک‌های در جریان فقط وقتی فایل چک‌ها عوض شود دوباره محاسبه می‌شود:
+# حافظه (همین پروسه) ← جدول SQLite ← محاسبه از روی فایل
+_PENDING_CHECKS_CACHE: dict = {"fingerprint": None, "totals": {}}
 
 
-def get_pending_checks_deductions() -> dict[str, float]:
-    """
-    فایل چک‌های ذخیره شده را می‌خواند و مجموع چک‌های 'در جریان'
-    را برای هر مشتری (بر اساس صاحب حساب) برمی‌گرداند.
-    """
-    deductions = {}
-
-    # 1. بررسی و خواندن فایل چک
-    if not os.path.exists(CHECKS_DB_PATH):
-        return deductions
-
+def _checks_file_fingerprint() -> str | None:
     try:
-        with open(CHECKS_DB_PATH, "rb") as f:
-            checks_df = load_checks_excel(f)
-    except Exception as e:
-        print(f"Error loading checks file: {e}")
-        return deductions
+        st = os.stat(CHECKS_DB_PATH)
+    except OSError:
+        return None
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
 
+def compute_pending_checks(checks_df: pd.DataFrame) -> dict[str, float]:
+    """
+    مجموع چک‌های 'در جریان' برای هر مشتری (بر اساس صاحب حساب)،
+    به صورت برداری با groupby.
+    """
     if checks_df.empty:
-        return deductions
+        return {}
 
-    # 2. منطق اصلی: اولویت با 'CustomerName' (صاحب حساب) است
+    # اولویت با 'CustomerName' (صاحب حساب) است
     # اگر ستون صاحب حساب نبود، سراغ 'AccountName' (طرف حساب) می‌رویم
     target_col = "CustomerName" if "CustomerName" in checks_df.columns else "AccountName"
 
     # اطمینان از وجود ستون‌های ضروری
     if target_col not in checks_df.columns or "Status" not in checks_df.columns or "Amount" not in checks_df.columns:
-        return deductions
+        return {}
+
+    # بررسی وضعیت در جریان (شامل ی عربی و فارسی)
+    status = checks_df["Status"].astype(object).map(str)
+    pending = (status.str.contains("در جریان", regex=False)
+               | status.str.contains("در جريان", regex=False))
+    pending_df = checks_df.loc[pending.to_numpy(dtype=bool)]
+    if pending_df.empty:
+        return {}
+
+    # نرمال‌سازی نام فقط روی مقادیر یکتا
+    codes, uniques = pd.factorize(pending_df[target_col].astype(object).map(str))
+    names = pd.Series([normalize_name(u) for u in uniques], dtype=object)
+    norm_names = names.to_numpy()[codes]
+
+    totals = (
+        pd.Series(pending_df["Amount"].to_numpy(), index=norm_names)
+        .loc[norm_names != ""]
+        .groupby(level=0, sort=False)
+        .sum()
+    )
+    return totals.to_dict()
+
+
+def refresh_pending_checks() -> dict[str, float]:
+    """
+    محاسبه دوباره جمع چک‌ها از روی فایل ذخیره شده و ذخیره آن در دیتابیس.
+    (بعد از آپلود فایل چک یا وقتی فایل تغییر کرده باشد)
+    """
+    fingerprint = _checks_file_fingerprint()
+    if fingerprint is None:
+        _PENDING_CHECKS_CACHE.update(fingerprint=None, totals={})
+        return {}
 
-    # 3. محاسبه کسورات
-    for _, row in checks_df.iterrows():
-        status = str(row["Status"])
+    try:
+        with open(CHECKS_DB_PATH, "rb") as f:
+            checks_df = load_checks_excel(f)
+    except Exception as e:
+        print(f"Error loading checks file: {e}")
+        return {}
 
-        # بررسی وضعیت در جریان (شامل ی عربی و فارسی)
-        if "در جریان" in status or "در جريان" in status:
-            # خواندن نام از ستون تشخیص داده شده
-            raw_name = str(row[target_col])
-            amount = row["Amount"]
+    totals = compute_pending_checks(checks_df)
+    try:
+        balances_store.save_pending_checks(fingerprint, totals)
+    except Exception as e:
+        print(f"Error saving pending checks: {e}")
+    _PENDING_CHECKS_CACHE.update(fingerprint=fingerprint, totals=totals)
+    return dict(totals)
 
-            norm_name = normalize_name(raw_name)
 
-            if norm_name:
-                if norm_name in deductions:
-                    deductions[norm_name] += amount
-                else:
-                    deductions[norm_name] = amount
+def get_pending_checks_deductions() -> dict[str, float]:
+    """
+    مجموع چک‌های 'در جریان' برای هر مشتری (بر اساس صاحب حساب).
+    فایل چک‌ها فقط وقتی دوباره خوانده می‌شود که تغییر کرده باشد.
+    """
+    fingerprint = _checks_file_fingerprint()
+    if fingerprint is None:
+        return {}
+    if _PENDING_CHECKS_CACHE["fingerprint"] == fingerprint:
+        return dict(_PENDING_CHECKS_CACHE["totals"])
 
-    return deductions
+    try:
+        totals = balances_store.load_pending_checks(fingerprint)
+    except Exception as e:
+        print(f"Error loading pending checks: {e}")
+        totals = None
+    if totals is None:
+        return refresh_pending_checks()
+
+    _PENDING_CHECKS_CACHE.update(fingerprint=fingerprint, totals=totals)
+    return dict(totals)
 
 # ---------------------------------------------------------
 # بخش ۳: تابع اصلی فراخوانی (ترکیب مانده و چک)
@@ -282,16 +403,13 @@ def load_balances_from_db() -> list[dict]:
     خواندن مانده‌ها جهت نمایش در UI.
     محاسبه دقیق جمع کل بر اساس داده‌های فیلتر شده.
     """
-    if not os.path.exists(BALANCES_DB_PATH):
-        return []
-
     try:
-        df_bal = pd.read_excel(BALANCES_DB_PATH)
-        df_bal = df_bal.where(pd.notnull(df_bal), None)
-        raw_balances = df_bal.to_dict(orient="records")
+        raw_balances = balances_store.fetch_balances()
     except Exception as e:
         print(f"Error loading balances DB: {e}")
         return []
+    if not raw_balances:
+        return []
 
     checks_map = get_pending_checks_deductions()
 
@@ -309,10 +427,7 @@ def load_balances_from_db() -> list[dict]:
         if cust_name == "جمع":
             continue
 
-        if item.get("RawBalance") is not None:
-            raw_balance = float(item.get("RawBalance"))
-        else:
-            raw_balance = float(item.get("Balance", 0))
+        raw_balance = float(item["RawBalance"])
 
         pending_amount = checks_map.get(cust_name, 0.0)
         effective_balance = raw_balance - pending_amount
@@ -323,7 +438,7 @@ def load_balances_from_db() -> list[dict]:
         new_item["PendingChecks"] = pending_amount
 
         new_item["display_code"] = item.get("CustomerCode", "")
-        new_item["name"] = item.get("OriginalName", cust_name)
+        new_item["name"] = item.get("OriginalName") or cust_name
         new_item["balance_fmt"] = "{:,.0f}".format(effective_balance)
         new_item["color"] = "#10b981" if effective_balance >= 0 else "#ef4444"
 
@@ -359,45 +474,29 @@ def add_customer_mapping(name: str, code: str, balance: float = 0):
     norm_name = normalize_name(name)
     clean_code = str(code).strip()
 
-    # این تابع محاسبه شده برمیگرداند، اما برای ذخیره باید خام را آپدیت کنیم
-    current = load_balances_from_db()
-    # بهتر است فایل خام را مستقیم بخوانیم:
-    if os.path.exists(BALANCES_DB_PATH):
-        raw_data = pd.read_excel(BALANCES_DB_PATH).to_dict(orient="records")
-    else:
-        raw_data = []
-
-    # آپدیت یا افزودن در لیست خام
-    found = False
-    for item in raw_data:
-        if item.get("CustomerName") == norm_name:
-            item["CustomerCode"] = clean_code
-            item["OriginalName"] = name
-            item["Balance"] = balance
-            found = True
-            break
-
-    if not found:
-        raw_data.append({
-            "CustomerCode": clean_code,
-            "CustomerName": norm_name,
-            "OriginalName": name,
-            "Balance": balance
-        })
-
-    save_balances_to_db(raw_data)
+    # درج یا آپدیت همان ردیف (بر اساس نام نرمال شده)
+    balances_store.upsert_balances([{
+        "CustomerCode": clean_code,
+        "CustomerName": norm_name,
+        "OriginalName": name,
+        "RawBalance": balance
+    }])
     return True
 
 
 def save_raw_checks_file(file_content_stream):
-    """ذخیره فایل چک‌ها و بروزرسانی بلافاصله فایل مانده‌ها."""
+    """
+    ذخیره فایل چک‌ها و محاسبه جمع چک‌های در جریان هر مشتری.
+    کسر چک‌ها هنگام خواندن مانده‌ها انجام می‌شود، پس نیازی به بازنویسی
+    دیتابیس مانده‌ها نیست.
+    """
     try:
         file_content_stream.seek(0)
         with open(CHECKS_DB_PATH, "wb") as buffer:
             shutil.copyfileobj(file_content_stream, buffer)
 
-        # ==> تغییر مهم: بلافاصله بعد از ذخیره چک، مانده‌ها را در دیتابیس بازنویسی می‌کنیم
-        recalculate_and_save_db()
+        # جمع چک‌های در جریان همین‌جا یک بار محاسبه و ذخیره می‌شود
+        refresh_pending_checks()
 
         return True
     except Exception as e:
@@ -407,74 +506,9 @@ def save_raw_checks_file(file_content_stream):
 
 def recalculate_and_save_db(data_list: list[dict] = None):
     """
-    این تابع داده‌ها را می‌گیرد، چک‌های در جریان را از آن کم می‌کند
-    و در فایل اکسل ذخیره می‌کند. همچنین ردیف جمع را محاسبه می‌کند.
+    مانده نهایی و چک‌های در جریان هنگام خواندن (load_balances_from_db)
+    محاسبه می‌شوند و دیگر ذخیره نمی‌شوند؛ این تابع فقط لیست داده شده را
+    (در صورت وجود) جایگزین داده‌های دیتابیس می‌کند.
     """
-    if data_list is None:
-        if os.path.exists(BALANCES_DB_PATH):
-            try:
-                df = pd.read_excel(BALANCES_DB_PATH)
-                data_list = df.to_dict(orient="records")
-            except:
-                data_list = []
-        else:
-            data_list = []
-
-    if not data_list:
-        return
-
-    checks_map = get_pending_checks_deductions()
-
-    processed_data = []
-
-    # متغیرهای محاسبه جمع کل
-    total_raw = 0.0
-    total_pending = 0.0
-    total_balance = 0.0
-
-    for item in data_list:
-        norm_name = str(item.get("CustomerName", ""))
-
-        # حذف ردیف‌های جمع قدیمی برای جلوگیری از دوبله شدن
-        if norm_name == "جمع":
-            continue
-
-        # تعیین مانده خام
-        raw_balance = item.get("RawBalance")
-        if raw_balance is None or str(raw_balance) == "" or str(raw_balance) == "nan":
-            raw_balance = float(item.get("Balance", 0))
-        else:
-            raw_balance = float(raw_balance)
-
-        # محاسبه مبلغ چک
-        pending_amount = checks_map.get(norm_name, 0.0)
-
-        # مانده نهایی (پس از کسر چک)
-        final_balance_for_excel = raw_balance - pending_amount
-
-        # آپدیت آیتم
-        item["RawBalance"] = raw_balance
-        item["Balance"] = final_balance_for_excel
-        item["PendingChecks"] = pending_amount
-
-        # افزودن به جمع کل
-        total_raw += raw_balance
-        total_pending += pending_amount
-        total_balance += final_balance_for_excel
-
-        processed_data.append(item)
-
-    # === اصلاح ۲: افزودن ردیف جمع نهایی به انتهای لیست ===
-    # این باعث می‌شود فایل اکسل دارای یک ردیف جمع صحیح باشد
-    processed_data.append({
-        "CustomerCode": "",
-        "CustomerName": "جمع",
-        "OriginalName": "جمع کل",
-        "RawBalance": total_raw,      # جمع ستون خام
-        "PendingChecks": total_pending,  # جمع ستون چک‌ها
-        # جمع ستون خالص (که مشکل شما را حل می‌کند)
-        "Balance": total_balance
-    })
-    # ====================================================
-
-    save_balances_to_db(processed_data)
+    if data_list:
+        save_balances_to_db(data_list)
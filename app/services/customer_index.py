@@ -0,0 +1,83 @@
+# app/services/customer_index.py
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+# کلید نگهداری ایندکس‌ها در DataFrame.attrs
+ATTRS_KEY = "customer_index"
+
+
+class CustomerIndex:
+    """
+    ایندکس «کلید مشتری → موقعیت ردیف‌ها» برای یک دیتافریم.
+
+    موقعیت ردیف‌ها بر اساس کلید گروه‌بندی و پشت سر هم چیده می‌شوند
+    (آرایه positions) و offsets مرز هر مشتری را نگه می‌دارد؛ بنابراین
+    پیدا کردن ردیف‌های یک مشتری به جای اسکن کل ستون، یک lookup است.
+    ترتیب ردیف‌های هر مشتری همان ترتیب اصلی دیتافریم است.
+    """
+
+    def __init__(self, keys: list, positions: np.ndarray, offsets: np.ndarray, labels: pd.Index):
+        self.keys = keys
+        self.positions_array = positions
+        self.offsets = offsets
+        self.labels = labels
+        self._lookup = {k: i for i, k in enumerate(keys)}
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, column: str = "CustomerKey") -> "CustomerIndex":
+        """ساخت ایندکس در یک گذر خطی (factorize + مرتب‌سازی پایدار)."""
+        if column in df.columns:
+            codes, uniques = pd.factorize(df[column])
+        else:
+            codes, uniques = np.full(len(df), -1, dtype=np.intp), []
+        valid = np.flatnonzero(codes >= 0)
+        positions = valid[np.argsort(codes[valid], kind="stable")]
+        counts = np.bincount(codes[valid], minlength=len(uniques))
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        return cls(list(uniques), positions, offsets, df.index)
+
+    @classmethod
+    def of(cls, df: pd.DataFrame, column: str = "CustomerKey") -> "CustomerIndex":
+        """
+        ایندکس ذخیره شده روی دیتافریم (در attrs) را برمی‌گرداند؛
+        اگر وجود نداشت یا با ردیف‌های فعلی نمی‌خواند، دوباره می‌سازد.
+        """
+        cached = df.attrs.get(ATTRS_KEY, {}).get(column)
+        if cached is not None and cached.matches(df):
+            return cached
+        return attach_customer_index(df, column)
+
+    def matches(self, df: pd.DataFrame) -> bool:
+        if len(self.labels) != len(df):
+            return False
+        return df.index is self.labels or df.index.equals(self.labels)
+
+    def positions(self, key) -> np.ndarray:
+        """موقعیت (iloc) ردیف‌های یک مشتری؛ اگر نبود آرایه خالی."""
+        i = self._lookup.get(key)
+        if i is None:
+            return self.positions_array[:0]
+        return self.positions_array[self.offsets[i]:self.offsets[i + 1]]
+
+    def items(self):
+        for i, key in enumerate(self.keys):
+            yield key, self.positions_array[self.offsets[i]:self.offsets[i + 1]]
+
+    def __contains__(self, key) -> bool:
+        return key in self._lookup
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __deepcopy__(self, memo):
+        # ایندکس تغییرناپذیر است؛ pandas هنگام کپی attrs نباید آن را کپی کند
+        return self
+
+
+def attach_customer_index(df: pd.DataFrame, column: str = "CustomerKey") -> CustomerIndex:
+    """ساخت ایندکس و ذخیره آن در df.attrs برای استفاده‌های بعدی."""
+    index = CustomerIndex.build(df, column)
+    df.attrs[ATTRS_KEY] = {**df.attrs.get(ATTRS_KEY, {}), column: index}
+    return index
@@ -0,0 +1,143 @@
+# app/services/customer_stats.py
+from __future__ import annotations
+
+import json
+
+import numpy as np
+import pandas as pd
+
+from app.services.customer_index import CustomerIndex
+from app.services.helpers import to_jalali_series
+
+# کلید نگهداری آمار مشتریان در DataFrame.attrs
+ATTRS_KEY = "customer_stats"
+
+
+def _dumps(payload: dict) -> bytes:
+    # همان تنظیمات JSONResponse در starlette
+    return json.dumps(
+        payload, ensure_ascii=False, allow_nan=False,
+        indent=None, separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def empty_stats_payload(code_key) -> dict:
+    """آمار مشتری بدون فاکتور."""
+    return {
+        "customerCode": code_key,
+        "customerName": "",
+        "points": [],
+        "totals": {"amount": 0, "paid": 0, "remaining": 0},
+    }
+
+
+class CustomerStatsStore:
+    """
+    آمار از پیش ساخته نمودار هر مشتری (نقاط فاکتورها به ترتیب تاریخ، جمع‌ها
+    و نام) برای /customer-stats.
+
+    بعد از محاسبه پورسانت یک بار روی کل sales_result ساخته می‌شود (با همان
+    CustomerIndex) و پاسخ JSON هر مشتری از قبل سریال شده است؛ هر درخواست
+    فقط یک lookup در دیکشنری است.
+    """
+
+    def __init__(self, payloads: dict, labels: pd.Index):
+        self.payloads = payloads
+        self.labels = labels
+
+    @classmethod
+    def build(cls, sales_result: pd.DataFrame) -> "CustomerStatsStore":
+        index = CustomerIndex.of(sales_result)
+        positions = index.positions_array
+        if not len(positions) or "InvoiceDate" not in sales_result.columns:
+            return cls({}, sales_result.index)
+
+        # ترتیب نقاط هر مشتری: تاریخ فاکتور (NaT آخر)، با حفظ ترتیب اصلی برابرها
+        dates = pd.to_datetime(
+            sales_result["InvoiceDate"].iloc[positions], errors="coerce")
+        date_keys = dates.to_numpy().astype("datetime64[us]").view("i8").copy()
+        date_keys[dates.isna().to_numpy()] = np.iinfo(np.int64).max
+        counts = np.diff(index.offsets)
+        groups = np.repeat(np.arange(len(index.keys)), counts)
+        order = positions[np.lexsort((date_keys, groups))]
+
+        rows = sales_result.iloc[order]
+        labels = to_jalali_series(rows["InvoiceDate"]).tolist()
+
+        def column(name):
+            if name not in rows.columns:
+                return [0.0] * len(rows)
+            values = pd.to_numeric(rows[name], errors="coerce").astype(float)
+            return values.fillna(0.0).tolist()
+
+        amounts, paids, remainings = column("Amount"), column("PaidAmount"), column("Remaining")
+        invoice_ids = (rows["InvoiceID"].astype(object).where(rows["InvoiceID"].notna(), None).tolist()
+                       if "InvoiceID" in rows.columns else [None] * len(rows))
+        names = (rows["CustomerName"].tolist()
+                 if "CustomerName" in rows.columns else [""] * len(rows))
+
+        payloads = {}
+        for i, key in enumerate(index.keys):
+            start, end = index.offsets[i], index.offsets[i + 1]
+            points = [
+                {
+                    "date": labels[j],
+                    "amount": amounts[j],
+                    "paid": paids[j],
+                    "remaining": remainings[j],
+                    "invoice_id": invoice_ids[j],
+                }
+                for j in range(start, end)
+            ]
+            name = names[start]
+            payloads[key] = _dumps({
+                "customerCode": key,
+                "customerName": "" if pd.isna(name) else str(name),
+                "points": points,
+                "totals": {
+                    "amount": sum(p["amount"] for p in points),
+                    "paid": sum(p["paid"] for p in points),
+                    "remaining": sum(p["remaining"] for p in points),
+                },
+            })
+        return cls(payloads, sales_result.index)
+
+    @classmethod
+    def of(cls, sales_result: pd.DataFrame) -> "CustomerStatsStore":
+        """
+        آمار ذخیره شده روی دیتافریم (در attrs)؛ اگر نبود (مثلاً دیتافریم از
+        کش دیسکی نشست خوانده شده) یا با ردیف‌ها نمی‌خواند، دوباره ساخته می‌شود.
+        """
+        cached = sales_result.attrs.get(ATTRS_KEY)
+        if cached is not None and cached.matches(sales_result):
+            return cached
+        return attach_customer_stats(sales_result)
+
+    def matches(self, df: pd.DataFrame) -> bool:
+        if len(self.labels) != len(df):
+            return False
+        return df.index is self.labels or df.index.equals(self.labels)
+
+    def payload(self, code_key) -> bytes:
+        """پاسخ JSON سریال شده یک مشتری (مشتری بدون فاکتور → نقاط خالی)."""
+        cached = self.payloads.get(code_key)
+        if cached is not None:
+            return cached
+        return _dumps(empty_stats_payload(code_key))
+
+    def __contains__(self, code_key) -> bool:
+        return code_key in self.payloads
+
+    def __len__(self) -> int:
+        return len(self.payloads)
+
+    def __deepcopy__(self, memo):
+        # تغییرناپذیر است؛ pandas هنگام کپی attrs نباید آن را کپی کند
+        return self
+
+
+def attach_customer_stats(sales_result: pd.DataFrame) -> CustomerStatsStore:
+    """ساخت آمار مشتریان و ذخیره آن در sales_result.attrs."""
+    store = CustomerStatsStore.build(sales_result)
+    sales_result.attrs[ATTRS_KEY] = store
+    return store
@@ -0,0 +1,280 @@
+# app/services/excel_reader.py
+"""
+لایه مشترک خواندن فایل‌های اکسل ورودی.
+
+لودرها اول چند ردیف ابتدای شیت را به صورت استریم (openpyxl در حالت
+read-only) نگاه می‌کنند تا ساختار و ردیف هدر را پیدا کنند، بعد فقط
+ناحیه داده (ستون‌ها و ردیف‌های لازم) را یک بار با pandas می‌خوانند؛
+به جای این‌که کل شیت با header=None خوانده و دوباره اسکن شود.
+شماره ردیف و ستون‌ها همان شماره‌گذاری pd.read_excel(header=None) است.
+
+اگر python-calamine نصب باشد، خواندن با موتور calamine انجام می‌شود
+(چند برابر سریع‌تر از openpyxl) و در صورت خطا به openpyxl برمی‌گردد؛
+خروجی pandas برای هر دو موتور یکسان است (تبدیل خانه‌ها در pandas انجام می‌شود)؛
+فقط متن‌های فقط-فاصله را calamine خالی می‌کند، پس چنین فایل‌هایی با openpyxl
+خوانده می‌شوند.
+"""
+from __future__ import annotations
+
+import os
+import re
+import time
+import weakref
+import zipfile
+from collections import deque
+from functools import lru_cache
+from typing import IO, Any
+
+import openpyxl
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+try:
+    import python_calamine  # noqa: F401  موتور اختیاری
+except ImportError:
+    python_calamine = None
+
+# تعداد ردیف‌هایی که برای پیدا کردن هدر بررسی می‌شوند
+HEADER_SCAN_ROWS = 40
+
+# موتور سریع (در صورت نصب) و موتور پشتیبان pandas
+FAST_ENGINE = "calamine"
+FALLBACK_ENGINE = "openpyxl"
+
+# متن فقط فاصله در جدول رشته‌های مشترک xlsx (calamine آن را "" برمی‌گرداند)
+_BLANK_TEXT_PATTERN = re.compile(rb"<t(?:\s[^>]*)?>\s+</t>")
+_INLINE_STR_PATTERN = re.compile(rb"inlineStr")
+# اندازه تکه‌های خواندن از zip و طول همپوشانی بین تکه‌ها در جستجو
+_SCAN_CHUNK_BYTES = 1024 * 1024
+_SCAN_OVERLAP_BYTES = 4096
+# نتیجه بررسی متن فقط-فاصله برای فایل‌های باز (مثل UploadFile.file)
+_BLANK_TEXT_FILES: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+# زمان خواندن آخرین فایل‌ها: {"file", "engine", "seconds", "rows"}
+READ_TIMINGS: deque = deque(maxlen=200)
+
+
+def _rewind(file_obj) -> None:
+    # ورودی می‌تواند مسیر فایل یا فایل باز (مثل UploadFile.file) باشد
+    if hasattr(file_obj, "seek"):
+        file_obj.seek(0)
+
+
+def _file_label(file_obj) -> str:
+    if isinstance(file_obj, (str, os.PathLike)):
+        return os.fspath(file_obj)
+    name = getattr(file_obj, "name", None)
+    return name if isinstance(name, str) else type(file_obj).__name__
+
+
+def _zip_member_matches(zf: zipfile.ZipFile, name: str, pattern: re.Pattern) -> bool:
+    """
+    جستجوی الگو در یک فایل داخل zip به صورت تکه تکه (بدون باز کردن کل آن در حافظه).
+    انتهای هر تکه نگه داشته می‌شود تا الگویی که روی مرز دو تکه افتاده گم نشود.
+    """
+    tail = b""
+    with zf.open(name) as member:
+        while True:
+            chunk = member.read(_SCAN_CHUNK_BYTES)
+            if not chunk:
+                return False
+            buf = tail + chunk
+            if pattern.search(buf):
+                return True
+            tail = buf[-_SCAN_OVERLAP_BYTES:]
+
+
+def _scan_blank_text(file_obj) -> bool:
+    _rewind(file_obj)
+    try:
+        with zipfile.ZipFile(file_obj) as zf:
+            for name in zf.namelist():
+                if name.endswith("sharedStrings.xml"):
+                    if _zip_member_matches(zf, name, _BLANK_TEXT_PATTERN):
+                        return True
+                elif name.startswith("xl/worksheets/") and name.endswith(".xml"):
+                    if _zip_member_matches(zf, name, _INLINE_STR_PATTERN):
+                        return True
+    except (zipfile.BadZipFile, OSError, TypeError):
+        # xls/xlsb یا ورودی غیر فایل: فقط calamine می‌تواند بخواند
+        return False
+    finally:
+        _rewind(file_obj)
+    return False
+
+
+@lru_cache(maxsize=256)
+def _path_has_blank_text(path: str, mtime_ns: int, size: int) -> bool:
+    return _scan_blank_text(path)
+
+
+def _has_blank_text(file_obj) -> bool:
+    """
+    آیا فایل xlsx خانه متنی فقط-فاصله (مثل " ") دارد؟
+    calamine این خانه‌ها را خالی (NaN) برمی‌گرداند ولی openpyxl متن را نگه
+    می‌دارد؛ برای یکسان ماندن خروجی، چنین فایل‌هایی با openpyxl خوانده می‌شوند.
+    رشته‌های inline (نادر) هم با احتیاط همین حالت حساب می‌شوند.
+    نتیجه برای هر فایل فقط یک بار حساب می‌شود (لودرها چند بار read_excel می‌زنند).
+    """
+    if isinstance(file_obj, (str, os.PathLike)):
+        path = os.fspath(file_obj)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        return _path_has_blank_text(path, st.st_mtime_ns, st.st_size)
+    try:
+        return _BLANK_TEXT_FILES[file_obj]
+    except KeyError:
+        pass
+    except TypeError:
+        # شیء بدون پشتیبانی weakref: بدون کش
+        return _scan_blank_text(file_obj)
+    result = _scan_blank_text(file_obj)
+    _BLANK_TEXT_FILES[file_obj] = result
+    return result
+
+
+def excel_engines(file_obj: IO[Any] = None) -> list[str]:
+    """موتورهای قابل استفاده (برای این فایل) به ترتیب اولویت."""
+    if python_calamine is None:
+        return [FALLBACK_ENGINE]
+    if file_obj is not None and _has_blank_text(file_obj):
+        return [FALLBACK_ENGINE, FAST_ENGINE]
+    return [FAST_ENGINE, FALLBACK_ENGINE]
+
+
+def read_excel(file_obj: IO[Any], label: str = None, **kwargs) -> pd.DataFrame:
+    """
+    pd.read_excel با موتور سریع و بازگشت خودکار به openpyxl.
+    زمان خواندن هر فایل در READ_TIMINGS ثبت می‌شود (/excel-read-timings).
+    """
+    label = label or _file_label(file_obj)
+    engines = excel_engines(file_obj)
+    for engine in engines:
+        _rewind(file_obj)
+        started = time.perf_counter()
+        try:
+            df = pd.read_excel(file_obj, engine=engine, **kwargs)
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            if engine == engines[-1]:
+                raise
+            print(f"WARNING: {engine} failed to read {label} ({e}); falling back.")
+            continue
+        finally:
+            _rewind(file_obj)
+        seconds = time.perf_counter() - started
+        READ_TIMINGS.append({
+            "file": label, "engine": engine,
+            "seconds": round(seconds, 4), "rows": len(df),
+        })
+        return df
+
+
+def read_timings() -> list[dict]:
+    return list(READ_TIMINGS)
+
+
+def peek_rows(file_obj: IO[Any], n_rows: int = HEADER_SCAN_ROWS) -> list[list]:
+    """
+    خواندن n_rows ردیف اول شیت اول (بدون خواندن بقیه فایل).
+    همه ردیف‌ها هم‌طول می‌شوند و خانه‌های خالی None هستند.
+    فایل‌هایی که openpyxl نمی‌شناسد (xls/xlsb) با موتور سریع خوانده می‌شوند.
+    """
+    _rewind(file_obj)
+    try:
+        wb = openpyxl.load_workbook(
+            file_obj, read_only=True, data_only=True, keep_links=False)
+    except Exception:
+        if python_calamine is None:
+            raise
+        head = read_excel(file_obj, header=None, nrows=n_rows, dtype=object)
+        rows = [[None if pd.isna(v) else v for v in r]
+                for r in head.itertuples(index=False)]
+    else:
+        try:
+            ws = wb.worksheets[0]
+            # مثل pandas: ابعاد ذخیره شده در فایل همیشه قابل اعتماد نیست
+            ws.reset_dimensions()
+            rows = [list(r) for r in ws.iter_rows(max_row=n_rows, values_only=True)]
+        finally:
+            wb.close()
+    _rewind(file_obj)
+    width = max((len(r) for r in rows), default=0)
+    return [r + [None] * (width - len(r)) for r in rows]
+
+
+def find_row(rows: list[list], keywords: list[str], limit: int = HEADER_SCAN_ROWS) -> int | None:
+    """شماره اولین ردیفی که در یکی از خانه‌هایش یکی از کلمات آمده باشد."""
+    for i, row in enumerate(rows[:limit]):
+        for val in row:
+            if val is None:
+                continue
+            text = str(val)
+            if any(kw in text for kw in keywords):
+                return i
+    return None
+
+
+def read_region(
+    file_obj: IO[Any],
+    skiprows: int = 0,
+    usecols: list[int] | None = None,
+    dtype=object,
+    label: str = None,
+) -> pd.DataFrame:
+    """
+    خواندن ناحیه داده شیت اول از ردیف skiprows به بعد، بدون هدر.
+    برچسب ستون‌ها همان شماره ستون در شیت است (حتی وقتی usecols داده شود).
+    dtype پیش‌فرض object است تا مقادیر همان چیزی باشند که خواندن کل
+    شیت (که ردیف‌های متنی هدر ستون‌ها را object می‌کرد) برمی‌گرداند.
+    """
+    df = read_excel(
+        file_obj, label, header=None, skiprows=skiprows, usecols=usecols, dtype=dtype)
+    if usecols is not None:
+        # ناحیه خالی (مثلاً هدر در آخرین ردیف) هیچ ستونی برنمی‌گرداند
+        df = df.reindex(columns=list(usecols))
+    return df
+
+
+@lru_cache(maxsize=4096)
+def _is_text_cell(value: str) -> bool:
+    """آیا pandas این مقدار را متن (نه عدد و نه خالی/NaN) حساب می‌کند؟"""
+    parsed = TextParser([[value]], header=None).read()[0]
+    return parsed.notna().all() and not pd.api.types.is_numeric_dtype(parsed.dtype)
+
+
+@lru_cache(maxsize=1)
+def _text_column_dtype():
+    """dtype ستونی که فقط متن دارد در خروجی read_excel (str در pandas 3)."""
+    return TextParser([["x"]], header=None).read()[0].dtype
+
+
+def match_sheet_dtypes(df: pd.DataFrame, head_rows: list[list], skiprows: int) -> pd.DataFrame:
+    """
+    dtype ستون‌های ناحیه‌ای که با read_region (object) خوانده شده را
+    همان چیزی می‌کند که خواندن کل شیت با header=None می‌داد؛ در آن حالت
+    ردیف‌های بالای ناحیه (عنوان و هدر) هم در استنتاج نوع ستون شرکت داشتند.
+    """
+    df = df.copy()
+    text_dtype = _text_column_dtype()
+    for col in df.columns:
+        top = [row[col] for row in head_rows[:skiprows] if col < len(row)]
+        if any(isinstance(v, str) and _is_text_cell(v) for v in top):
+            # متن بالای ستون جلوی تبدیل عددی را می‌گیرد: فقط متن → str، وگرنه object
+            values = df[col].dropna()
+            if values.empty or pd.api.types.infer_dtype(values) == "string":
+                df[col] = df[col].astype(text_dtype)
+        else:
+            # حالت نادر (ستون بدون عنوان): همان استنتاج pandas روی کل ستون
+            values = top + [None] * (skiprows - len(top)) + df[col].tolist()
+            parsed = TextParser([[v] for v in values], header=None).read()[0]
+            df[col] = parsed.iloc[skiprows:].set_axis(df.index)
+    return df
+
+
+def read_table(file_obj: IO[Any], label: str = None, **kwargs) -> pd.DataFrame:
+    """خواندن ساده شیت اول با هدر معمولی (ردیف اول، یا header داده شده)."""
+    return read_excel(file_obj, label, **kwargs)
@@ -1,7 +1,9 @@
 import re
 import jdatetime
+import numpy as np
 import pandas as pd
 from datetime import datetime
+from functools import lru_cache
 
 # ------------------ توابع تاریخ ------------------ #
 
@@ -56,9 +58,150 @@ def to_jalali_str(ts):
     except Exception:
         return str(ts.date())
 
+# ------------------ تبدیل برداری تاریخ (ستونی) ------------------ #
+
+# بازه سال‌های شمسی که جدول تبدیل برایشان از پیش ساخته می‌شود
+JALALI_TABLE_MIN_YEAR = 1300
+JALALI_TABLE_MAX_YEAR = 1500
+
+_JALALI_DATE_RE = re.compile(r"^(\d{4})[/-](\d{1,2})[/-](\d{1,2})$")
+# روز اول هر ماه شمسی نسبت به اول فروردین
+_JALALI_MONTH_OFFSETS = np.array(
+    [0, 31, 62, 93, 124, 155, 186, 216, 246, 276, 306, 336])
+# ordinal میلادی 1970/01/01 (مبدأ datetime64)
+_EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+_US_PER_DAY = 86_400_000_000
+_NAT_INT = np.iinfo(np.int64).min
+
+
+@lru_cache(maxsize=1)
+def _jalali_year_starts() -> np.ndarray:
+    """
+    جدول ordinal میلادیِ اول فروردین هر سال شمسی در بازه جدول
+    (یک عنصر اضافه برای محاسبه طول سال آخر). فقط یک بار ساخته می‌شود.
+    """
+    return np.array([
+        jdatetime.date(y, 1, 1).togregorian().toordinal()
+        for y in range(JALALI_TABLE_MIN_YEAR, JALALI_TABLE_MAX_YEAR + 2)
+    ], dtype=np.int64)
+
+
+def _jalali_to_ordinal(year: int, month: int, day: int):
+    """تبدیل تاریخ شمسی به ordinal میلادی با جدول؛ تاریخ نامعتبر → None."""
+    starts = _jalali_year_starts()
+    i = year - JALALI_TABLE_MIN_YEAR
+    year_len = starts[i + 1] - starts[i]
+    if not 1 <= month <= 12:
+        return None
+    if month <= 6:
+        month_len = 31
+    elif month <= 11:
+        month_len = 30
+    else:
+        month_len = 30 if year_len == 366 else 29
+    if not 1 <= day <= month_len:
+        return None
+    return int(starts[i] + _JALALI_MONTH_OFFSETS[month - 1] + day - 1)
+
+
+def _parse_unique_date(value) -> int:
+    """
+    همان منطق parse_jalali_or_gregorian برای یک مقدار یکتا،
+    ولی با خروجی int64 (میکروثانیه از 1970) و تبدیل شمسی از روی جدول.
+    """
+    if not isinstance(value, (pd.Timestamp, datetime)):
+        m = _JALALI_DATE_RE.match(str(value).strip())
+        if m:
+            year, month, day = (int(g) for g in m.groups())
+            if JALALI_TABLE_MIN_YEAR <= year <= JALALI_TABLE_MAX_YEAR:
+                ordinal = _jalali_to_ordinal(year, month, day)
+                if ordinal is None:
+                    return _NAT_INT
+                return (ordinal - _EPOCH_ORDINAL) * _US_PER_DAY
+    ts = parse_jalali_or_gregorian(value)
+    if pd.isna(ts):
+        return _NAT_INT
+    return int(ts.to_datetime64().astype("datetime64[us]").view("i8"))
+
+
+def parse_jalali_series(values) -> pd.Series:
+    """
+    نسخه ستونی parse_jalali_or_gregorian:
+    ستون factorize می‌شود و فقط مقادیر یکتا (معمولاً چند صد تاریخ) تبدیل می‌شوند؛
+    تاریخ‌های شمسی با جدول از پیش ساخته (بدون ساختن jdatetime) به میلادی می‌روند.
+    خروجی: Series از نوع datetime64 با همان ایندکس ورودی.
+    """
+    values = values if isinstance(values, pd.Series) else pd.Series(values)
+    codes, uniques = pd.factorize(values)
+    converted = np.array([_parse_unique_date(u)
+                         for u in uniques] + [_NAT_INT], dtype=np.int64)
+    result = converted[codes].view("datetime64[us]")
+    return pd.Series(result, index=values.index, name=values.name)
+
+
+def _format_unique_jalali(value) -> str:
+    """همان منطق to_jalali_str برای یک مقدار یکتا، با تبدیل از روی جدول."""
+    if isinstance(value, (pd.Timestamp, datetime, np.datetime64)):
+        ordinal = pd.Timestamp(value).date().toordinal()
+        starts = _jalali_year_starts()
+        i = int(np.searchsorted(starts, ordinal, side="right")) - 1
+        if 0 <= i < len(starts) - 1:
+            doy = ordinal - int(starts[i])
+            if doy < 186:
+                month, day = doy // 31 + 1, doy % 31 + 1
+            else:
+                month, day = (doy - 186) // 30 + 7, (doy - 186) % 30 + 1
+            return f"{JALALI_TABLE_MIN_YEAR + i:04d}/{month:02d}/{day:02d}"
+    return to_jalali_str(value)
+
+
+def to_jalali_series(values) -> pd.Series:
+    """
+    نسخه ستونی to_jalali_str برای رندر کل یک ستون تاریخ به شمسی.
+    فقط مقادیر یکتا تبدیل می‌شوند؛ مقادیر خالی → رشته خالی.
+    """
+    values = values if isinstance(values, pd.Series) else pd.Series(values)
+    codes, uniques = pd.factorize(values)
+    formatted = np.array([_format_unique_jalali(u)
+                         for u in uniques] + [""], dtype=object)
+    return pd.Series(formatted[codes], index=values.index, name=values.name)
+
 # ------------------ نرمال‌سازی اسم ------------------ #
 
 
+# جدول یکجای جایگزینی کاراکترها برای str.translate:
+# - ي/ی و ك/ک و ... → معادل فارسی
+# - نیم‌فاصله و علائم → فاصله
+# - حرکات → حذف
+_NAME_TRANSLATION = str.maketrans({
+    "ي": "ی",
+    "ك": "ک",
+    "ۀ": "ه",
+    "ة": "ه",
+    "ؤ": "و",
+    "إ": "ا",
+    "أ": "ا",
+    "ٱ": "ا",
+    "ئ": "ی",
+    "\u200c": " ",   # نیم‌فاصله
+    "،": " ",
+    ",": " ",
+    "-": " ",
+    "_": " ",
+    "ـ": " ",
+    **{chr(c): None for c in range(0x064B, 0x0660)},
+    "\u0670": None,
+    **{chr(c): None for c in range(0x06D6, 0x06EE)},
+})
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=65536)
+def _normalize_name_str(s: str) -> str:
+    s = s.translate(_NAME_TRANSLATION)
+    return _WHITESPACE_RE.sub(" ", s).strip().lower()
+
+
 def normalize_persian_name(s) -> str:
     """
     نرمال‌سازی اسم فارسی:
@@ -68,30 +211,7 @@ def normalize_persian_name(s) -> str:
     """
     if s is None or pd.isna(s):
         return ""
-    s = str(s).strip()
-    if not s:
-        return ""
-    replacements = {
-        "ي": "ی",
-        "ك": "ک",
-        "ۀ": "ه",
-        "ة": "ه",
-        "ؤ": "و",
-        "إ": "ا",
-        "أ": "ا",
-        "ٱ": "ا",
-        "ئ": "ی",
-        "‌": " ",   # نیم‌فاصله
-    }
-    for src, dst in replacements.items():
-        s = s.replace(src, dst)
-    # حذف حرکات
-    s = re.sub(r"[\u064B-\u065F\u0670\u06D6-\u06ED]", "", s)
-    # علائم به فاصله
-    for ch in ["،", ",", "-", "_", "ـ"]:
-        s = s.replace(ch, " ")
-    s = re.sub(r"\s+", " ", s).strip()
-    return s.lower()
+    return _normalize_name_str(str(s))
 
 
 def name_key_for_matching(s: str) -> str:
@@ -103,6 +223,47 @@ def name_key_for_matching(s: str) -> str:
     norm = normalize_persian_name(s)
     return norm.replace(" ", "")
 
+
+def normalize_name_series(values) -> pd.Series:
+    """
+    نسخه ستونی normalize_persian_name:
+    فقط مقادیر یکتا نرمال می‌شوند و نتیجه به ردیف‌ها برگردانده می‌شود.
+    مقادیر خالی → رشته خالی.
+    """
+    values = values if isinstance(values, pd.Series) else pd.Series(values)
+    codes, uniques = pd.factorize(values)
+    normalized = np.array([_normalize_name_str(str(u))
+                          for u in uniques] + [""], dtype=object)
+    return pd.Series(normalized[codes], index=values.index, name=values.name)
+
+
+def name_key_series(values) -> pd.Series:
+    """نسخه ستونی name_key_for_matching."""
+    values = values if isinstance(values, pd.Series) else pd.Series(values)
+    codes, uniques = pd.factorize(values)
+    keys = np.array([_normalize_name_str(str(u)).replace(" ", "")
+                    for u in uniques] + [""], dtype=object)
+    return pd.Series(keys[codes], index=values.index, name=values.name)
+
+
+def map_unique(values, func) -> pd.Series:
+    """
+    اعمال یک تابع تک‌مقداری روی ستون، فقط یک بار برای هر مقدار یکتا
+    (از جمله NaN/None که به خود func داده می‌شوند).
+    مقادیر هم‌ارز با نوع متفاوت (مثل 1 و True) جدا حساب می‌شوند تا
+    خروجی دقیقاً همان func(v) برای هر خانه باشد.
+    """
+    values = values if isinstance(values, pd.Series) else pd.Series(values)
+    arr = values.to_numpy(dtype=object)
+    value_codes, _ = pd.factorize(arr, use_na_sentinel=False)
+    type_codes, types = pd.factorize(
+        np.fromiter(map(type, arr), dtype=object, count=len(arr)))
+    keys = value_codes.astype(np.int64) * max(len(types), 1) + type_codes
+    uniq_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    mapped = np.empty(len(uniq_keys), dtype=object)
+    mapped[:] = [func(arr[i]) for i in first]
+    return pd.Series(mapped[inverse], index=values.index, name=values.name, dtype=object)
+
 # ------------------ توابع کد و عدد ------------------ #
 
 
@@ -126,6 +287,63 @@ def canonicalize_code(value):
     return s
 
 
+# کدهایی که بدون ابهام عدد صحیح‌اند (فقط رقم لاتین، با .0 اختیاری)
+_PLAIN_INT_CODE = r"[+-]?[0-9]+(?:\.0*)?"
+# بزرگ‌ترین بازه‌ای که float اعداد صحیح را دقیق نگه می‌دارد
+_EXACT_FLOAT_INT = 2 ** 53
+
+
+def _canonicalize_unique_codes(uniques) -> np.ndarray:
+    """
+    canonicalize_code روی مقادیر یکتای یک ستون (خروجی: آرایه object).
+    اعداد صحیح به صورت برداری تبدیل می‌شوند؛ بقیه (اعشاری، متن، ارقام
+    فارسی، اعداد خیلی بزرگ) به همان تابع تک‌مقداری سپرده می‌شوند تا
+    خروجی دقیقاً یکسان بماند.
+    """
+    n = len(uniques)
+    out = np.full(n, None, dtype=object)
+    if n == 0:
+        return out
+
+    if uniques.dtype.kind in "iuf":
+        nums = np.asarray(uniques, dtype=float)
+        pending = np.ones(n, dtype=bool)
+    else:
+        strs = pd.Series([str(u).strip() for u in uniques], dtype=object)
+        cleaned = strs.str.replace(",", "", regex=False)
+        plain = cleaned.str.fullmatch(_PLAIN_INT_CODE).to_numpy(dtype=bool)
+        nums = pd.to_numeric(cleaned.where(plain), errors="coerce").to_numpy(
+            dtype=float, na_value=np.nan)
+        pending = (strs != "").to_numpy()
+
+    with np.errstate(invalid="ignore"):
+        is_int = (np.isfinite(nums) & (np.floor(nums) == nums)
+                  & (np.abs(nums) < _EXACT_FLOAT_INT) & pending)
+    out[is_int] = nums[is_int].astype(np.int64).astype(str).astype(object)
+    for i in np.flatnonzero(pending & ~is_int):
+        out[i] = canonicalize_code(uniques[i])
+    return out
+
+
+def canonicalize_code_series(values, missing=None, as_category: bool = False) -> pd.Series:
+    """
+    نسخه ستونی canonicalize_code برای کل یک ستون کد.
+    خروجی هر خانه دقیقاً همان canonicalize_code است؛ خانه‌های خالی
+    (NaN/None) مقدار missing می‌گیرند.
+    as_category=True → ستون categorical (برای ستون‌های کد پرتکرار).
+    """
+    values = values if isinstance(values, pd.Series) else pd.Series(values)
+    codes, uniques = pd.factorize(values)
+    if isinstance(uniques, pd.Index):
+        uniques = uniques.array
+    canon = np.append(_canonicalize_unique_codes(uniques),
+                      np.array([missing], dtype=object))
+    result = pd.Series(canon[codes], index=values.index, name=values.name)
+    if as_category:
+        result = result.astype("category")
+    return result
+
+
 def format_number(value):
     """
     فرمت کردن عدد به صورت سه رقم سه رقم (مثلاً 1,000,000).
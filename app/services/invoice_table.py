@@ -0,0 +1,226 @@
+# app/services/invoice_table.py
+"""
+جدول فاکتورهای صفحه نتیجه پورسانت، صفحه به صفحه.
+
+به جای ساختن HTML همه فاکتورها (که برای فایل‌های بزرگ ده‌ها مگابایت می‌شد)
+صفحه نتیجه هر بار فقط یک صفحه از sales_result را می‌گیرد. فیلتر و مرتب‌سازی
+روی دیتافریم خام (عدد و تاریخ واقعی) انجام می‌شود و قالب‌بندی نمایشی
+(تاریخ شمسی، لینک مشتری، برچسب اولویت، ...) فقط روی ردیف‌های همان صفحه.
+"""
+from __future__ import annotations
+
+import html
+import math
+
+import numpy as np
+import pandas as pd
+
+from app.services.helpers import (
+    canonicalize_code,
+    canonicalize_code_series,
+    normalize_name_series,
+    normalize_persian_name,
+    parse_jalali_or_gregorian,
+    to_jalali_series,
+)
+
+# ستون‌های جدول فاکتورها به ترتیب نمایش (None = ستون گروه کالا)
+INVOICE_COLUMNS = [
+    "InvoiceID", "CustomerCode", "CustomerName", None, "Priority",
+    "InvoiceDate", "DueDate", "Amount", "PaidAmount", "Remaining",
+    "CommissionPercent", "CommissionAmount",
+]
+
+# ستون‌هایی که به صورت کد نمایش داده می‌شوند (بدون .0 و ...)
+CODE_COLUMNS = ["InvoiceID", "CustomerCode"]
+
+# ستون‌های مبلغ (گرد شده به ریال)
+AMOUNT_COLUMNS = ["Amount", "PaidAmount", "Remaining", "CommissionAmount"]
+
+PRIORITY_BADGES = {
+    "cash": '<span class="badge badge-priority-cash">نقدی</span>',
+    "normal": '<span class="badge badge-priority-normal">عادی</span>',
+}
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def invoice_columns(sales_result: pd.DataFrame, group_col: str | None) -> list[str]:
+    """ستون‌های قابل نمایش جدول فاکتورها (فقط آن‌هایی که در نتیجه هستند)."""
+    cols = [group_col if c is None else c for c in INVOICE_COLUMNS]
+    return [c for c in cols if c and c in sales_result.columns]
+
+
+def salesperson_options(sales_result: pd.DataFrame) -> list[str]:
+    """فهرست فروشنده‌ها برای فیلتر جدول."""
+    if sales_result is None or "Salesperson" not in sales_result.columns:
+        return []
+    names = sales_result["Salesperson"].dropna().astype(str).str.strip()
+    return sorted(n for n in names.unique() if n)
+
+
+def _parse_date(value, label: str):
+    ts = parse_jalali_or_gregorian(value)
+    if pd.isna(ts):
+        raise ValueError(f"تاریخ نامعتبر برای {label}: {value}")
+    return ts
+
+
+def filter_invoices(
+    sales_result: pd.DataFrame,
+    salesperson: str = None,
+    customer: str = None,
+    priority: str = None,
+    date_from: str = None,
+    date_to: str = None,
+) -> pd.DataFrame:
+    """
+    فیلتر فاکتورها. نام‌ها (فروشنده و مشتری) نرمال شده مقایسه می‌شوند (ي/ی، ك/ک).
+    customer هم با کد مشتری (دقیق) و هم با بخشی از نام مشتری تطبیق داده می‌شود.
+    تاریخ‌ها شمسی (1403/01/15) یا میلادی و شامل دو سر بازه هستند؛
+    تاریخ نامعتبر ValueError می‌دهد.
+    """
+    mask = np.ones(len(sales_result), dtype=bool)
+
+    if salesperson and "Salesperson" in sales_result.columns:
+        wanted = normalize_persian_name(salesperson)
+        mask &= (normalize_name_series(sales_result["Salesperson"]) == wanted).to_numpy()
+
+    if customer:
+        customer = customer.strip()
+        match = np.zeros(len(sales_result), dtype=bool)
+        if "CustomerName" in sales_result.columns:
+            names = normalize_name_series(sales_result["CustomerName"])
+            match |= names.str.contains(
+                normalize_persian_name(customer), regex=False).to_numpy()
+        if "CustomerKey" in sales_result.columns:
+            keys = sales_result["CustomerKey"]
+        elif "CustomerCode" in sales_result.columns:
+            keys = canonicalize_code_series(sales_result["CustomerCode"])
+        else:
+            keys = None
+        if keys is not None:
+            match |= (keys == canonicalize_code(customer)).to_numpy()
+        mask &= match
+
+    if priority and "Priority" in sales_result.columns:
+        mask &= (sales_result["Priority"] == priority).to_numpy()
+
+    if (date_from or date_to) and "InvoiceDate" in sales_result.columns:
+        dates = pd.to_datetime(sales_result["InvoiceDate"], errors="coerce")
+        if date_from:
+            mask &= (dates >= _parse_date(date_from, "از تاریخ")).to_numpy()
+        if date_to:
+            mask &= (dates <= _parse_date(date_to, "تا تاریخ")).to_numpy()
+
+    return sales_result[mask]
+
+
+def _sort_keys(values: pd.Series) -> list[pd.Series]:
+    """کلیدهای مرتب‌سازی یک ستون؛ ستون کدها (متن/عدد مخلوط) اول عددی، بعد متنی."""
+    if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_datetime64_any_dtype(values):
+        return [values]
+    text = canonicalize_code_series(values, missing="").astype(str)
+    return [pd.to_numeric(text, errors="coerce"), text]
+
+
+def sort_invoices(df: pd.DataFrame, column: str, descending: bool = False) -> pd.DataFrame:
+    """مرتب‌سازی پایدار (ترتیب اصلی ردیف‌های برابر حفظ می‌شود)؛ خالی‌ها همیشه آخر."""
+    keys = _sort_keys(df[column])
+    frame = pd.DataFrame({f"k{i}": k.to_numpy() for i, k in enumerate(keys)})
+    order = frame.sort_values(
+        list(frame.columns), ascending=not descending,
+        kind="mergesort", na_position="last").index.to_numpy()
+    return df.iloc[order]
+
+
+def format_invoice_rows(
+    page: pd.DataFrame, cols: list[str], group_col: str | None, use_chart: bool
+) -> list[list[str]]:
+    """
+    قالب‌بندی نمایشی ردیف‌های یک صفحه (HTML هر خانه).
+    متن‌ها escape می‌شوند؛ فقط لینک مشتری و برچسب اولویت HTML خود ما هستند.
+    """
+    view = pd.DataFrame(index=page.index)
+    for col in cols:
+        values = page[col]
+        if col in ("InvoiceDate", "DueDate"):
+            view[col] = to_jalali_series(values)
+        elif col in CODE_COLUMNS or col == group_col:
+            view[col] = canonicalize_code_series(values, missing="").map(
+                lambda v: html.escape(str(v)))
+        elif col in AMOUNT_COLUMNS:
+            view[col] = values.map(
+                lambda v: "" if pd.isna(v) else str(int(round(float(v)))))
+        elif col == "CommissionPercent":
+            view[col] = values.map(
+                lambda v: "" if pd.isna(v) else f"{round(float(v) * 100, 2):.2f}٪")
+        elif col == "Priority":
+            view[col] = values.map(lambda v: PRIORITY_BADGES.get(v, ""))
+        else:
+            view[col] = values.map(lambda v: "" if pd.isna(v) else html.escape(str(v)))
+
+    if "CustomerName" in cols:
+        codes = view["CustomerCode"] if "CustomerCode" in cols else pd.Series(
+            "", index=page.index)
+
+        def make_customer_link(name, code):
+            if pd.isna(name) or str(name).strip() == "":
+                return ""
+            name = html.escape(str(name))
+            if not use_chart:
+                return name
+            return (
+                f'<a href="#" class="customer-link" '
+                f'data-customer-code="{code}" '
+                f'data-customer-name="{name}">{name}</a>'
+            )
+        view["CustomerName"] = [
+            make_customer_link(n, c) for n, c in zip(page["CustomerName"], codes)]
+
+    return view[cols].values.tolist()
+
+
+def query_invoices(
+    sales_result: pd.DataFrame,
+    group_col: str | None,
+    page: int = 1,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    sort: str = None,
+    order: str = "asc",
+    use_chart: bool = False,
+    **filters,
+) -> dict:
+    """
+    یک صفحه از جدول فاکتورها: فیلتر، مرتب‌سازی، برش صفحه و قالب‌بندی همان صفحه.
+    filters همان آرگومان‌های filter_invoices است. ستون مرتب‌سازی نامعتبر
+    یا تاریخ نامعتبر ValueError می‌دهد.
+    """
+    cols = invoice_columns(sales_result, group_col)
+    page_size = min(max(int(page_size), 1), MAX_PAGE_SIZE)
+
+    df = filter_invoices(sales_result, **filters)
+    if sort:
+        if sort not in cols:
+            raise ValueError(f"ستون مرتب‌سازی نامعتبر: {sort}")
+        df = sort_invoices(df, sort, descending=(order == "desc"))
+
+    total = len(df)
+    pages = max(1, math.ceil(total / page_size))
+    page = min(max(int(page), 1), pages)
+    start = (page - 1) * page_size
+    rows = format_invoice_rows(
+        df.iloc[start:start + page_size], cols, group_col, use_chart)
+
+    return {
+        "columns": cols,
+        "rows": rows,
+        "total": total,
+        "total_unfiltered": len(sales_result),
+        "page": page,
+        "page_size": page_size,
+        "pages": pages,
+        "sort": sort,
+        "order": order,
+    }
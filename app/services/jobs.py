@@ -0,0 +1,154 @@
+# app/services/jobs.py
+"""
+صف کارهای پس‌زمینه داخل همین پروسه (بدون سرویس جانبی).
+
+درخواست HTTP فقط کار را ثبت می‌کند و شناسه آن را برمی‌گرداند؛ خود کار با
+run_blocking در استخر نخ‌های workers اجرا می‌شود و مرحله فعلی‌اش را گزارش
+می‌دهد. مرورگر وضعیت را با polling می‌خواند و بعد از اتمام، نتیجه را می‌بیند
+یا دانلود می‌کند. خود کار (تا JOB_TTL_SECONDS) فقط خروجی کوچک تابع را نگه
+می‌دارد؛ داده‌های حجیم نتیجه در نشست (SessionFrameStore) ذخیره می‌شوند تا
+سقف حافظه و کش دیسکی نشست‌ها برای آن‌ها هم برقرار باشد.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any
+
+from app.services.workers import run_blocking
+
+# کارهای تمام شده تا این مدت (ثانیه) نگه داشته می‌شوند
+JOB_TTL_SECONDS = 60 * 60
+# حداکثر کارهای نگه داشته شده (قدیمی‌ترین کارهای تمام شده اول حذف می‌شوند)
+MAX_JOBS = 20
+
+# وضعیت‌های کار
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class Job:
+    """یک کار پس‌زمینه و وضعیت/مرحله/نتیجه آن."""
+    id: str
+    kind: str
+    session_id: str | None
+    stages: list[str]
+    status: str = QUEUED
+    stage: str | None = None
+    error: str | None = None
+    created: float = field(default_factory=time.time)
+    started: float | None = None
+    finished: float | None = None
+    # {مرحله: زمان شروع}
+    stage_started: dict[str, float] = field(default_factory=dict)
+    # خروجی تابع کار (فقط بعد از DONE)؛ فقط ارجاع، نه دیتافریم یا پاسخ رندر شده
+    result: Any = None
+    # اطلاعات تشخیصی که خود کار گزارش می‌دهد (مثلاً زمان ساخت داده‌های مرجع)
+    details: dict = field(default_factory=dict)
+
+    def set_stage(self, stage: str) -> None:
+        """گزارش شروع یک مرحله (از داخل نخ کارگر صدا زده می‌شود)."""
+        self.stage = stage
+        self.stage_started[stage] = time.time()
+
+    def progress(self) -> float:
+        """کسر پیشرفت بر اساس تعداد مراحل تمام شده."""
+        if self.status == DONE:
+            return 1.0
+        if self.stage not in self.stages:
+            return 0.0
+        return self.stages.index(self.stage) / len(self.stages)
+
+    def to_dict(self) -> dict:
+        now = self.finished or time.time()
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "stages": list(self.stages),
+            "progress": round(self.progress(), 3),
+            "error": self.error,
+            "details": dict(self.details),
+            "elapsed_seconds": round(now - (self.started or now), 3),
+        }
+
+
+class JobManager:
+    """
+    ثبت، اجرا و نگهداری کارهای پس‌زمینه.
+    کارها با run_blocking اجرا می‌شوند، پس محدودیت همزمانی هر نوع کار
+    (JOB_LIMITS در workers) برای آن‌ها هم برقرار است.
+    """
+
+    def __init__(self, ttl_seconds: float = JOB_TTL_SECONDS, max_jobs: int = MAX_JOBS):
+        self.ttl_seconds = ttl_seconds
+        self.max_jobs = max_jobs
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        # تسک‌های asyncio در حال اجرا (تا garbage collect نشوند)
+        self._tasks: set = set()
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, func, *args, session_id: str = None,
+               stages: list[str] = (), **kwargs) -> Job:
+        """
+        ثبت کار و شروع آن در پس‌زمینه (باید داخل event loop صدا زده شود).
+        func با آرگومان اضافه job صدا زده می‌شود (برای گزارش مرحله با
+        job.set_stage) و خروجی‌اش در job.result ذخیره می‌شود.
+        """
+        job = Job(id=uuid.uuid4().hex, kind=kind,
+                  session_id=session_id, stages=list(stages))
+        with self._lock:
+            self._sweep()
+            self._jobs[job.id] = job
+        task = asyncio.get_running_loop().create_task(
+            self._run(job, func, args, kwargs))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job: Job, func, args, kwargs) -> None:
+        def call():
+            job.status = RUNNING
+            job.started = time.time()
+            return func(*args, job=job, **kwargs)
+
+        try:
+            job.result = await run_blocking(job.kind, call)
+            job.status = DONE
+        except Exception as e:
+            print(f"Error in background job {job.id} ({job.kind}): {e}")
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished = time.time()
+
+    def get(self, job_id: str, session_id: str = None) -> Job | None:
+        """کار با این شناسه؛ کار نشست دیگر پیدا نمی‌شود."""
+        with self._lock:
+            self._sweep()
+            job = self._jobs.get(job_id)
+        if job is None or (session_id is not None and job.session_id != session_id):
+            return None
+        return job
+
+    def _sweep(self) -> None:
+        """حذف کارهای تمام شده منقضی و نگه داشتن حداکثر max_jobs کار."""
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished is not None and now - job.finished > self.ttl_seconds:
+                del self._jobs[job_id]
+        finished = [j for j, job in self._jobs.items() if job.finished is not None]
+        for job_id in finished[:max(0, len(self._jobs) - self.max_jobs)]:
+            del self._jobs[job_id]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._jobs)
@@ -1,12 +1,24 @@
 # app/services/payments_excel_loader.py
 from __future__ import annotations
 
+import numpy as np
 import pandas as pd
-import re
 from typing import IO, Any
 
+from app.services.excel_reader import (
+    HEADER_SCAN_ROWS,
+    find_row,
+    peek_rows,
+    read_region,
+    read_table,
+)
+from app.services.helpers import map_unique
 
-def _find_first_col(row: pd.Series, keywords: list[str]) -> int | None:
+# کلمه‌ای که سطر متادیتای دفتر حساب بانکی را مشخص می‌کند
+BANK_META_KEYWORDS = ["كد طرف حساب", "کد طرف حساب"]
+
+
+def _find_first_col(row: list, keywords: list[str]) -> int | None:
     """
     در یک سطر، اولین ستونی که یکی از کلمات داده‌شده را دارد پیدا می‌کند.
     اگر پیدا نشد، None برمی‌گرداند.
@@ -19,33 +31,24 @@ def _find_first_col(row: pd.Series, keywords: list[str]) -> int | None:
     return None
 
 
-def _load_special_bank_layout(file_obj: IO[Any]) -> pd.DataFrame:
+def _detect_bank_layout(head_rows: list[list]) -> dict | None:
     """
-    تمیز کردن فرمتی که در نمونه‌ی پرداخت.xlsx فرستادی (دفتر حساب بانکی با هدرهای فارسی چندسطره).
-    خروجی: دیتافریمی استاندارد با ستون‌های:
-      PaymentID, PaymentDate, Amount, SourceType, CustomerCode, CustomerName, Description, CheckNumber
+    تشخیص فرمت دفتر حساب بانکی از روی ردیف‌های ابتدای فایل.
+    خروجی: شماره سطر هدر دوم و شماره ستون‌ها؛ اگر فرمت بانکی نبود None.
     """
-    file_obj.seek(0)
-    raw = pd.read_excel(file_obj, header=None)
-
     # پیدا کردن سطر متادیتا (جایی که "كد طرف حساب" نوشته شده)
-    meta_idx = None
-    for i in range(min(40, len(raw))):
-        row = raw.iloc[i].astype(str)
-        if row.str.contains("كد طرف حساب", na=False).any() or row.str.contains("کد طرف حساب", na=False).any():
-            meta_idx = i
-            break
+    meta_idx = find_row(head_rows, BANK_META_KEYWORDS)
 
     if meta_idx is None:
         # اصلاً این فرمتی نیست که انتظار داریم
-        return pd.DataFrame()
+        return None
 
     header2_idx = meta_idx + 1
-    if header2_idx >= len(raw):
-        return pd.DataFrame()
+    if header2_idx >= len(head_rows):
+        return None
 
-    meta_row = raw.iloc[meta_idx].astype(str)
-    header2_row = raw.iloc[header2_idx].astype(str)
+    meta_row = head_rows[meta_idx]
+    header2_row = head_rows[header2_idx]
 
     # ستون‌های تاریخ (دو تا: تاریخ اصلی و تاریخ مدرک واریز/برداشت)
     date_positions = [
@@ -78,106 +81,125 @@ def _load_special_bank_layout(file_obj: IO[Any]) -> pd.DataFrame:
 
     # بدون تاریخ و ستون واریزی، عملاً به درد ما نمی‌خورد
     if date_col is None or deposit_col is None:
-        return pd.DataFrame()
+        return None
+
+    return {
+        "header2_idx": header2_idx,
+        "date_col": date_col,
+        "sub_date_col": sub_date_col,
+        "type_col": type_col,
+        "sub_type_col": sub_type_col,
+        "id_col": id_col,
+        "check_no_col": check_no_col,
+        "cust_code_col": cust_code_col,
+        "cust_name_col": cust_name_col,
+        "deposit_col": deposit_col,
+        "withdraw_col": withdraw_col,
+        "desc_col": desc_col,
+    }
+
+
+def _load_special_bank_layout(file_obj: IO[Any], layout: dict) -> pd.DataFrame:
+    """
+    تمیز کردن فرمتی که در نمونه‌ی پرداخت.xlsx فرستادی (دفتر حساب بانکی با هدرهای فارسی چندسطره).
+    layout خروجی _detect_bank_layout است؛ فقط ستون‌های لازم و فقط ردیف‌های
+    بعد از هدر دوم خوانده می‌شوند.
+    خروجی: دیتافریمی استاندارد با ستون‌های:
+      PaymentID, PaymentDate, Amount, SourceType, CustomerCode, CustomerName, Description, CheckNumber
+    """
+    date_col = layout["date_col"]
+    type_col = layout["type_col"]
+    sub_type_col = layout["sub_type_col"]
+    id_col = layout["id_col"]
+    check_no_col = layout["check_no_col"]
+    cust_code_col = layout["cust_code_col"]
+    cust_name_col = layout["cust_name_col"]
+    deposit_col = layout["deposit_col"]
+    withdraw_col = layout["withdraw_col"]
+    desc_col = layout["desc_col"]
 
     # دیتای واقعی از سطر بعد از هدر دوم شروع می‌شود
-    data = raw.iloc[header2_idx + 1:].copy()
+    usecols = sorted({
+        c for c in (date_col, type_col, sub_type_col, id_col, check_no_col,
+                    cust_code_col, cust_name_col, deposit_col, withdraw_col, desc_col)
+        if c is not None
+    })
+    data = read_region(
+        file_obj, skiprows=layout["header2_idx"] + 1, usecols=usecols,
+        label="payments")
 
     # تبدیل مبالغ به عدد
     for col_idx in [deposit_col, withdraw_col]:
         if col_idx is not None:
             data[col_idx] = pd.to_numeric(data[col_idx], errors="coerce")
 
-    records: list[dict[str, Any]] = []
-
-    for _, row in data.iterrows():
-        # مبلغ واریزی
-        amt = float(row[deposit_col]) if pd.notna(row[deposit_col]) else 0.0
-        if amt <= 0:
-            # فقط ردیف‌هایی که واقعاً واریزی دارند را می‌خواهیم
-            continue
-
-        # نوع عملیات اصلی (برای حذف "جمع ..." و تشخیص اسناد دریافتنی)
-        kind = str(row[type_col]) if type_col is not None else ""
-        if "جمع" in kind:
-            # سطرهای "جمع نقل از قبل" و "جمع ..." را حذف می‌کنیم
-            continue
-
-        payment_date = row[date_col] if date_col is not None else None
-        payment_id = row[id_col] if id_col is not None else None
-        cust_code = row[cust_code_col] if cust_code_col is not None else None
-        cust_name = row[cust_name_col] if cust_name_col is not None else None
-        desc_text = row[desc_col] if desc_col is not None else None
-
-        has_code = pd.notna(cust_code) and str(cust_code).strip() != ""
-        desc_str = str(desc_text or "")
-
-        # استخراج شماره چک از ستون "شماره" دوم (ستون 8 در فایل تو)
-        check_number = None
-        if check_no_col is not None:
-            raw_chk = row[check_no_col]
-            if pd.notna(raw_chk):
-                check_number = re.sub(r"\D", "", str(raw_chk))
-                if check_number == "":
-                    check_number = None
-
-        # تشخیص این‌که این ردیف «وصول چک / عملیات روی اسناد دریافتنی» است یا نه
-        is_check_row = False
-
-        # حالت ۱: متن نوع عملیات اصلی شامل "اسناد دريافتني" باشد
-        if "اسناد دريافتني" in kind:
-            is_check_row = True
-
-        # حالت ۲: نوع مدرک واریز/برداشت (ستون نوع دوم) "چک" باشد
-        if sub_type_col is not None:
-            sub_kind = str(row[sub_type_col])
-            if any(w in sub_kind for w in ["چک", "چك"]):
-                is_check_row = True
-
-        # حالت ۳: در توضیحات بنویسد "وصول چک"
-        if any(w in desc_str for w in ["وصول چک", "وصول چك"]):
-            is_check_row = True
-
-        if is_check_row and check_number:
-            source_type = "Check"
-        else:
-            # منطق قبلی: اگر کد طرف حساب داریم، فرض می‌کنیم واریز مستقیم از حساب مشتری است
-            if has_code:
-                source_type = "CustomerAccount"
-            else:
-                if any(w in desc_str for w in ["چک", "چك"]):
-                    source_type = "Check"
-                else:
-                    source_type = "Other"
-
-        rec = {
-            "PaymentID": str(payment_id).strip() if pd.notna(payment_id) else None,
-            "PaymentDate": payment_date,
-            "Amount": amt,
-            "SourceType": source_type,
-            "CustomerCode": str(cust_code).strip() if has_code else None,
-            "CustomerName": str(cust_name).strip() if pd.notna(cust_name) else None,
-            "Description": desc_str,
-            "CheckNumber": check_number,
-        }
-        records.append(rec)
-
-    if not records:
-        return pd.DataFrame(
-            columns=[
-                "PaymentID",
-                "PaymentDate",
-                "Amount",
-                "SourceType",
-                "CustomerCode",
-                "CustomerName",
-                "Description",
-                "CheckNumber",
-            ]
-        )
-
-    df = pd.DataFrame(records)
-    return df.reset_index(drop=True)
+    def column(col_idx):
+        if col_idx is None:
+            return pd.Series(None, index=data.index, dtype=object)
+        return data[col_idx]
+
+    # فقط ردیف‌هایی که واقعاً واریزی دارند را می‌خواهیم
+    amounts = data[deposit_col].fillna(0.0).astype(float)
+    data = data[amounts > 0]
+    amounts = amounts[amounts > 0]
+
+    # نوع عملیات اصلی (برای حذف "جمع ..." و تشخیص اسناد دریافتنی)
+    if type_col is not None:
+        kind = map_unique(data[type_col], str)
+    else:
+        kind = pd.Series("", index=data.index, dtype=object)
+    # سطرهای "جمع نقل از قبل" و "جمع ..." را حذف می‌کنیم
+    not_total = ~kind.str.contains("جمع", regex=False)
+    data, amounts, kind = data[not_total], amounts[not_total], kind[not_total]
+
+    cust_code = column(cust_code_col)
+    code_text = map_unique(cust_code, lambda v: str(v).strip())
+    has_code = cust_code.notna() & (code_text != "")
+    desc_str = map_unique(column(desc_col), lambda v: str(v or ""))
+
+    # استخراج شماره چک از ستون "شماره" دوم (ستون 8 در فایل تو)
+    check_number = pd.Series(None, index=data.index, dtype=object)
+    if check_no_col is not None:
+        raw_chk = data[check_no_col]
+        digits = map_unique(raw_chk, str).str.replace(r"\D", "", regex=True)
+        check_number = digits.where(raw_chk.notna() & (digits != ""), None)
+
+    # تشخیص این‌که این ردیف «وصول چک / عملیات روی اسناد دریافتنی» است یا نه
+    # حالت ۱: متن نوع عملیات اصلی شامل "اسناد دريافتني" باشد
+    is_check_row = kind.str.contains("اسناد دريافتني", regex=False)
+    # حالت ۲: نوع مدرک واریز/برداشت (ستون نوع دوم) "چک" باشد
+    if sub_type_col is not None:
+        sub_kind = map_unique(data[sub_type_col], str)
+        is_check_row |= sub_kind.str.contains("چک|چك")
+    # حالت ۳: در توضیحات بنویسد "وصول چک"
+    is_check_row |= desc_str.str.contains("وصول چک|وصول چك")
+
+    # منطق قبلی: اگر کد طرف حساب داریم، فرض می‌کنیم واریز مستقیم از حساب مشتری است
+    source_type = np.select(
+        [is_check_row & check_number.notna(), has_code,
+         desc_str.str.contains("چک|چك")],
+        ["Check", "CustomerAccount", "Check"],
+        default="Other",
+    )
+
+    payment_id = column(id_col)
+    cust_name = column(cust_name_col)
+    columns = {
+        "PaymentID": map_unique(payment_id, lambda v: str(v).strip()).where(payment_id.notna(), None),
+        "PaymentDate": column(date_col),
+        "Amount": amounts,
+        "SourceType": pd.Series(source_type, index=data.index, dtype=object),
+        "CustomerCode": code_text.where(has_code, None),
+        "CustomerName": map_unique(cust_name, lambda v: str(v).strip()).where(cust_name.notna(), None),
+        "Description": desc_str,
+        "CheckNumber": check_number,
+    }
+
+    if data.empty:
+        return pd.DataFrame(columns=list(columns))
+
+    # ساخت دیتافریم از لیست‌ها، تا نوع ستون‌ها مثل قبل (ساخت از رکوردها) استنتاج شود
+    return pd.DataFrame({name: values.tolist() for name, values in columns.items()})
 
 
 def _load_simple_layout(file_obj: IO[Any]) -> pd.DataFrame:
@@ -185,8 +207,7 @@ def _load_simple_layout(file_obj: IO[Any]) -> pd.DataFrame:
     حالت پشتیبان:
     اگر فایل اصلاً شبیه نمونه‌ی بانکی نبود، فرض می‌کنیم یک اکسل ساده با هدرهای مستقیم است.
     """
-    file_obj.seek(0)
-    df = pd.read_excel(file_obj)
+    df = read_table(file_obj, "payments")
 
     # نرمال‌سازی اسامی ستون‌ها
     rename_map = {}
@@ -250,11 +271,15 @@ def load_payments_excel(file_obj: IO[Any]) -> pd.DataFrame:
     لودر اصلی پرداخت‌ها:
     - اول تلاش می‌کند فرمت ویژه‌ی دفتر حساب بانکی (مثل پرداخت.xlsx) را تشخیص دهد.
     - اگر نشد، می‌رود روی حالت ساده با هدر معمولی.
+    تشخیص فرمت فقط روی ردیف‌های ابتدای فایل (خواندن استریم) انجام می‌شود.
     """
     # اول سعی می‌کنیم فرمت بانکی را بخوانیم
-    df_special = _load_special_bank_layout(file_obj)
-    if not df_special.empty:
-        return df_special
+    # (یک ردیف بیشتر، برای هدر دومِ متادیتایی که در آخرین ردیف اسکن باشد)
+    layout = _detect_bank_layout(peek_rows(file_obj, HEADER_SCAN_ROWS + 1))
+    if layout is not None:
+        df_special = _load_special_bank_layout(file_obj, layout)
+        if not df_special.empty:
+            return df_special
 
     # اگر جواب نداد، می‌رویم سراغ حالت ساده
     return _load_simple_layout(file_obj)
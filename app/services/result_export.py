@@ -0,0 +1,168 @@
+# app/services/result_export.py
+"""
+خروجی گرفتن از جدول‌های نتیجه (CSV و XLSX) به صورت جریانی.
+
+فایل کامل در حافظه یا روی دیسک ساخته نمی‌شود؛ خروجی تکه تکه تولید و برای
+StreamingResponse برگردانده می‌شود:
+- CSV: هر EXPORT_CHUNK_ROWS ردیف جدا با to_csv تبدیل و فرستاده می‌شود
+  (اولین بایت‌ها بلافاصله می‌رسند).
+- XLSX: با کتاب کار write-only در openpyxl (ردیف‌ها در فایل موقت openpyxl
+  نوشته می‌شوند و حافظه ثابت می‌ماند). فایل zip در یک نخ جدا مستقیم داخل
+  صف تکه‌ها نوشته می‌شود؛ ساختار xlsx اجازه نمی‌دهد بایت‌های آن قبل از
+  نوشته شدن همه ردیف‌ها فرستاده شوند.
+"""
+from __future__ import annotations
+
+import os
+import queue
+import threading
+from typing import Iterator
+
+import openpyxl
+import pandas as pd
+
+# تعداد ردیف‌هایی که هر بار تبدیل می‌شوند
+EXPORT_CHUNK_ROWS = 10_000
+# حداقل اندازه هر تکه ارسالی xlsx (بایت)
+XLSX_CHUNK_BYTES = 64 * 1024
+# حداکثر تکه‌های آماده در صف (نویسنده xlsx تا خالی شدن صف منتظر می‌ماند)
+XLSX_QUEUE_CHUNKS = 8
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+# BOM تا اکسل متن فارسی CSV را درست باز کند
+_CSV_BOM = "\ufeff".encode("utf-8")
+
+
+def iter_csv(df: pd.DataFrame, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[bytes]:
+    """تکه‌های فایل CSV (UTF-8 با BOM، بدون ایندکس)."""
+    yield _CSV_BOM + df.iloc[:0].to_csv(index=False).encode("utf-8")
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        yield chunk.to_csv(index=False, header=False).encode("utf-8")
+
+
+def _xlsx_rows(df: pd.DataFrame, chunk_rows: int) -> Iterator[list]:
+    """ردیف‌های قابل نوشتن با openpyxl (NaN/NaT → خانه خالی)."""
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows].astype(object)
+        chunk = chunk.where(chunk.notna(), None)
+        yield from chunk.itertuples(index=False, name=None)
+
+
+class _StreamClosed(Exception):
+    """مصرف‌کننده جریان را بست (مثلاً کاربر دانلود را لغو کرد)."""
+
+
+class _ChunkQueueWriter:
+    """فایل فقط-نوشتنی که بایت‌ها را تکه تکه در صف می‌گذارد (مقصد zipfile)."""
+
+    def __init__(self, chunks: queue.Queue, closed: threading.Event):
+        self._chunks = chunks
+        self._closed = closed
+        self._buffer = bytearray()
+        self._aborted = False
+
+    def write(self, data) -> int:
+        if self._aborted:
+            # بعد از لغو (مثلاً بستن zip در __del__) نوشتن‌ها دور ریخته می‌شوند
+            return len(data)
+        self._buffer += data
+        if len(self._buffer) >= XLSX_CHUNK_BYTES:
+            self.flush()
+        return len(data)
+
+    def flush(self) -> None:
+        if self._buffer and not self._aborted:
+            self.put(bytes(self._buffer))
+            self._buffer.clear()
+
+    def put(self, item) -> None:
+        while True:
+            if self._closed.is_set():
+                self._aborted = True
+                raise _StreamClosed()
+            try:
+                self._chunks.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+
+class XlsxStream:
+    """
+    تکه‌های فایل xlsx یک دیتافریم. نوشتن در یک نخ جدا انجام می‌شود و
+    close() آن را متوقف می‌کند (از هر نخی قابل صدا زدن است).
+    """
+
+    _DONE = object()
+
+    def __init__(self, df: pd.DataFrame, sheet_name: str = "Sheet1",
+                 chunk_rows: int = EXPORT_CHUNK_ROWS):
+        self._chunks: queue.Queue = queue.Queue(maxsize=XLSX_QUEUE_CHUNKS)
+        self._closed = threading.Event()
+        self._finished = False
+        self._thread = threading.Thread(
+            target=self._write, args=(df, sheet_name, chunk_rows),
+            name="xlsx-export", daemon=True)
+        self._started = False
+
+    def _write(self, df: pd.DataFrame, sheet_name: str, chunk_rows: int) -> None:
+        out = _ChunkQueueWriter(self._chunks, self._closed)
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet(sheet_name)
+        try:
+            ws.append([str(c) for c in df.columns])
+            for row in _xlsx_rows(df, chunk_rows):
+                if self._closed.is_set():
+                    raise _StreamClosed()
+                ws.append(row)
+            wb.save(out)
+            out.flush()
+            out.put(self._DONE)
+        except _StreamClosed:
+            # دانلود لغو شد: شیت نیمه‌کاره بسته و فایل موقت openpyxl پاک می‌شود
+            if not ws.closed:
+                ws.close()
+            if ws._writer is not None and os.path.exists(ws._writer.out):
+                ws._writer.cleanup()
+        except Exception as e:
+            print(f"Error writing xlsx export: {e}")
+            try:
+                out.put(e)
+            except _StreamClosed:
+                pass
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        if self._finished:
+            raise StopIteration
+        if not self._started:
+            self._started = True
+            self._thread.start()
+        item = self._chunks.get()
+        if item is self._DONE:
+            self._finished = True
+            raise StopIteration
+        if isinstance(item, Exception):
+            self._finished = True
+            raise item
+        return item
+
+    def close(self) -> None:
+        self._finished = True
+        self._closed.set()
+
+
+def iter_export(df: pd.DataFrame, fmt: str, sheet_name: str = "Sheet1"):
+    """تکه‌های خروجی df در قالب fmt (کلیدهای EXPORT_FORMATS)."""
+    if fmt == "csv":
+        return iter_csv(df)
+    if fmt == "xlsx":
+        return XlsxStream(df, sheet_name)
+    raise ValueError(f"قالب خروجی نامعتبر: {fmt}")
@@ -7,6 +7,8 @@ from typing import BinaryIO
 import pandas as pd
 import numpy as np
 
+from app.services.excel_reader import read_table
+
 
 def load_sales_excel(file_obj: BinaryIO) -> pd.DataFrame:
     """
@@ -26,7 +28,7 @@ def load_sales_excel(file_obj: BinaryIO) -> pd.DataFrame:
     # ولی چون ساختار فعلی مشخصه، مستقیم از ردیف ۵ به بعد هدر را می‌گیریم:
     # (ردیفی که ستون‌های "تاريخ ", "نوع", "شماره", ... توش هستند)
     buf = io.BytesIO(data)
-    df = pd.read_excel(buf, header=5)
+    df = read_table(buf, "sales", header=5)
 
     # فقط ردیف‌هایی که نوعشان "فاكتور" است (خود فاکتورهای واقعی)
     if "نوع" in df.columns:
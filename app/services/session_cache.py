@@ -0,0 +1,535 @@
+# app/services/session_cache.py
+"""
+کش ستونی (Parquet/Arrow) برای دیتافریم‌های آپلود شده و نتایج محاسبه.
+
+هر کلید دیتافریمی در یک فایل Parquet داخل پوشه نشست نوشته می‌شود و
+بقیه مقادیر (group_col، group_config، ...) در یک فایل pickle کنار آن؛
+بنابراین همه پروسه‌های uvicorn همان داده‌ها را می‌بینند و با ری‌استارت
+سرور از بین نمی‌روند. خواندن با memory-map انجام می‌شود و ستون‌های
+کد و نام کم‌تنوع بعد از خواندن هم categorical می‌مانند (هر مقدار یکتا
+یک بار در حافظه)؛ مقادیر و نتیجه محاسبات همان نسخه str است.
+نسخه حافظه هر فریم هم هنگام ذخیره به همان شکل خوانده شده از دیسک
+درمی‌آید، تا نوع ستون‌ها به خارج شدن یا نشدن فریم از حافظه بستگی نداشته باشد.
+"""
+from __future__ import annotations
+
+import os
+import re
+import json
+import time
+import uuid
+import pickle
+import shutil
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow اختیاری است؛ بدون آن فقط حافظه پروسه استفاده می‌شود
+    pa = None
+    pq = None
+
+SESSION_CACHE_DIR = "session_cache"
+DEFAULT_SESSION_ID = "default"
+
+# ستون‌های متنی که نسبت مقادیر یکتا به کل ردیف‌ها کمتر از این باشد
+# (کدها و نام‌ها) روی دیسک به صورت categorical/dictionary ذخیره می‌شوند.
+CATEGORY_MAX_RATIO = 0.5
+
+# کلید متادیتای اختصاصی در schema فایل Parquet
+_META_KEY = b"session_cache"
+# پیشوند ستون نوع مقادیر در ستون‌های object مخلوط (عدد + متن)
+_KIND_PREFIX = "__kind__"
+_META_FILE = "meta.pkl"
+# علامت «این کلید یک دیتافریم روی دیسک است» در meta.pkl
+_FRAME_MARKER = "__frame__"
+
+# کد نوع مقادیر ستون‌های مخلوط
+(_KIND_NONE, _KIND_NAT, _KIND_STR, _KIND_INT, _KIND_FLOAT,
+ _KIND_BOOL, _KIND_TIME) = range(7)
+
+
+def arrow_available() -> bool:
+    return pq is not None
+
+
+def session_dir(session_id: str = DEFAULT_SESSION_ID, root: str = SESSION_CACHE_DIR) -> str:
+    return os.path.join(root, session_id)
+
+
+def _file_stamp(path: str):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _atomic_write(path: str, writer) -> None:
+    """نوشتن در فایل موقت و جایگزینی اتمیک، تا پروسه دیگر فایل نیمه‌کاره نبیند."""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        writer(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+# ------------------ کدگذاری ستون‌ها ------------------
+
+
+def _type_kind(t: type) -> int | None:
+    if t is type(None):
+        return _KIND_NONE
+    if t is type(pd.NaT):
+        return _KIND_NAT
+    if issubclass(t, str):
+        return _KIND_STR
+    if issubclass(t, (bool, np.bool_)):
+        return _KIND_BOOL
+    if issubclass(t, (int, np.integer)):
+        return _KIND_INT
+    if issubclass(t, (float, np.floating)):
+        return _KIND_FLOAT
+    if issubclass(t, datetime):
+        return _KIND_TIME
+    return None
+
+
+def _format_value(kind: int, v):
+    if kind in (_KIND_NONE, _KIND_NAT):
+        return None
+    if kind == _KIND_FLOAT:
+        return repr(float(v))
+    if kind == _KIND_BOOL:
+        return "1" if v else "0"
+    if kind == _KIND_TIME:
+        return pd.Timestamp(v).isoformat()
+    return str(v)
+
+
+def _parse_value(kind: int, text):
+    if kind == _KIND_NONE:
+        return None
+    if kind == _KIND_NAT:
+        return pd.NaT
+    if kind == _KIND_INT:
+        return int(text)
+    if kind == _KIND_FLOAT:
+        return float(text)
+    if kind == _KIND_BOOL:
+        return text == "1"
+    if kind == _KIND_TIME:
+        return pd.Timestamp(text)
+    return text
+
+
+def _encode_mixed(series: pd.Series) -> tuple[pd.Series, pd.Series] | None:
+    """
+    ستون object با انواع مخلوط (مثلاً کد مشتری عددی و متنی) را به
+    «متن + نوع» تبدیل می‌کند تا بدون از دست رفتن نوع مقادیر در Parquet
+    ذخیره شود. اگر نوع ناشناخته‌ای وجود داشت None برمی‌گرداند.
+    """
+    values = series.to_numpy(dtype=object)
+    # گروه‌بندی اول بر اساس نوع، تا 1 و True و 1.0 یکی حساب نشوند
+    type_codes, types = pd.factorize(np.array([type(v) for v in values], dtype=object))
+    kinds = np.empty(len(values), dtype=np.int8)
+    texts = np.empty(len(values), dtype=object)
+    for i, t in enumerate(types):
+        kind = _type_kind(t)
+        if kind is None:
+            return None
+        rows = np.flatnonzero(type_codes == i)
+        codes, uniques = pd.factorize(values[rows], use_na_sentinel=False)
+        formatted = np.array([_format_value(kind, v) for v in uniques], dtype=object)
+        kinds[rows] = kind
+        texts[rows] = formatted[codes]
+    return (pd.Series(texts, index=series.index, dtype=object),
+            pd.Series(kinds, index=series.index))
+
+
+def _decode_mixed(texts: pd.Series, kinds: pd.Series) -> pd.Series:
+    pairs = pd.MultiIndex.from_arrays([texts.astype(object), kinds.to_numpy()])
+    codes, uniques = pd.factorize(pairs)
+    values = np.empty(len(uniques), dtype=object)
+    for i, (text, kind) in enumerate(uniques):
+        values[i] = _parse_value(kind, text)
+    return pd.Series(values[codes], index=texts.index, dtype=object, name=texts.name)
+
+
+def _is_text_column(series: pd.Series) -> bool:
+    if pd.api.types.is_string_dtype(series.dtype) and series.dtype != object:
+        return True
+    if series.dtype != object:
+        return False
+    return bool(series.map(lambda v: isinstance(v, str) or pd.isna(v)).all())
+
+
+def _to_arrow_table(df: pd.DataFrame):
+    """
+    دیتافریم را برای Parquet آماده می‌کند: ستون‌های متنی کم‌تنوع →
+    categorical، ستون‌های object مخلوط → «متن + نوع». attrs (مثل
+    CustomerIndex) نوشته نمی‌شود. اگر قابل تبدیل نبود None برمی‌گرداند.
+    """
+    if not all(isinstance(c, str) for c in df.columns):
+        return None
+    out = pd.DataFrame(index=df.index)
+    categories, mixed = {}, []
+    for col in df.columns:
+        s = df[col]
+        if _is_text_column(s):
+            if len(s) and s.nunique() <= CATEGORY_MAX_RATIO * len(s):
+                categories[col] = str(s.dtype)
+                s = s.astype("category")
+        elif s.dtype == object:
+            # Arrow ستون object غیرمتنی را به یک نوع واحد (مثلاً double)
+            # تبدیل می‌کند؛ برای حفظ نوع تک‌تک مقادیر همیشه کدگذاری می‌شود.
+            encoded = _encode_mixed(s)
+            if encoded is None:
+                return None
+            s, out[_KIND_PREFIX + col] = encoded
+            mixed.append(col)
+        out[col] = s
+    out = out[[*df.columns, *(_KIND_PREFIX + c for c in mixed)]]
+    try:
+        table = pa.Table.from_pandas(out)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return None
+    meta = json.dumps({"categories": categories, "mixed": mixed}).encode()
+    return table.replace_schema_metadata({**table.schema.metadata, _META_KEY: meta})
+
+
+def _from_arrow_table(table) -> pd.DataFrame:
+    meta = json.loads(table.schema.metadata.get(_META_KEY, b"{}"))
+    df = table.to_pandas()
+    # ستون‌های کد/نام categorical می‌مانند (دیکشنری Arrow)؛ برگرداندن به str
+    # هر مقدار را دوباره در حافظه می‌سازد
+    for col in meta.get("mixed", []):
+        df[col] = _decode_mixed(df[col], df.pop(_KIND_PREFIX + col))
+    return df
+
+
+# ------------------ ذخیره و بازیابی فریم‌ها ------------------
+
+
+def _frame_paths(directory: str, key: str) -> tuple[str, str]:
+    base = os.path.join(directory, key)
+    return f"{base}.parquet", f"{base}.pkl"
+
+
+def save_frame(directory: str, key: str, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    نوشتن یک دیتافریم در پوشه نشست. Parquet در اولویت است؛ فریم‌هایی که
+    Arrow نمی‌تواند نمایش دهد (یا وقتی pyarrow نصب نیست) با pickle نوشته
+    می‌شوند. فریم را به همان شکلی برمی‌گرداند که load_frame می‌خواند
+    (همان نوع ستون‌ها، بدون attrs).
+    """
+    os.makedirs(directory, exist_ok=True)
+    parquet_path, pickle_path = _frame_paths(directory, key)
+    plain = df.copy(deep=False)
+    plain.attrs = {}
+    table = _to_arrow_table(plain) if arrow_available() else None
+    if table is not None:
+        _atomic_write(parquet_path, lambda p: pq.write_table(table, p))
+        stale, stored = pickle_path, _from_arrow_table(table)
+    else:
+        _atomic_write(pickle_path, plain.to_pickle)
+        stale, stored = parquet_path, plain
+    if os.path.exists(stale):
+        os.remove(stale)
+    return stored
+
+
+def load_frame(directory: str, key: str) -> pd.DataFrame | None:
+    parquet_path, pickle_path = _frame_paths(directory, key)
+    if arrow_available() and os.path.exists(parquet_path):
+        return _from_arrow_table(pq.read_table(parquet_path, memory_map=True))
+    if os.path.exists(pickle_path):
+        return pd.read_pickle(pickle_path)
+    return None
+
+
+def frame_stamp(directory: str, key: str):
+    for path in _frame_paths(directory, key):
+        stamp = _file_stamp(path)
+        if stamp is not None:
+            return (path, *stamp)
+    return None
+
+
+def delete_frame(directory: str, key: str) -> None:
+    for path in _frame_paths(directory, key):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# ------------------ استور نشست ------------------
+
+
+def frame_nbytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class SessionFrameStore(MutableMapping):
+    """
+    جایگزین دیکشنری LAST_UPLOAD با همان رابط (store["sales"] = df).
+
+    دیتافریم‌ها روی دیسک (Parquet) و بقیه مقادیر در meta.pkl نوشته می‌شوند.
+    نسخه خوانده شده هر فریم تا وقتی فایلش تغییر نکرده در حافظه می‌ماند؛
+    اگر پروسه دیگری فایل را عوض کرده باشد، بار بعد دوباره خوانده می‌شود.
+    on_grow بعد از هر بار اضافه شدن فریم به حافظه صدا زده می‌شود
+    (SessionManager از آن برای اعمال سقف حافظه استفاده می‌کند).
+    """
+
+    def __init__(self, defaults: dict, session_id: str = DEFAULT_SESSION_ID,
+                 root: str = SESSION_CACHE_DIR, on_grow=None):
+        self.defaults = dict(defaults)
+        self.session_id = session_id
+        self.directory = session_dir(session_id, root)
+        self.on_grow = on_grow
+        # {کلید: (مهر فایل، دیتافریم، حجم در حافظه)}
+        self._frames: dict[str, tuple] = {}
+        self._meta: dict = {}
+        self._meta_stamp = None
+        self._lock = threading.RLock()
+
+    # --- مقادیر غیر دیتافریمی ---
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, _META_FILE)
+
+    def _load_meta(self) -> dict:
+        stamp = _file_stamp(self._meta_path())
+        if stamp is not None and stamp != self._meta_stamp:
+            try:
+                with open(self._meta_path(), "rb") as f:
+                    self._meta = pickle.load(f)
+                self._meta_stamp = stamp
+            except Exception as e:
+                print(f"Error reading session meta: {e}")
+        return self._meta
+
+    def _save_meta(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+
+        def write(path):
+            with open(path, "wb") as f:
+                pickle.dump(self._meta, f)
+        try:
+            _atomic_write(self._meta_path(), write)
+            self._meta_stamp = _file_stamp(self._meta_path())
+        except Exception as e:
+            print(f"Error writing session meta: {e}")
+
+    # --- حافظه ---
+    def memory_bytes(self) -> int:
+        """حجم دیتافریم‌هایی که الان در حافظه این پروسه نگه داشته شده‌اند."""
+        with self._lock:
+            return sum(entry[2] for entry in self._frames.values())
+
+    def release_memory(self) -> int:
+        """
+        خالی کردن فریم‌های حافظه که نسخه دیسکی دارند (بار بعد از Parquet
+        خوانده می‌شوند). حجم آزاد شده را برمی‌گرداند.
+        """
+        with self._lock:
+            freed = 0
+            for key, entry in list(self._frames.items()):
+                if entry[0] is not None:
+                    freed += entry[2]
+                    del self._frames[key]
+            return freed
+
+    def touch(self) -> None:
+        """به‌روزرسانی زمان آخرین استفاده (mtime پوشه) برای انقضای TTL."""
+        try:
+            os.utime(self.directory)
+        except OSError:
+            pass
+
+    def _remember(self, key, stamp, df) -> None:
+        self._frames[key] = (stamp, df, frame_nbytes(df) if df is not None else 0)
+
+    def _grew(self) -> None:
+        if self.on_grow is not None:
+            self.on_grow(self)
+
+    # --- رابط دیکشنری ---
+    def __getitem__(self, key):
+        with self._lock:
+            meta = self._load_meta()
+            if meta.get(key) == _FRAME_MARKER:
+                value, loaded = self._get_frame(key)
+            elif key in meta:
+                return meta[key]
+            elif key in self.defaults:
+                return self.defaults[key]
+            else:
+                raise KeyError(key)
+        if loaded:
+            self._grew()
+        return value
+
+    def _get_frame(self, key):
+        stamp = frame_stamp(self.directory, key)
+        cached = self._frames.get(key)
+        if cached is not None and (stamp is None or cached[0] == stamp):
+            # فایل پاک شده یا نوشتن ناموفق بوده → همان نسخه حافظه
+            return cached[1], False
+        try:
+            df = load_frame(self.directory, key)
+        except Exception as e:
+            print(f"Error loading cached frame '{key}': {e}")
+            return (cached[1] if cached is not None else None), False
+        self._remember(key, stamp, df)
+        return df, True
+
+    def __setitem__(self, key, value):
+        is_frame = isinstance(value, pd.DataFrame)
+        with self._lock:
+            self._load_meta()
+            if is_frame:
+                stamp = None
+                stored = value
+                try:
+                    stored = save_frame(self.directory, key, value)
+                    # attrs (مثل CustomerIndex) با همان ردیف‌ها معتبر می‌ماند
+                    stored.attrs = dict(value.attrs)
+                    stamp = frame_stamp(self.directory, key)
+                except Exception as e:
+                    print(f"Error caching frame '{key}': {e}")
+                self._remember(key, stamp, stored)
+                self._meta[key] = _FRAME_MARKER
+            else:
+                self._frames.pop(key, None)
+                delete_frame(self.directory, key)
+                self._meta[key] = value
+            self._save_meta()
+        if is_frame:
+            self._grew()
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._load_meta()
+            if key not in self._meta:
+                raise KeyError(key)
+            del self._meta[key]
+            self._frames.pop(key, None)
+            delete_frame(self.directory, key)
+            self._save_meta()
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(dict.fromkeys([*self.defaults, *self._load_meta()])))
+
+    def __len__(self) -> int:
+        return len(list(iter(self)))
+
+
+# ------------------ مدیریت چند نشست ------------------
+
+# نشستی که این مدت استفاده نشده باشد (حافظه و دیسک) پاک می‌شود
+SESSION_TTL_SECONDS = 12 * 3600
+# سقف مجموع حجم دیتافریم‌های نگه داشته شده در حافظه (همه نشست‌ها)
+SESSION_MEMORY_BUDGET_BYTES = 1024 * 1024 * 1024
+# فاصله بین دو بار بررسی نشست‌های منقضی شده روی دیسک
+SESSION_SWEEP_INTERVAL_SECONDS = 60
+
+_SESSION_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+def is_valid_session_id(session_id) -> bool:
+    return isinstance(session_id, str) and bool(_SESSION_ID_RE.match(session_id))
+
+
+class SessionManager:
+    """
+    نگهداری یک SessionFrameStore برای هر نشست (کوکی) با سیاست حذف:
+    - LRU: وقتی مجموع حافظه از سقف بیشتر شد، فریم‌های حافظه نشست‌هایی
+      که دیرتر استفاده شده‌اند آزاد می‌شوند (نسخه دیسکی باقی می‌ماند).
+    - TTL: نشستی که مدتی استفاده نشده، کامل (حافظه و پوشه دیسک) حذف می‌شود.
+    """
+
+    def __init__(self, defaults: dict, root: str = SESSION_CACHE_DIR,
+                 ttl_seconds: float = SESSION_TTL_SECONDS,
+                 memory_budget: int = SESSION_MEMORY_BUDGET_BYTES):
+        self.defaults = dict(defaults)
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self.memory_budget = memory_budget
+        # ترتیب LRU: قدیمی‌ترین اول
+        self._stores: OrderedDict[str, SessionFrameStore] = OrderedDict()
+        self._last_seen: dict[str, float] = {}
+        self._last_sweep = 0.0
+        self._lock = threading.RLock()
+
+    def get(self, session_id: str) -> SessionFrameStore:
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            store = self._stores.pop(session_id, None)
+            if store is None:
+                store = SessionFrameStore(self.defaults, session_id, self.root,
+                                          on_grow=self._enforce_budget)
+            self._stores[session_id] = store
+            self._last_seen[session_id] = now
+        store.touch()
+        return store
+
+    def drop(self, session_id: str) -> None:
+        """حذف کامل یک نشست (حافظه و فایل‌های دیسک)."""
+        with self._lock:
+            self._stores.pop(session_id, None)
+            self._last_seen.pop(session_id, None)
+        shutil.rmtree(session_dir(session_id, self.root), ignore_errors=True)
+
+    def memory_by_session(self) -> dict[str, int]:
+        with self._lock:
+            stores = list(self._stores.items())
+        return {sid: store.memory_bytes() for sid, store in stores}
+
+    def total_memory(self) -> int:
+        return sum(self.memory_by_session().values())
+
+    def _enforce_budget(self, current: SessionFrameStore) -> None:
+        with self._lock:
+            stores = list(self._stores.values())
+        total = sum(store.memory_bytes() for store in stores)
+        for store in stores:
+            if total <= self.memory_budget:
+                break
+            if store is not current:
+                total -= store.release_memory()
+
+    def _sweep(self, now: float) -> None:
+        if now - self._last_sweep < SESSION_SWEEP_INTERVAL_SECONDS:
+            return
+        self._last_sweep = now
+        for sid, seen in list(self._last_seen.items()):
+            if now - seen > self.ttl_seconds:
+                self._stores.pop(sid, None)
+                self._last_seen.pop(sid, None)
+        # پوشه‌های منقضی (از جمله نشست‌های پروسه‌های دیگر یا اجراهای قبلی)
+        try:
+            entries = list(os.scandir(self.root))
+        except OSError:
+            return
+        for entry in entries:
+            if not entry.is_dir() or entry.name in self._stores:
+                continue
+            try:
+                idle = now - entry.stat().st_mtime
+            except OSError:
+                continue
+            if idle > self.ttl_seconds:
+                shutil.rmtree(entry.path, ignore_errors=True)
@@ -0,0 +1,410 @@
+# app/services/settlement.py
+from __future__ import annotations
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+from app.services.customer_index import CustomerIndex
+
+# مقادیر جایگزین NaT هنگام تبدیل تاریخ به عدد صحیح (نانوثانیه)
+NS_MIN = np.iinfo(np.int64).min
+NS_MAX = np.iinfo(np.int64).max
+
+# تاریخ پرداخت مجازی مانده بستانکار (همیشه قبل از سررسید است)
+OPENING_CREDIT_NS = pd.Timestamp.min.value
+
+# پرداخت‌های کمتر از این مقدار در تسویه نادیده گرفته می‌شوند (همان تلورانس حلقه قبلی)
+PAYMENT_TOLERANCE = 0.001
+
+# حالت موازی فقط برای داده‌های بزرگ ارزش دارد (هزینه راه‌اندازی پروسه‌ها)
+PARALLEL_MIN_INVOICES = 20000
+# تعداد شارد به ازای هر کارگر برای پخش بهتر بار بین پروسه‌ها
+SHARDS_PER_WORKER = 4
+# روش ساخت پروسه‌های کارگر: تسویه از نخ‌های کارگر (run_blocking) صدا زده
+# می‌شود و fork در پروسه چندنخی ممکن است قفل‌ها را نیمه‌کاره کپی کند
+POOL_START_METHOD = "spawn"
+
+# ضریب‌های ترکیب هش‌ها در امضای ورودی تسویه هر مشتری (اعداد فرد ۶۴ بیتی)
+_HASH_MULT = np.uint64(0x9E3779B97F4A7C15)
+_HASH_POS = np.uint64(0xBF58476D1CE4E5B9)
+
+
+# استخر پروسه‌های تسویه موازی (یک بار ساخته و بین محاسبه‌ها استفاده می‌شود)
+_POOL: ProcessPoolExecutor | None = None
+_POOL_WORKERS = 0
+_POOL_LOCK = threading.Lock()
+
+
+def _settlement_pool(workers: int) -> ProcessPoolExecutor:
+    """استخر مشترک با workers پروسه؛ با تغییر تعداد، استخر جدید ساخته می‌شود."""
+    global _POOL, _POOL_WORKERS
+    with _POOL_LOCK:
+        if _POOL is None or _POOL_WORKERS != workers:
+            if _POOL is not None:
+                # کارهای در حال اجرای استخر قبلی تمام می‌شوند
+                _POOL.shutdown(wait=False)
+            _POOL = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context(POOL_START_METHOD))
+            _POOL_WORKERS = workers
+        return _POOL
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    """کنار گذاشتن استخر خراب (مثلاً پروسه کارگر کشته شده)؛ بار بعد دوباره ساخته می‌شود."""
+    global _POOL, _POOL_WORKERS
+    with _POOL_LOCK:
+        if _POOL is pool:
+            _POOL, _POOL_WORKERS = None, 0
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _settle_in_pool(shards: list, arrays: dict, workers: int):
+    """
+    تسویه شاردها در استخر پروسه‌ها؛ اگر استخر خراب شده باشد همین اجرا
+    سریالی انجام می‌شود. خروجی: [(paid, commission)] به ترتیب شاردها.
+    """
+    packed = [_pack_shard(s, arrays) for s in shards]
+    pool = _settlement_pool(workers)
+    try:
+        return list(pool.map(_settle_shard, packed))
+    except BrokenProcessPool as e:
+        print(f"Error in settlement process pool, settling serially: {e}")
+        _discard_pool(pool)
+        return [_settle_shard(p) for p in packed]
+
+
+def datetime_to_ns(values, fill: int) -> np.ndarray:
+    """
+    تبدیل یک ستون تاریخ به آرایه int64 (نانوثانیه) برای مقایسه سریع.
+    مقادیر خالی (NaT) با fill جایگزین می‌شوند.
+    """
+    ts = pd.to_datetime(pd.Series(values), errors="coerce")
+    missing = ts.isna().to_numpy()
+    out = ts.astype("datetime64[ns]").to_numpy().view("i8").copy()
+    out[missing] = fill
+    return out
+
+
+def apply_opening_balance(
+    pay_amounts: np.ndarray,
+    pay_dates_ns: np.ndarray,
+    balance: float,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    اعمال مانده ابتدای دوره روی پرداخت‌های (مرتب شده) یک مشتری:
+    - مانده مثبت: یک پرداخت مجازی با تاریخ ازلی به ابتدای لیست اضافه می‌شود.
+    - مانده منفی: بدهی قبلی به ترتیب از پرداخت‌ها کسر می‌شود
+      و پرداخت‌هایی که صفر شده‌اند حذف می‌شوند.
+    """
+    if balance > 0:
+        amounts = np.concatenate(([float(balance)], pay_amounts))
+        dates = np.concatenate(([OPENING_CREDIT_NS], pay_dates_ns))
+        return amounts, dates
+
+    if balance < 0:
+        debt = -float(balance)
+        consumed = np.cumsum(pay_amounts)
+        # اولین پرداختی که بدهی را کامل پوشش می‌دهد
+        crossed = np.flatnonzero(consumed >= debt)
+        amounts = np.zeros_like(pay_amounts)
+        if len(crossed):
+            k = crossed[0]
+            amounts[k] = consumed[k] - debt
+            amounts[k + 1:] = pay_amounts[k + 1:]
+        keep = amounts > 0
+        return amounts[keep], pay_dates_ns[keep]
+
+    return pay_amounts, pay_dates_ns
+
+
+def allocate_fifo(
+    inv_capacity: np.ndarray,
+    pay_amounts: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    تخصیص FIFO پرداخت‌ها به فاکتورها با جمع تجمعی و searchsorted.
+
+    هر فاکتور بازه‌ای از محور «مبلغ تجمعی فاکتورها» و هر پرداخت بازه‌ای از
+    محور «مبلغ تجمعی پرداخت‌ها» را اشغال می‌کند؛ هم‌پوشانی این بازه‌ها همان
+    مبلغی است که حلقه قدیمی از آن پرداخت به آن فاکتور تخصیص می‌داد.
+
+    خروجی: (ایندکس فاکتور، ایندکس پرداخت، مبلغ) برای هر قطعه تخصیص.
+    """
+    empty = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0))
+    if len(inv_capacity) == 0 or len(pay_amounts) == 0:
+        return empty
+
+    inv_cum = np.cumsum(inv_capacity)
+    pay_cum = np.cumsum(pay_amounts)
+    total = min(inv_cum[-1], pay_cum[-1])
+    if not total > 0:
+        return empty
+
+    edges = np.union1d(np.concatenate(([0.0], inv_cum)), pay_cum)
+    edges = edges[edges <= total]
+    starts = edges[:-1]
+    lengths = np.diff(edges)
+
+    inv_pos = np.searchsorted(inv_cum, starts, side="right")
+    pay_pos = np.searchsorted(pay_cum, starts, side="right")
+    return inv_pos, pay_pos, lengths
+
+
+def settle_customer(
+    inv_amount: np.ndarray,
+    inv_percent: np.ndarray,
+    inv_due_ns: np.ndarray,
+    pay_amount: np.ndarray,
+    pay_date_ns: np.ndarray,
+    balance: float = 0.0,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    تسویه فاکتورهای یک مشتری.
+    فاکتورها باید به ترتیب اولویت (نقدی → عادی، قدیمی → جدید) و پرداخت‌ها
+    به ترتیب تاریخ مرتب شده باشند. تاریخ‌ها int64 هستند و خالی‌ها NS_MAX؛
+    یعنی فاکتور بدون سررسید همیشه پورسانت می‌گیرد ولی پرداخت بی‌تاریخ فقط
+    برای فاکتورهای بدون سررسید.
+
+    خروجی: (مبلغ پرداخت شده، پورسانت) برای هر فاکتور.
+    """
+    pay_amount = np.nan_to_num(np.asarray(pay_amount, dtype=float), nan=0.0)
+    pay_amount, pay_date_ns = apply_opening_balance(
+        pay_amount, pay_date_ns, balance)
+    pay_amount = np.where(pay_amount > PAYMENT_TOLERANCE, pay_amount, 0.0)
+
+    # فاکتورهای بدون مانده مثبت چیزی دریافت نمی‌کنند؛ مبلغ نامعتبر (NaN) مثل حلقه قبلی
+    # هر مقدار باقی‌مانده‌ای را جذب می‌کند
+    inv_capacity = np.where(np.isnan(inv_amount), np.inf,
+                            np.maximum(inv_amount, 0.0))
+
+    inv_pos, pay_pos, lengths = allocate_fifo(inv_capacity, pay_amount)
+
+    n_inv = len(inv_amount)
+    paid = np.bincount(inv_pos, weights=lengths, minlength=n_inv)
+
+    in_due = pay_date_ns[pay_pos] <= inv_due_ns[inv_pos]
+    earned = np.where(in_due, lengths * inv_percent[inv_pos], 0.0)
+    commission = np.bincount(inv_pos, weights=earned, minlength=n_inv)
+    return paid, commission
+
+
+def _pack_shard(customers: list, arrays: dict) -> dict:
+    """
+    ساخت آرایه‌های فشرده یک شارد: داده‌های همه مشتریان شارد پشت سر هم
+    چیده می‌شوند و offsetها مرز هر مشتری را مشخص می‌کنند.
+    """
+    inv_pos = [c[0] for c in customers]
+    pay_pos = [c[1] for c in customers]
+    inv_all = np.concatenate(inv_pos)
+    pay_all = np.concatenate(pay_pos)
+    return {
+        "inv_offsets": np.cumsum([0] + [len(p) for p in inv_pos]),
+        "pay_offsets": np.cumsum([0] + [len(p) for p in pay_pos]),
+        "inv_amount": arrays["inv_amount"][inv_all],
+        "inv_percent": arrays["inv_percent"][inv_all],
+        "inv_due_ns": arrays["inv_due_ns"][inv_all],
+        "pay_amount": arrays["pay_amount"][pay_all],
+        "pay_date_ns": arrays["pay_date_ns"][pay_all],
+        "balances": np.array([c[2] for c in customers], dtype=float),
+    }
+
+
+def _settle_shard(shard: dict) -> tuple[np.ndarray, np.ndarray]:
+    """تسویه یک شارد (در پروسه کارگر یا همین پروسه)."""
+    inv_off = shard["inv_offsets"]
+    pay_off = shard["pay_offsets"]
+    paid = np.zeros(inv_off[-1])
+    commission = np.zeros(inv_off[-1])
+    for i, balance in enumerate(shard["balances"]):
+        inv = slice(inv_off[i], inv_off[i + 1])
+        pay = slice(pay_off[i], pay_off[i + 1])
+        paid[inv], commission[inv] = settle_customer(
+            shard["inv_amount"][inv],
+            shard["inv_percent"][inv],
+            shard["inv_due_ns"][inv],
+            shard["pay_amount"][pay],
+            shard["pay_date_ns"][pay],
+            balance,
+        )
+    return paid, commission
+
+
+def _split_into_shards(customers: list, n_shards: int) -> list[list]:
+    """
+    تقسیم مشتریان بین شاردها با حجم تقریباً برابر
+    (بزرگ‌ترین مشتری‌ها اول، هر کدام به سبک‌ترین شارد).
+    """
+    shards: list[list] = [[] for _ in range(n_shards)]
+    loads = np.zeros(n_shards)
+    for c in sorted(customers, key=lambda c: len(c[0]) + len(c[1]), reverse=True):
+        k = int(np.argmin(loads))
+        shards[k].append(c)
+        loads[k] += len(c[0]) + len(c[1])
+    return [s for s in shards if s]
+
+
+class SettlementCache:
+    """
+    نتایج تسویه هر مشتری از محاسبه قبلی، برای محاسبه افزایشی:
+    {کلید مشتری: (امضای ورودی، مبلغ پرداخت شده، پورسانت)}.
+
+    امضا از مقادیر ورودی تسویه همان مشتری ساخته می‌شود (فاکتورها و
+    پرداخت‌های مرتب شده و مانده)؛ اگر امضا عوض نشده باشد نتیجه قبلی
+    بدون تسویه دوباره استفاده می‌شود. آرایه‌ها به ترتیب مرتب شده
+    فاکتورهای مشتری هستند، نه ترتیب ردیف‌ها در sales_df.
+    """
+
+    def __init__(self):
+        self.entries: dict = {}
+        self.last_stats = {"customers": 0, "reused": 0, "settled": 0}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+def _segment_hashes(row_hash: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    ترکیب هش ردیف‌ها در هر بازه [offsets[i], offsets[i+1]) به یک هش،
+    وابسته به ترتیب ردیف‌ها (جای هر ردیف در بازه هم در هش می‌آید).
+    همه بازه‌ها باید غیرخالی باشند.
+    """
+    lengths = np.diff(offsets)
+    pos = np.arange(len(row_hash)) - np.repeat(offsets[:-1], lengths)
+    mixed = pd.util.hash_array(row_hash + pos.astype(np.uint64) * _HASH_POS)
+    return np.add.reduceat(mixed, offsets[:-1]) if len(mixed) else mixed
+
+
+def customer_signatures(customers: list, arrays: dict) -> np.ndarray:
+    """
+    امضای ۶۴ بیتی ورودی تسویه هر مشتری (بدون حلقه روی ردیف‌ها):
+    مبلغ، درصد و سررسید فاکتورها، مبلغ و تاریخ پرداخت‌ها (به ترتیب
+    تسویه) و مانده ابتدای دوره.
+    """
+    shard = _pack_shard(customers, arrays)
+    inv_hash = np.zeros(shard["inv_offsets"][-1], dtype=np.uint64)
+    for name in ("inv_amount", "inv_percent", "inv_due_ns"):
+        inv_hash = inv_hash * _HASH_MULT + pd.util.hash_array(shard[name])
+    pay_hash = np.zeros(shard["pay_offsets"][-1], dtype=np.uint64)
+    for name in ("pay_amount", "pay_date_ns"):
+        pay_hash = pay_hash * _HASH_MULT + pd.util.hash_array(shard[name])
+
+    signature = _segment_hashes(inv_hash, shard["inv_offsets"])
+    signature = signature * _HASH_MULT + _segment_hashes(pay_hash, shard["pay_offsets"])
+    signature = signature * _HASH_MULT + pd.util.hash_array(shard["balances"])
+    return signature
+
+
+def settle_all_customers(
+    sales_df: pd.DataFrame,
+    payments_df: pd.DataFrame,
+    balances_map: dict,
+    workers: int = 1,
+    cache: SettlementCache = None,
+) -> None:
+    """
+    تسویه همه مشتریان و نوشتن PaidAmount / Remaining / CommissionAmount
+    در sales_df با یک انتساب گروهی (به جای sales_df.at سلول به سلول).
+
+    با workers > 1 مشتریان به چند شارد تقسیم و هر شارد در یک پروسه جدا
+    (ProcessPoolExecutor) تسویه می‌شود؛ به کارگرها فقط آرایه‌های فشرده
+    ارسال می‌شود، نه دیتافریم.
+
+    cache: اگر داده شود، فقط مشتریانی تسویه می‌شوند که ورودی‌شان نسبت به
+    اجرای قبلی (همان cache) تغییر کرده؛ نتیجه بقیه از کش برداشته می‌شود
+    و کش با نتایج این اجرا جایگزین می‌شود.
+    """
+    inv_amount = sales_df["Amount"].to_numpy(dtype=float)
+    inv_rank = sales_df["PriorityRank"].to_numpy()
+    inv_date_ns = datetime_to_ns(sales_df["InvoiceDate"], NS_MAX)
+    customer_index = CustomerIndex.of(sales_df)
+
+    if "PaymentDate" in payments_df.columns:
+        pay_date_ns = datetime_to_ns(payments_df["PaymentDate"], NS_MAX)
+    else:
+        # بدون ستون تاریخ، همه پرداخت‌ها در مهلت حساب می‌شوند
+        pay_date_ns = np.full(len(payments_df), NS_MIN, dtype=np.int64)
+
+    arrays = {
+        "inv_amount": inv_amount,
+        "inv_percent": sales_df["CommissionPercent"].to_numpy(dtype=float),
+        "inv_due_ns": datetime_to_ns(sales_df["DueDate"], NS_MAX),
+        "pay_amount": payments_df["Amount"].to_numpy(dtype=float),
+        "pay_date_ns": pay_date_ns,
+    }
+
+    # (موقعیت فاکتورها، موقعیت پرداخت‌ها، مانده) برای هر مشتری
+    customers = []
+    customer_keys = []
+    groups = payments_df.groupby("ResolvedCustomerKey").indices
+    for cust_key, pay_pos in groups.items():
+        if cust_key is None or (isinstance(cust_key, float) and pd.isna(cust_key)):
+            continue
+        if str(cust_key).strip() == "":
+            continue
+
+        # پیدا کردن فاکتورهای این مشتری (از ایندکس ساخته شده در prepare_sales)
+        inv_pos = customer_index.positions(cust_key)
+        if len(inv_pos) == 0:
+            continue
+
+        # مرتب‌سازی فاکتورها (اول نقدی، بعد قدیمی‌ترها) و پرداخت‌ها بر اساس تاریخ
+        inv_pos = inv_pos[np.lexsort((inv_date_ns[inv_pos], inv_rank[inv_pos]))]
+        pay_pos = pay_pos[np.argsort(pay_date_ns[pay_pos], kind="stable")]
+        customers.append((inv_pos, pay_pos, balances_map.get(cust_key, 0.0)))
+        customer_keys.append(cust_key)
+
+    paid = np.zeros(len(sales_df))
+    commission = np.zeros(len(sales_df))
+
+    # نتایج مشتریانی که ورودی‌شان از اجرای قبلی عوض نشده از کش خوانده می‌شود
+    pending = customers
+    if cache is not None and customers:
+        signatures = customer_signatures(customers, arrays)
+        previous = cache.entries
+        pending, reused = [], []
+        for cust_key, c, sig in zip(customer_keys, customers, signatures):
+            entry = previous.get(cust_key)
+            if entry is not None and entry[0] == sig:
+                reused.append((c[0], entry))
+            else:
+                pending.append(c)
+        if reused:
+            inv_all = np.concatenate([r[0] for r in reused])
+            paid[inv_all] = np.concatenate([r[1][1] for r in reused])
+            commission[inv_all] = np.concatenate([r[1][2] for r in reused])
+
+    if pending:
+        n_invoices = sum(len(c[0]) for c in pending)
+        if workers > 1 and n_invoices >= PARALLEL_MIN_INVOICES:
+            shards = _split_into_shards(pending, workers * SHARDS_PER_WORKER)
+            results = _settle_in_pool(shards, arrays, workers)
+            for shard, (shard_paid, shard_commission) in zip(shards, results):
+                inv_all = np.concatenate([c[0] for c in shard])
+                paid[inv_all] = shard_paid
+                commission[inv_all] = shard_commission
+        else:
+            inv_all = np.concatenate([c[0] for c in pending])
+            paid[inv_all], commission[inv_all] = _settle_shard(
+                _pack_shard(pending, arrays))
+
+    if cache is not None:
+        # کش فقط نتایج همین اجرا را نگه می‌دارد (مشتریان حذف شده پاک می‌شوند)
+        cache.entries = {
+            cust_key: (sig, paid[c[0]], commission[c[0]])
+            for cust_key, c, sig in zip(customer_keys, customers, signatures)
+        } if customers else {}
+        cache.last_stats = {
+            "customers": len(customers),
+            "reused": len(customers) - len(pending),
+            "settled": len(pending),
+        }
+
+    sales_df["PaidAmount"] = paid
+    sales_df["Remaining"] = inv_amount - paid
+    sales_df["CommissionAmount"] = commission
@@ -0,0 +1,122 @@
+# app/services/workers.py
+"""
+اجرای کارهای سنگین (خواندن اکسل، محاسبه پورسانت، ساخت خروجی اکسل)
+بیرون از event loop.
+
+هندلرهای async کار همگام (pandas/openpyxl) را با run_blocking به یک استخر
+نخ محدود می‌سپارند و منتظر نتیجه می‌مانند؛ در این مدت سرور به درخواست‌های
+دیگر (مثل /health) جواب می‌دهد. از نخ به جای پروسه استفاده می‌شود چون
+دیتافریم‌ها و وضعیت نشست‌ها در حافظه همین پروسه هستند (تسویه موازی خودش
+استخر پروسه جدا دارد).
+تعداد کارهای همزمان هر نوع هم جدا محدود می‌شود تا مثلاً چند محاسبه
+پورسانت همزمان همه نخ‌ها را اشغال نکنند.
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+# حداکثر نخ‌های استخر مشترک کارهای سنگین
+BLOCKING_WORKERS = min(8, (os.cpu_count() or 1) + 2)
+
+# حداکثر کارهای همزمان هر نوع (بقیه در صف منتظر می‌مانند)
+JOB_LIMITS = {
+    "excel": 4,       # خواندن فایل‌های آپلودی
+    "commission": 2,  # محاسبه پورسانت
+    "export": 2,      # ساخت فایل‌های خروجی
+    "session": 4,     # خواندن داده‌های نشست (ممکن است از کش دیسکی بیاید)
+}
+DEFAULT_JOB_LIMIT = 2
+
+_EXECUTOR = ThreadPoolExecutor(
+    max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+# سمافورهای asyncio به event loop وابسته‌اند: {loop: {نوع: Semaphore}}
+_SEMAPHORES: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+# شمارنده کارهای در حال اجرا / در صف هر نوع
+_STATS_LOCK = threading.Lock()
+_RUNNING: dict[str, int] = {}
+_WAITING: dict[str, int] = {}
+
+
+def _semaphore(kind: str) -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    per_loop = _SEMAPHORES.setdefault(loop, {})
+    if kind not in per_loop:
+        per_loop[kind] = asyncio.Semaphore(JOB_LIMITS.get(kind, DEFAULT_JOB_LIMIT))
+    return per_loop[kind]
+
+
+def _count(counter: dict, kind: str, delta: int) -> None:
+    with _STATS_LOCK:
+        counter[kind] = counter.get(kind, 0) + delta
+
+
+async def run_blocking(kind: str, func, *args, **kwargs):
+    """
+    اجرای func(*args, **kwargs) در استخر نخ‌ها و برگرداندن نتیجه آن.
+    kind نوع کار است (کلیدهای JOB_LIMITS)؛ خطای func همین‌جا دوباره raise می‌شود.
+    """
+    _count(_WAITING, kind, 1)
+    waiting = True
+    try:
+        async with _semaphore(kind):
+            _count(_WAITING, kind, -1)
+            waiting = False
+            _count(_RUNNING, kind, 1)
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    _EXECUTOR, functools.partial(func, *args, **kwargs))
+            finally:
+                _count(_RUNNING, kind, -1)
+    finally:
+        if waiting:
+            # درخواست قبل از شروع کار لغو شد
+            _count(_WAITING, kind, -1)
+
+
+async def iterate_blocking(kind: str, iterable):
+    """
+    نسخه async یک iterator همگام (مثلاً تکه‌های فایل خروجی برای StreamingResponse):
+    هر next در استخر نخ‌ها و با محدودیت همان نوع کار اجرا می‌شود.
+    وقتی مصرف‌کننده زودتر دست بکشد (قطع دانلود)، close() آن iterator صدا زده می‌شود.
+    """
+    iterator = iter(iterable)
+    done = object()
+    try:
+        while True:
+            item = await run_blocking(kind, next, iterator, done)
+            if item is done:
+                return
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            try:
+                close()
+            except ValueError:
+                # generator هنوز در نخ کارگر در حال اجراست؛ بعداً جمع‌آوری می‌شود
+                pass
+
+
+def worker_stats() -> dict:
+    """تعداد کارهای در حال اجرا و منتظر هر نوع."""
+    with _STATS_LOCK:
+        kinds = sorted(set(_RUNNING) | set(_WAITING) | set(JOB_LIMITS))
+        return {
+            "workers": BLOCKING_WORKERS,
+            "jobs": {
+                kind: {
+                    "running": _RUNNING.get(kind, 0),
+                    "waiting": _WAITING.get(kind, 0),
+                    "limit": JOB_LIMITS.get(kind, DEFAULT_JOB_LIMIT),
+                }
+                for kind in kinds
+            },
+        }
@@ -1,7 +1,19 @@
 # app/state.py
+import os
 
-# متغیر سراسری برای نگهداری وضعیت آپلود فایل‌های اصلی (فروش، پرداخت، چک)
-LAST_UPLOAD = {
+from app.services.jobs import JobManager
+from app.services.session_cache import (
+    DEFAULT_SESSION_ID,
+    SessionFrameStore,
+    SessionManager,
+)
+
+# نام کوکی شناسه نشست (در main.py ست می‌شود)
+SESSION_COOKIE = "sales_session"
+
+# مقادیر پیش‌فرض وضعیت آپلود هر نشست: فایل‌های اصلی (فروش، پرداخت، چک)
+# و نتایج محاسبه. دیتافریم‌ها در کش Parquet همان نشست نوشته می‌شوند.
+UPLOAD_DEFAULTS = {
     "sales": None,
     "payments": None,
     "checks": None,
@@ -9,10 +21,45 @@ LAST_UPLOAD = {
     "group_config": None,
     "sales_result": None,
     "payments_result": None,
+    "salesperson_result": None,
+    # تنظیم نمایش نتیجه و شناسه کاری که نتیجه فعلی را ساخته است
+    "result_use_chart": False,
+    "result_job_id": None,
     "history": None,
 }
 
+# هر کاربر (کوکی) وضعیت آپلود جدای خودش را دارد
+SESSIONS = SessionManager(UPLOAD_DEFAULTS)
+
+
+def get_upload(request) -> SessionFrameStore:
+    """وضعیت آپلود نشست درخواست فعلی (جایگزین LAST_UPLOAD سراسری قبلی)."""
+    session_id = getattr(request.state, "session_id", None) if request else None
+    return SESSIONS.get(session_id or DEFAULT_SESSION_ID)
+
+
+# کارهای پس‌زمینه (مثل محاسبه پورسانت) و نتیجه آن‌ها
+JOBS = JobManager()
+
+
+
+def _env_workers(name: str, default: int) -> int:
+    """تعداد کارگر از متغیر محیطی (خالی یا نامعتبر → پیش‌فرض، حداقل ۱)."""
+    value = os.environ.get(name, "").strip()
+    if not value:
+        return default
+    try:
+        return max(1, int(value))
+    except ValueError:
+        print(f"Invalid {name}={value!r}, using {default}")
+        return default
+
+
 # تنظیمات نشست (Session)
 SESSION_SETTINGS = {
-    "reactivation_days": 95
+    "reactivation_days": 95,
+    # تعداد پروسه‌های تسویه موازی در محاسبه پورسانت (۱ = سریالی)؛
+    # با متغیر محیطی SETTLEMENT_WORKERS، پیش‌فرض تعداد هسته‌های CPU.
+    # حالت موازی فقط برای داده‌های بزرگ (PARALLEL_MIN_INVOICES) فعال می‌شود.
+    "settlement_workers": _env_workers("SETTLEMENT_WORKERS", os.cpu_count() or 1)
 }
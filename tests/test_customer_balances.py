@@ -0,0 +1,177 @@
+# tests/test_customer_balances.py
+"""
+مقایسه پارسر ستونی فایل مانده (load_balances_from_excel) با پیاده‌سازی
+پایه (خواندن کل شیت و حلقه روی ردیف‌ها) روی کتاب‌کارهایی با همان چیدمان
+فایل واقعی مانده حساب.
+"""
+import openpyxl
+import pandas as pd
+import pytest
+
+from app.services.customer_balances import load_balances_from_excel, normalize_name
+
+
+def reference_load_balances(file_path_or_buffer) -> list[dict]:
+    """
+    پیاده‌سازی پایه load_balances_from_excel (خواندن کل شیت با
+    pd.read_excel(header=None) و حلقه روی ردیف‌ها)، فقط برای مقایسه.
+    """
+    df_raw = pd.read_excel(file_path_or_buffer, header=None)
+
+    row_sub_header = 5
+
+    def fix_yek(text):
+        if text is None:
+            return ""
+        return str(text).replace("ي", "ی").replace("ك", "ک")
+
+    col_name = None
+    col_code = None
+    col_debit = None
+    col_credit = None
+
+    if len(df_raw) > row_sub_header:
+        for c_idx in range(len(df_raw.columns)):
+            val_sub = fix_yek(df_raw.iloc[row_sub_header, c_idx])
+            if "شرح" in val_sub:
+                col_name = c_idx
+            clean_val = val_sub.strip().lower()
+            if clean_val == "كد" or clean_val == "code":
+                col_code = c_idx
+            if "بدهكار" in val_sub or "بدهکار" in val_sub:
+                col_debit = c_idx
+            elif "بستانكار" in val_sub or "بستانکار" in val_sub:
+                col_credit = c_idx
+
+    if col_code is None and col_name is not None:
+        col_code = col_name - 1
+
+    if col_name is None:
+        return []
+
+    balances_list = []
+    data_start_row = row_sub_header + 1
+
+    for r_idx in range(data_start_row, len(df_raw)):
+        raw_name = df_raw.iloc[r_idx, col_name]
+        norm_name = normalize_name(raw_name)
+
+        if not norm_name or "جمع" in norm_name:
+            continue
+
+        raw_code = ""
+        if col_code is not None:
+            val_code = df_raw.iloc[r_idx, col_code]
+            if pd.notna(val_code):
+                temp_str = str(val_code).strip()
+                if temp_str.endswith(".0"):
+                    raw_code = temp_str[:-2]
+                else:
+                    raw_code = temp_str
+
+        debit_val = 0.0
+        credit_val = 0.0
+
+        if col_debit is not None:
+            d_val = df_raw.iloc[r_idx, col_debit]
+            if pd.notna(d_val):
+                try:
+                    debit_val = float(str(d_val).replace(
+                        ",", "").replace("،", ""))
+                except ValueError:
+                    pass
+
+        if col_credit is not None:
+            c_val = df_raw.iloc[r_idx, col_credit]
+            if pd.notna(c_val):
+                try:
+                    credit_val = float(str(c_val).replace(
+                        ",", "").replace("،", ""))
+                except ValueError:
+                    pass
+
+        balances_list.append({
+            "CustomerCode": raw_code,
+            "CustomerName": norm_name,
+            "OriginalName": str(raw_name).strip(),
+            "Balance": credit_val - debit_val,
+        })
+
+    return balances_list
+
+
+# چیدمان فایل مانده: چند ردیف عنوان، هدر اصلی در ردیف ۵ و زیرهدر در ردیف ۶
+TITLE_ROWS = [
+    ["تراز آزمایشی"],
+    [],
+    [None, "از تاریخ 1403/01/01"],
+    [None, None, "-"],
+    [None, "حساب", None, "گردش", None, "مانده"],
+]
+
+DATA_ROWS = [
+    ["  77 ", "علي رضايي", None, 0, 69000, 1],
+    [301, "شركت الف (اراک)", None, "1,250,000", "", 1],
+    [1002.0, "بانك  ملت", None, None, None, 1],
+    ["1003", "حسن‌زاده\xa0محمد", None, "12،500", 4000.5, 1],
+    [None, None, None, 500, 500, None],
+    [1004, "فروشگاه(مرکزی)", None, "x", "2,000", 1],
+    [1005, "  ", None, 100, None, 1],
+    [1006, "nan", None, 100, None, 1],
+    [None, "جمع صفحه", None, "1,000,000", "2,000,000", None],
+    [1007, "كالا سازان", None, -300, "-1,200.5", 1],
+    [1008, 123456, None, "", 0, 1],
+    [None, "جمع", None, 9999, 9999, None],
+    [1009, "مشتري بدون مانده", None, None, "", None],
+]
+
+
+def _write_workbook(path, sub_header, rows):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for row in TITLE_ROWS:
+        ws.append(row)
+    ws.append(sub_header)
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+    return str(path)
+
+
+@pytest.mark.parametrize("sub_header, rows", [
+    # کد، شرح، بدهکار و بستانکار با حروف عربی/فارسی مختلف
+    (["كد", "شرح", "x", "بدهکار", "بستانكار", "مانده"], DATA_ROWS),
+    # بدون ستون کد: کد ستون قبل از شرح است
+    ([None, "شرح حساب", "x", "بدهكار", "بستانکار", "مانده"], DATA_ROWS),
+    # شرح در ستون اول: کد ستون آخر است
+    (["شرح", "x", "بدهکار", "بستانکار", "مانده", None],
+     [[r[1], r[2], r[3], r[4], r[5], r[0]] for r in DATA_ROWS]),
+    # بدون ستون بستانکار
+    (["كد", "شرح", "x", "بدهکار", None, None], DATA_ROWS),
+])
+def test_matches_row_by_row_parser(tmp_path, sub_header, rows):
+    path = _write_workbook(tmp_path / "balances.xlsx", sub_header, rows)
+
+    expected = reference_load_balances(path)
+    result = load_balances_from_excel(path)
+
+    assert expected, "ردیف مشتری در فایل نمونه پیدا نشد"
+    assert result == expected
+    pd.testing.assert_frame_equal(
+        pd.DataFrame(result), pd.DataFrame(expected), check_exact=True)
+
+
+def test_summary_and_blank_rows_are_skipped(tmp_path):
+    path = _write_workbook(
+        tmp_path / "balances.xlsx",
+        ["كد", "شرح", "x", "بدهکار", "بستانکار", "مانده"], DATA_ROWS)
+
+    result = load_balances_from_excel(path)
+
+    names = [item["CustomerName"] for item in result]
+    assert not any("جمع" in n for n in names)
+    assert "" not in names
+    by_code = {item["CustomerCode"]: item["Balance"] for item in result}
+    assert by_code["301"] == -1250000.0
+    assert by_code["1003"] == 4000.5 - 12500.0
+    assert by_code["1009"] == 0.0
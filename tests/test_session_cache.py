@@ -0,0 +1,60 @@
+# tests/test_session_cache.py
+"""
+فریم‌های نشست باید چه از حافظه و چه بعد از خارج شدن از حافظه (خواندن
+دوباره از Parquet/pickle) با همان نوع ستون‌ها و مقادیر برگردند.
+"""
+import pandas as pd
+import pytest
+
+from app.services.session_cache import SessionFrameStore, arrow_available
+
+
+def _sample_frame() -> pd.DataFrame:
+    n = 60
+    return pd.DataFrame({
+        # کد و نام کم‌تنوع (روی دیسک categorical)
+        "CustomerCode": [str(100 + i % 5) for i in range(n)],
+        "CustomerName": [["علی", "رضا", "مریم"][i % 3] for i in range(n)],
+        # کد مخلوط عدد و متن (object)
+        "InvoiceID": [i if i % 4 else f"A{i}" for i in range(n)],
+        # متن پرتنوع
+        "Description": [f"شرح {i}" for i in range(n)],
+        "InvoiceDate": pd.date_range("2024-03-20", periods=n, freq="D"),
+        "Amount": [float(i) * 1000.5 for i in range(n)],
+        "Count": list(range(n)),
+    }, index=pd.Index(range(10, 10 + n)))
+
+
+@pytest.mark.parametrize("frame", [
+    _sample_frame(),
+    # نام ستون غیر متنی: با pickle ذخیره می‌شود
+    _sample_frame().set_axis(range(7), axis=1),
+], ids=["parquet", "pickle"])
+def test_memory_and_disk_frames_match(tmp_path, frame):
+    if not arrow_available() and isinstance(frame.columns[0], str):
+        pytest.skip("pyarrow نصب نیست")
+    store = SessionFrameStore({"sales": None}, "s1", root=str(tmp_path))
+    store["sales"] = frame
+
+    in_memory = store["sales"]
+    assert store.release_memory() > 0
+    from_disk = store["sales"]
+
+    assert from_disk is not in_memory
+    pd.testing.assert_series_equal(in_memory.dtypes, from_disk.dtypes)
+    pd.testing.assert_frame_equal(in_memory, from_disk, check_exact=True)
+
+    # مقادیر همان فریم اصلی است (فقط نوع ستون‌های کد/نام ممکن است categorical شود)
+    pd.testing.assert_frame_equal(
+        from_disk.astype(object), frame.astype(object), check_exact=True,
+        check_dtype=False, check_index_type=False)
+
+
+def test_store_from_other_process_sees_same_dtypes(tmp_path):
+    frame = _sample_frame()
+    writer = SessionFrameStore({"sales": None}, "s1", root=str(tmp_path))
+    writer["sales"] = frame
+    reader = SessionFrameStore({"sales": None}, "s1", root=str(tmp_path))
+
+    pd.testing.assert_series_equal(writer["sales"].dtypes, reader["sales"].dtypes)
+    pd.testing.assert_frame_equal(writer["sales"], reader["sales"], check_exact=True)